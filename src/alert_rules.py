@@ -0,0 +1,104 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Generate the Prometheus alert rules for the services of the cloud.
+
+The rule files in src/prometheus_alert_rules are templates. The files alerting on a single
+OpenStack service are only generated if the exporter reports that service, and the
+openstack:service_up rollup selects the up series of exactly the reported services, so
+Prometheus does not evaluate rules for services that are not deployed, and alerts on every
+service that is. The evaluation interval of the project capacity rollups is set from the charm
+config.
+"""
+
+import re
+import shutil
+from logging import getLogger
+from pathlib import Path
+from typing import Collection, Optional
+
+from generated import write_files
+
+logger = getLogger(__name__)
+
+RULE_TEMPLATES_DIR = Path(__file__).parent / "prometheus_alert_rules"
+RULES_DIR = Path("/var/lib/openstack-exporter-charm-rules")
+# Rule files of a single service, named as in its openstack_<service>_up series. The other
+# templates are always generated.
+SERVICE_RULE_FILES = {
+    "cinder_rules.yaml": "cinder",
+    "neutron_rules.yaml": "neutron",
+    "nova_compute.yaml": "nova",
+    "octavia_rules.yaml": "loadbalancer",
+}
+# A term of the openstack:service_up rollup, one per line of the template
+ROLLUP_TERM_PATTERN = re.compile(r"^(?P<indent> *)(?:or )?label_replace\(openstack_\w+_up\b")
+# The term of a service in the rollup, also for services the template does not know
+ROLLUP_TERM = 'label_replace(openstack_{service}_up, "service", "{service}", "", "")\n'
+# The evaluation interval of the project capacity rollups, set from the charm config
+INTERVAL_PATTERN = re.compile(
+    r"^(?P<key>- name: \w+ProjectCapacity\n +interval: ).*$", re.MULTILINE
+)
+
+
+def _render_rollup(template: str, services: Collection[str]) -> str:
+    """Select the up series of the given services in the rollup.
+
+    The terms of the template, which cover the services the exporter can query, are kept if
+    there are no services.
+    """
+    lines = template.splitlines(keepends=True)
+    terms = {
+        index: match
+        for index, line in enumerate(lines)
+        if (match := ROLLUP_TERM_PATTERN.match(line))
+    }
+    if not terms or not services:
+        return template
+
+    first = min(terms)
+    rendered = [
+        f"{terms[first]['indent']}{'or ' if index else ''}{ROLLUP_TERM.format(service=service)}"
+        for index, service in enumerate(sorted(services))
+    ]
+    lines = [line for index, line in enumerate(lines) if index not in terms]
+    lines[first:first] = rendered
+    return "".join(lines)
+
+
+def render_rules(
+    services: Optional[Collection[str]], interval: Optional[str] = None
+) -> dict[str, str]:
+    """Return the content of the rule files for the services, by file name.
+
+    If the services are not known yet (None), all the rules are rendered. The capacity rollups
+    are evaluated at the given interval, or at the one of the templates if None.
+    """
+    rules = {}
+    for template in sorted(RULE_TEMPLATES_DIR.glob("*.yaml")):
+        service = SERVICE_RULE_FILES.get(template.name)
+        content = template.read_text()
+        if interval is not None:
+            content = INTERVAL_PATTERN.sub(lambda match: f"{match['key']}{interval}", content)
+        if services is None:
+            rules[template.name] = content
+        elif service is None:
+            rules[template.name] = _render_rollup(content, services)
+        elif service in services:
+            rules[template.name] = content
+    return rules
+
+
+def write_rules(services: Optional[Collection[str]], interval: Optional[str] = None) -> bool:
+    """Write the rule files for the services, removing the others.
+
+    Return True if any file was changed.
+    """
+    changed = write_files(RULES_DIR, render_rules(services, interval))
+    if changed:
+        logger.info("Generated the alert rules for services: %s", services or "all")
+    return changed
+
+
+def remove_rules() -> None:
+    """Remove the generated rule files."""
+    shutil.rmtree(RULES_DIR, ignore_errors=True)
@@ -8,19 +8,77 @@ This charm provides charmed-openstack-exporter snap as part of the Charmed
 OpenStack deployment.
 """
 
+import hashlib
+import http.client
+import importlib
+import json
 import logging
 import os
+import time
 from pathlib import Path
-from typing import Any, Callable, Optional, cast
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Callable, Optional, cast
 
 import ops
 import yaml
-from charms.grafana_agent.v0.cos_agent import COSAgentProvider
 from charms.operator_libs_linux.v2 import snap
 from ops.model import ActiveStatus, BlockedStatus, ModelError, WaitingStatus
 
-from service import SNAP_NAME, UPSTREAM_SNAP, get_installed_snap_service, snap_install_or_refresh
-from validate_config import validate_cache_ttl, validate_port
+from alert_rules import RULE_TEMPLATES_DIR, RULES_DIR, remove_rules, write_rules
+from dashboards import (
+    DASHBOARD_TEMPLATES_DIR,
+    DASHBOARDS_DIR,
+    remove_dashboards,
+    write_dashboards,
+)
+from generated import stat_digest
+from health import assess
+from instrumentation import (
+    METRICS_PATH,
+    DispatchRecorder,
+    ensure_metrics_server,
+    remove_metrics_server,
+    render_metrics,
+    write_metrics,
+)
+from service import (
+    SNAP_NAME,
+    UPSTREAM_SNAP,
+    SnapService,
+    cancel_scheduled_restart,
+    exporter_serving,
+    get_installed_snap_service,
+    refresh_pending,
+    refresh_required,
+    render_drop_in,
+    schedule_restart,
+    snap_install_or_refresh,
+    wait_exporter_serving,
+    write_drop_in,
+)
+from validate_config import (
+    parse_api_microversions,
+    parse_refresh_window,
+    validate_api_microversions,
+    validate_cache_ttl,
+    validate_capacity_rules_interval,
+    validate_cpu_quota,
+    validate_gomaxprocs,
+    validate_gomemlimit,
+    validate_io_scheduling_class,
+    validate_memory_high,
+    validate_nice,
+    validate_port,
+    validate_probe_empty_threshold,
+    validate_probe_latency_threshold,
+    validate_probe_timeout,
+    validate_refresh_window,
+    validate_restart_window,
+    validate_snap_revision,
+)
+
+if TYPE_CHECKING:
+    from cos_agent_provider import CachedCOSAgentProvider
 
 logger = logging.getLogger(__name__)
 
@@ -33,22 +91,92 @@ CLOUD_NAME = "openstack"
 # unversioned, and retained across updates of the snap.
 OS_CLIENT_CONFIG = Path(f"/var/snap/{SNAP_NAME}/common/clouds.yaml")
 OS_CLIENT_CONFIG_CACERT = Path(f"/var/snap/{SNAP_NAME}/common/cacert.pem")
+# Peer relation used to refresh the snap one unit at a time
+PEER_RELATION = "cluster"
+# Application data: name of the unit allowed to refresh the snap, handed out by the leader
+REFRESH_TOKEN = "refresh-token"
+# Unit data: "requested" while waiting for the token, "refreshed" while warming up with it
+REFRESH_STATE = "refresh-state"
+# Unit data: time by which the refreshed exporter must serve metrics, after which the leader
+# hands the token to the next unit, so that a broken unit cannot hold the others back forever
+REFRESH_DEADLINE = "refresh-deadline"
+REFRESH_WARMUP_TIMEOUT = 1800
+# Number of update-status probes of the exporter kept to assess its health
+PROBE_HISTORY_SIZE = 6
+# Maximum time the benchmark-scrape action waits for the exporter after switching the cache
+BENCHMARK_WARMUP_TIMEOUT = 300
+# Hooks that only need to evaluate the unit status. The cos_agent library (and with it pydantic,
+# cosl and the alert rules machinery) is not loaded for these, since nothing in them touches the
+# cos-agent relation data.
+FAST_PATH_HOOKS = frozenset({"update-status"})
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Import a module on first use, logging how long the import took."""
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    logger.debug("imported %s in %.3fs", name, time.perf_counter() - start)
+    return module
+
+
+def file_digest(path: str) -> str:
+    """Return the sha256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def value_digest(value: Any) -> str:
+    """Return the sha256 hex digest of a json serializable value."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+class GrafanaAgentFilesChangedEvent(ops.EventBase):
+    """Emitted when the generated alert rules or dashboards change, to send them again."""
+
+
+class OpenstackExporterCharmEvents(ops.CharmEvents):
+    """Events of the charm."""
+
+    grafana_agent_files_changed = ops.EventSource(GrafanaAgentFilesChangedEvent)
 
 
 class OpenstackExporterOperatorCharm(ops.CharmBase):
     """Charm the service."""
 
+    on = OpenstackExporterCharmEvents()
+    _stored = ops.StoredState()
+
     def __init__(self, *args: Any) -> None:
         """Initialize the charm."""
         super().__init__(*args)
-
-        self._grafana_agent = COSAgentProvider(
-            self,
-            metrics_endpoints=[
-                {"path": "/metrics", "port": self.config["port"]},
-            ],
+        self._recorder = DispatchRecorder.start()
+        self._stored.set_default(
+            resource_fetched=False,
+            resource_path="",
+            resource_size=0,
+            resource_digest="",
+            installed_resource_digest="",
+            installed_cohort="",
+            hook_metrics={},
+            applied_config={},
+            applied_credentials="",
+            applied_revision="",
+            last_restart=0.0,
+            refresh_held=False,
+            refresh_pending=False,
+            probe_history=[],
+            reported_services=None,
+            grafana_agent_files_digest="",
         )
 
+        self._grafana_agent: Optional["CachedCOSAgentProvider"] = None
+        if os.environ.get("JUJU_HOOK_NAME") not in FAST_PATH_HOOKS:
+            self._write_grafana_agent_files()
+            self._grafana_agent = self._setup_cos_agent()
+
         self.framework.observe(self.on.install, self._on_install)
         self.framework.observe(self.on.upgrade_charm, self._on_upgrade)
         self.framework.observe(self.on.config_changed, self._configure)
@@ -57,6 +185,81 @@ class OpenstackExporterOperatorCharm(ops.CharmBase):
         self.framework.observe(self.on.credentials_relation_broken, self._configure)
         self.framework.observe(self.on.cos_agent_relation_changed, self._configure)
         self.framework.observe(self.on.cos_agent_relation_broken, self._configure)
+        self.framework.observe(self.on.update_status, self._on_update_status)
+        self.framework.observe(self.on[PEER_RELATION].relation_changed, self._on_peers_changed)
+        self.framework.observe(self.on[PEER_RELATION].relation_departed, self._on_peers_changed)
+        self.framework.observe(self.on.leader_elected, self._on_leader_elected)
+        self.framework.observe(self.on.remove, self._on_remove)
+        self.framework.observe(self.on.benchmark_scrape_action, self._on_benchmark_scrape)
+        self.framework.observe(self.on.cardinality_report_action, self._on_cardinality_report)
+        # pre_commit runs after collect-status, and stored state is still saved after it.
+        self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
+
+    def _setup_cos_agent(self) -> "CachedCOSAgentProvider":
+        """Load the cos_agent library and instantiate the provider."""
+        cos_agent_provider = lazy_import("cos_agent_provider")
+        return cos_agent_provider.CachedCOSAgentProvider(
+            self,
+            metrics_endpoints=[
+                {"path": "/metrics", "port": self.config["port"]},
+                {"path": METRICS_PATH, "port": self.config["charm_metrics_port"]},
+            ],
+            metrics_rules_dir=str(RULES_DIR),
+            dashboard_dirs=[str(DASHBOARDS_DIR)],
+            refresh_events=[self.on.config_changed, self.on.grafana_agent_files_changed],
+        )
+
+    def _reported_services(self) -> Optional[list[str]]:
+        """Return the services reported by the exporter, or None if not known yet."""
+        services = cast(Optional[list[str]], self._stored.reported_services)
+        return None if services is None else list(services)
+
+    def _capacity_rules_interval(self) -> Optional[str]:
+        """Return the configured interval of the capacity rollups, None if invalid."""
+        interval = cast(str, self.config["capacity_rules_interval"])
+        return None if validate_capacity_rules_interval(interval) else interval
+
+    def _grafana_agent_files_digest(self) -> str:
+        """Return a digest of the reported services, the templates and the generated files."""
+        directories = (RULE_TEMPLATES_DIR, DASHBOARD_TEMPLATES_DIR, RULES_DIR, DASHBOARDS_DIR)
+        return value_digest([
+            self._reported_services(),
+            self._capacity_rules_interval(),
+            stat_digest(*directories),
+        ])
+
+    def _write_grafana_agent_files(self) -> bool:
+        """Generate the alert rules and dashboards, return True if any of them changed.
+
+        Nothing is rendered again unless the reported services, the capacity rules interval,
+        the templates (e.g. after a charm upgrade) or the generated files changed since the last
+        time.
+        """
+        if self._grafana_agent_files_digest() == cast(
+            str, self._stored.grafana_agent_files_digest
+        ):
+            return False
+        services = self._reported_services()
+        # both are always written, to keep them in sync with the reported services
+        rules_changed = write_rules(services, self._capacity_rules_interval())
+        changed = write_dashboards(services) or rules_changed
+        self._stored.grafana_agent_files_digest = self._grafana_agent_files_digest()
+        return changed
+
+    def _update_reported_services(self, services: list[str]) -> None:
+        """Regenerate the alert rules and dashboards when the reported services change.
+
+        They are then sent to grafana-agent, so only the relevant rules are evaluated and only
+        the relevant panels rendered.
+        """
+        if services == self._reported_services():
+            return
+        self._stored.reported_services = services
+        if not self._write_grafana_agent_files():
+            return
+        if self._grafana_agent is None:
+            self._grafana_agent = self._setup_cos_agent()
+        self.on.grafana_agent_files_changed.emit()
 
     def _is_keystone_data_ready(self, data: dict[str, str]) -> bool:
         """Check if all the data is available from keystone.
@@ -128,24 +331,55 @@ class OpenstackExporterOperatorCharm(ops.CharmBase):
                     return data
         return {}
 
-    def get_resource(self) -> Optional[str]:
+    def get_resource(self, refresh: bool = False) -> Optional[str]:
         """Return the path-to-resource or None if the resource is empty.
 
-        Fetch the charm's resource and check if the resource is an empty file
-        or not. If it's empty, return None. Otherwise, return the path to the
+        The charm's resource is fetched from the controller only once, and its path, size and
+        digest are remembered in stored state, or the absence of a resource if none is attached.
+        Later calls reuse the cached values as long as the file is still on disk with the same
+        size, unless `refresh` is set (e.g. on upgrade-charm, which juju also emits when a new
+        resource revision is attached).
+
+        If the resource is an empty file, return None. Otherwise, return the path to the
         resource.
         """
+        if refresh or not self._resource_cached():
+            self._fetch_resource()
+
+        if cast(int, self._stored.resource_size) <= 0:
+            logger.debug("resource is an empty file")
+            return None
+
+        return cast(str, self._stored.resource_path)
+
+    def _resource_cached(self) -> bool:
+        """Return True if the resource in stored state is still valid on disk, or is absent."""
+        if not cast(bool, self._stored.resource_fetched):
+            return False
+        path = cast(str, self._stored.resource_path)
+        if not path:
+            return True
+        try:
+            return os.path.getsize(path) == self._stored.resource_size
+        except OSError:
+            return False
+
+    def _fetch_resource(self) -> None:
+        """Fetch the charm's resource and remember its path, size and digest."""
+        self._stored.resource_fetched = True
         try:
             snap_path = self.model.resources.fetch(RESOURCE_NAME).absolute()
         except ModelError:
             logger.debug("cannot fetch charm resource")
-            return None
-
-        if os.path.getsize(snap_path) <= 0:
-            logger.debug("resource is an empty file")
-            return None
+            self._stored.resource_path = ""
+            self._stored.resource_size = 0
+            self._stored.resource_digest = ""
+            return
 
-        return str(snap_path)
+        size = os.path.getsize(snap_path)
+        self._stored.resource_path = str(snap_path)
+        self._stored.resource_size = size
+        self._stored.resource_digest = file_digest(str(snap_path)) if size > 0 else ""
 
     def validate_configs(self) -> Optional[str]:
         """Validate the charm config options.
@@ -155,7 +389,22 @@ class OpenstackExporterOperatorCharm(ops.CharmBase):
         """
         validators: list[tuple[Callable, str]] = [
             (validate_port, "port"),
+            (validate_port, "charm_metrics_port"),
             (validate_cache_ttl, "cache_ttl"),
+            (validate_restart_window, "restart_window"),
+            (validate_gomaxprocs, "gomaxprocs"),
+            (validate_gomemlimit, "gomemlimit"),
+            (validate_cpu_quota, "cpu_quota"),
+            (validate_memory_high, "memory_high"),
+            (validate_nice, "nice"),
+            (validate_io_scheduling_class, "io_scheduling_class"),
+            (validate_api_microversions, "api_microversions"),
+            (validate_snap_revision, "snap_revision"),
+            (validate_refresh_window, "snap_refresh_window"),
+            (validate_probe_timeout, "probe_timeout"),
+            (validate_probe_latency_threshold, "probe_latency_threshold"),
+            (validate_probe_empty_threshold, "probe_empty_threshold"),
+            (validate_capacity_rules_interval, "capacity_rules_interval"),
         ]
         for validator, config_key in validators:
             if error := validator(self.model.config[config_key]):
@@ -169,7 +418,189 @@ class OpenstackExporterOperatorCharm(ops.CharmBase):
         # If this fails, it's not recoverable.
         # So we don't catch the error, instead letting this become a charm error status.
         # Errored hooks are auto-retried by juju, so the install may work on retry.
-        snap_install_or_refresh(self.get_resource(), str(self.model.config["snap_channel"]))
+        resource = self.get_resource()
+        digest = self._stored.resource_digest if resource else ""
+        held = self._refresh_held()
+        cohort = str(self.model.config["snap_cohort"])
+        # snapd refreshes the snap within its channel on its own, unless held: then the charm
+        # applies a pending refresh inside the refresh window. Joining a cohort needs a refresh.
+        refresh = (
+            held and cast(bool, self._stored.refresh_pending) and self._in_refresh_window()
+        ) or cohort != self._stored.installed_cohort
+        if resource or self._may_refresh():
+            snap_install_or_refresh(
+                resource,
+                str(self.model.config["snap_channel"]),
+                resource_installed=(
+                    bool(digest) and digest == self._stored.installed_resource_digest
+                ),
+                revision=str(self.model.config["snap_revision"]),
+                cohort=cohort,
+                refresh=refresh,
+            )
+            self._stored.installed_resource_digest = digest
+            self._stored.installed_cohort = cohort
+            if refresh:
+                self._stored.refresh_pending = False
+            if self._refresh_token() == self.unit.name:
+                self._set_refresh_state("refreshed")
+        else:
+            logger.info("Waiting for the refresh token to refresh %s", SNAP_NAME)
+
+        if resource:
+            # a snap installed from a file is never refreshed by snapd
+            self._stored.refresh_held = False
+        elif held != self._stored.refresh_held:
+            get_installed_snap_service(SNAP_NAME).hold_refresh(held)
+            self._stored.refresh_held = held
+        ensure_metrics_server(int(self.model.config["charm_metrics_port"]))
+
+    def _may_refresh(self) -> bool:
+        """Return True if the snap from the store can be installed or refreshed now.
+
+        Moving the snap to another channel or revision restarts the exporter, so the units take
+        turns: the leader hands out a refresh token to one unit at a time, which keeps it until
+        its exporter serves metrics again.
+        """
+        peers = self.model.get_relation(PEER_RELATION)
+        # a unit alone in the application has nobody to take turns with
+        if (
+            peers is None
+            or not peers.units
+            or not refresh_required(
+                str(self.model.config["snap_channel"]), str(self.model.config["snap_revision"])
+            )
+        ):
+            return True
+        if not peers.data[self.unit].get(REFRESH_STATE):
+            self._set_refresh_state("requested")
+        if self.unit.is_leader():
+            self._grant_refresh_token()
+        return self._refresh_token() == self.unit.name
+
+    def _refresh_token(self) -> str:
+        """Return the name of the unit holding the refresh token, if any."""
+        peers = self.model.get_relation(PEER_RELATION)
+        return peers.data[self.app].get(REFRESH_TOKEN, "") if peers else ""
+
+    def _set_refresh_state(self, state: str) -> None:
+        """Publish the refresh state of this unit, an empty state is removed.
+
+        The warm-up deadline is set along with the "refreshed" state, and removed otherwise.
+        """
+        peers = self.model.get_relation(PEER_RELATION)
+        if peers is not None:
+            peers.data[self.unit][REFRESH_STATE] = state
+            peers.data[self.unit][REFRESH_DEADLINE] = (
+                str(int(time.time()) + REFRESH_WARMUP_TIMEOUT) if state == "refreshed" else ""
+            )
+
+    def _warmup_expired(self, data: ops.RelationDataContent) -> bool:
+        """Return True if the unit of this data is past its warm-up deadline."""
+        deadline = data.get(REFRESH_DEADLINE, "")
+        return (
+            data.get(REFRESH_STATE) == "refreshed"
+            and bool(deadline)
+            and time.time() > float(deadline)
+        )
+
+    def _grant_refresh_token(self) -> None:
+        """Hand the refresh token to the next unit waiting for it, once released (leader only)."""
+        peers = self.model.get_relation(PEER_RELATION)
+        if peers is None:
+            return
+        units = {unit.name: peers.data[unit] for unit in (self.unit, *peers.units)}
+        states = {name: data.get(REFRESH_STATE) for name, data in units.items()}
+        token = self._refresh_token()
+        if states.get(token):
+            if not self._warmup_expired(units[token]):
+                return
+            logger.warning(
+                "%s does not serve metrics %ds after its refresh, handing the token over",
+                token,
+                REFRESH_WARMUP_TIMEOUT,
+            )
+            states[token] = None
+        waiting = sorted(name for name, state in states.items() if state == "requested")
+        next_token = waiting[0] if waiting else ""
+        if next_token != token:
+            logger.info("Handing the refresh token to %s", next_token or "nobody")
+            peers.data[self.app][REFRESH_TOKEN] = next_token
+
+    def _release_refresh_token(self, stopped: bool = False) -> None:
+        """Release the refresh token once the refreshed exporter serves metrics again.
+
+        The token is also released if the exporter is `stopped` on purpose or the charm is not
+        configured, as the exporter would not serve metrics then, or past the warm-up deadline.
+        """
+        peers = self.model.get_relation(PEER_RELATION)
+        if peers is None:
+            return
+        state = peers.data[self.unit].get(REFRESH_STATE)
+        if stopped and state and self._refresh_token() == self.unit.name:
+            logger.info("Releasing the refresh token, the exporter is not running")
+        elif state != "refreshed":
+            return
+        elif self._warmup_expired(peers.data[self.unit]):
+            logger.warning("Releasing the refresh token, the exporter does not serve metrics")
+        elif not exporter_serving(int(self.model.config["port"])):
+            logger.info("Keeping the refresh token until the exporter serves metrics")
+            return
+        else:
+            logger.info("Releasing the refresh token")
+        self._set_refresh_state("")
+        if self.unit.is_leader():
+            self._grant_refresh_token()
+
+    def _refresh_held(self) -> bool:
+        """Return True if snapd must not refresh the exporter snap on its own schedule.
+
+        The refreshes are then only done by the charm: to the pinned revision, on a change of
+        channel, or inside the refresh window.
+        """
+        config = self.model.config
+        return bool(
+            config["snap_hold_refresh"] or config["snap_revision"] or config["snap_refresh_window"]
+        )
+
+    def _in_refresh_window(self) -> bool:
+        """Return True if the current time is inside the snap refresh window."""
+        window = str(self.model.config["snap_refresh_window"])
+        if not window or validate_refresh_window(window):
+            return False
+        start, end = parse_refresh_window(window)
+        now = time.gmtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        if start < end:
+            return start <= minute < end
+        # the window spans midnight
+        return minute >= start or minute < end
+
+    def _service_drop_in(self) -> str:
+        """Render the systemd drop-in of the exporter service from the charm config."""
+        config = self.model.config
+        # e.g. OS_COMPUTE_API_VERSION, read by the exporter for the API of each service
+        environment = {
+            f"OS_{service.upper().replace('-', '_')}_API_VERSION": version
+            for service, version in parse_api_microversions(
+                str(config["api_microversions"])
+            ).items()
+        }
+        if config["gomaxprocs"]:
+            environment["GOMAXPROCS"] = str(config["gomaxprocs"])
+        if config["gomemlimit"]:
+            environment["GOMEMLIMIT"] = str(config["gomemlimit"])
+
+        directives = {}
+        if config["cpu_quota"]:
+            directives["CPUQuota"] = str(config["cpu_quota"])
+        if config["memory_high"]:
+            directives["MemoryHigh"] = str(config["memory_high"])
+        if config["nice"]:
+            directives["Nice"] = str(config["nice"])
+        if config["io_scheduling_class"]:
+            directives["IOSchedulingClass"] = str(config["io_scheduling_class"])
+        return render_drop_in(environment, directives)
 
     def _configure(self, _: ops.HookEvent) -> None:
         """Configure the charm.
@@ -180,9 +611,12 @@ class OpenstackExporterOperatorCharm(ops.CharmBase):
         """
         if config_error := self.validate_configs():
             logger.error(config_error)
+            self._release_refresh_token(stopped=True)
             return
 
         self.install()
+        drop_in = self._service_drop_in()
+        drop_in_changed = write_drop_in(drop_in)
 
         if self._upstream_snap_present():
             return
@@ -190,26 +624,103 @@ class OpenstackExporterOperatorCharm(ops.CharmBase):
         snap_service = get_installed_snap_service(SNAP_NAME)
         # if cos is not related then we should block and not run anything
         if not self.model.relations.get("cos-agent"):
-            snap_service.stop()
+            self._stop(snap_service, cause="cos-agent not related")
             return
 
-        snap_service.configure({
+        snap_config = {
             "cloud": CLOUD_NAME,
             "os-client-config": str(OS_CLIENT_CONFIG),
             "web": {"listen-address": f":{self.model.config['port']}"},
             "cache": self.model.config["cache"],
             "cache-ttl": self.model.config["cache_ttl"],
-        })
+        }
+        snap_service.configure(snap_config)
 
         data = self._get_keystone_data()
         if not data:
             logger.info("Keystone credentials are not available, stopping services.")
-            snap_service.stop()
+            self._stop(snap_service, cause="credentials not available")
             return
 
         logger.info("Keystone credentials are available, starting services.")
         self._write_cloud_config(data)
-        snap_service.restart_and_enable()
+        cause = self._restart_cause(snap_config, drop_in, data, str(snap_service.revision))
+        if cause == "no-change":
+            if drop_in_changed:
+                # the legacy drop-in was removed
+                cause = "config:drop-in"
+            elif snap_service.is_active():
+                logger.debug("Nothing changed, not restarting the exporter")
+                return
+            else:
+                cause = "inactive"
+        self._restart(snap_service, cause)
+
+    def _restart(self, snap_service: SnapService, cause: str) -> None:
+        """Restart the exporter, at most once per restart window.
+
+        Bursts of events (e.g. keystone settling or rotating its password) would otherwise
+        restart the exporter and wipe its cache each time. A restart requested less than
+        `restart_window` seconds after the previous one is coalesced into a single restart
+        scheduled at the end of the window, which applies the latest state.
+        """
+        window = int(self.model.config["restart_window"])
+        now = time.time()
+        last_restart = cast(float, self._stored.last_restart)
+        if window and now < last_restart + window:
+            if last_restart > now:
+                logger.info(
+                    "Coalescing restart (%s) into the one scheduled in %.0fs",
+                    cause,
+                    last_restart - now,
+                )
+                return
+            last_restart += window
+            schedule_restart(last_restart - now, cause=cause)
+            self._stored.last_restart = last_restart
+            return
+
+        snap_service.restart_and_enable(cause=cause)
+        self._stored.last_restart = now
+        self._recorder.restarted = True
+
+    def _stop(self, snap_service: SnapService, cause: str) -> None:
+        """Stop the exporter, dropping any restart scheduled by the restart window."""
+        if cast(float, self._stored.last_restart) > time.time():
+            cancel_scheduled_restart()
+        self._stored.last_restart = 0.0
+        snap_service.stop(cause=cause)
+        self._release_refresh_token(stopped=True)
+
+    def _restart_cause(
+        self, snap_config: dict[str, Any], drop_in: str, data: dict[str, str], revision: str
+    ) -> str:
+        """Return why the exporter is restarted, and remember the state being applied.
+
+        The cause lists the changed config keys, drop-in, a credentials rotation and a snap
+        refresh compared to the state applied by the previous restart.
+        """
+        applied = {
+            key: value_digest(value)
+            for key, value in {
+                **snap_config,
+                "ssl_ca": self.model.config["ssl_ca"],
+                "drop-in": drop_in,
+            }.items()
+        }
+        credentials = value_digest(data)
+        previous = cast(dict[str, str], self._stored.applied_config)
+
+        causes = [f"config:{key}" for key in sorted(applied) if applied[key] != previous.get(key)]
+        if credentials != self._stored.applied_credentials:
+            causes.append("credentials")
+        if revision != self._stored.applied_revision:
+            causes.append("snap-refresh")
+
+        self._stored.applied_config = applied
+        self._stored.applied_credentials = credentials
+        self._stored.applied_revision = revision
+        return ", ".join(causes) or "no-change"
 
     def _on_install(self, _: ops.InstallEvent) -> None:
         """Handle install charm event."""
@@ -217,8 +728,141 @@ class OpenstackExporterOperatorCharm(ops.CharmBase):
 
     def _on_upgrade(self, _: ops.UpgradeCharmEvent) -> None:
         """Handle upgrade charm event."""
+        # upgrade-charm is also emitted when a new resource revision is attached,
+        # so this is where the cached resource must be fetched again.
+        self.get_resource(refresh=True)
         self.install()
 
+    def _on_peers_changed(self, event: ops.RelationEvent) -> None:
+        """Take part in the rolling refresh of the snap."""
+        if self.unit.is_leader():
+            self._grant_refresh_token()
+        if (
+            self._refresh_token() == self.unit.name
+            and event.relation.data[self.unit].get(REFRESH_STATE) == "requested"
+        ):
+            logger.info("Refresh token received, refreshing %s", SNAP_NAME)
+            self._configure(event)
+        self._release_refresh_token()
+
+    def _probe_exporter(self) -> None:
+        """Scrape the running exporter and keep the result in a rolling window."""
+        snap_service = get_installed_snap_service(SNAP_NAME)
+        if self.validate_configs() or not snap_service.present or not snap_service.is_active():
+            self._stored.probe_history = []
+            return
+        scrape = lazy_import("scrape")
+        result = scrape.probe(
+            int(self.model.config["port"]), int(self.model.config["probe_timeout"])
+        )
+        logger.debug("exporter probe: %s", result)
+        history = [*cast(list[dict[str, Any]], self._stored.probe_history), result]
+        self._stored.probe_history = history[-PROBE_HISTORY_SIZE:]
+        # a scrape cut off by the timeout only has the up series of the first services, in the
+        # alphabetical order of the metric families, which would drop the files of the others
+        if result["up"] and not result["error"]:
+            self._update_reported_services(sorted(result["up"]))
+
+    def _probe_status(self) -> Optional[BlockedStatus]:
+        """Return a blocked status if the recent probes show a degraded exporter."""
+        reason = assess(
+            cast(list[dict[str, Any]], self._stored.probe_history),
+            float(self.model.config["probe_latency_threshold"]),
+            int(self.model.config["probe_empty_threshold"]),
+        )
+        return BlockedStatus(f"Exporter degraded: {reason}") if reason else None
+
+    def _on_leader_elected(self, _: ops.LeaderElectedEvent) -> None:
+        """Take over the refresh token handling."""
+        self._grant_refresh_token()
+
+    def _on_update_status(self, event: ops.UpdateStatusEvent) -> None:
+        """Check for a held snap refresh, and apply it inside the refresh window."""
+        self._release_refresh_token()
+        if self.unit.is_leader():
+            self._grant_refresh_token()
+        self._probe_exporter()
+
+        if not self._refresh_held() or self.model.config["snap_revision"] or self.get_resource():
+            self._stored.refresh_pending = False
+            return
+
+        self._stored.refresh_pending = refresh_pending(SNAP_NAME)
+        if self._stored.refresh_pending and self._in_refresh_window():
+            logger.info("Applying the pending %s refresh in the refresh window", SNAP_NAME)
+            self._configure(event)
+
+    def _on_remove(self, _: ops.RemoveEvent) -> None:
+        """Handle remove charm event."""
+        remove_metrics_server()
+        remove_rules()
+        remove_dashboards()
+
+    def _on_benchmark_scrape(self, event: ops.ActionEvent) -> None:
+        """Benchmark the exporter endpoint under concurrent scrapes.
+
+        With compare-cache, the benchmark is run again with the exporter cache switched, and the
+        configured cache setting is restored afterwards.
+        """
+        snap_service = get_installed_snap_service(SNAP_NAME)
+        if not snap_service.present or not snap_service.is_active():
+            event.fail(f"{SNAP_NAME} snap service is not active")
+            return
+
+        cache = bool(self.model.config["cache"])
+        modes = [cache, not cache] if event.params["compare-cache"] else [cache]
+        results = {}
+        try:
+            for enabled in modes:
+                mode = f"cache-{'on' if enabled else 'off'}"
+                if enabled != cache:
+                    self._switch_cache(snap_service, enabled, event)
+                event.log(f"Benchmarking the exporter with {mode}")
+                results[mode] = lazy_import("scrape").benchmark(
+                    int(self.model.config["port"]),
+                    int(event.params["concurrency"]),
+                    float(event.params["duration"]),
+                    float(self.model.config["probe_timeout"]),
+                )
+        finally:
+            if len(modes) > 1:
+                self._switch_cache(snap_service, cache, event)
+        event.set_results(results)
+
+    def _switch_cache(
+        self, snap_service: SnapService, enabled: bool, event: ops.ActionEvent
+    ) -> None:
+        """Restart the exporter with the cache enabled or not, and wait for it to serve metrics."""
+        event.log(f"Restarting the exporter with the cache {'enabled' if enabled else 'disabled'}")
+        snap_service.configure({"cache": enabled})
+        snap_service.restart_and_enable(cause="benchmark-scrape")
+        self._recorder.restarted = True
+        if not wait_exporter_serving(int(self.model.config["port"]), BENCHMARK_WARMUP_TIMEOUT):
+            event.log(f"The exporter serves no metrics after {BENCHMARK_WARMUP_TIMEOUT}s")
+
+    def _on_cardinality_report(self, event: ops.ActionEvent) -> None:
+        """Report the metric families and the labels with the most series."""
+        try:
+            results = lazy_import("scrape").cardinality(
+                int(self.model.config["port"]),
+                float(self.model.config["probe_timeout"]),
+                int(event.params["top"]),
+            )
+        except (OSError, ValueError, http.client.HTTPException) as err:
+            event.fail(f"Failed to scrape the exporter: {str(err) or type(err).__name__}")
+            return
+        event.set_results(results)
+
+    def _on_pre_commit(self, _: ops.PreCommitEvent) -> None:
+        """Record the cost of this dispatch and publish the charm metrics."""
+        hook = self._recorder.hook
+        hook_metrics = cast(dict[str, dict[str, float]], self._stored.hook_metrics)
+        hook_metrics[hook] = self._recorder.update_totals(hook_metrics.get(hook, {}))
+        try:
+            write_metrics(render_metrics(hook_metrics))
+        except OSError as err:
+            logger.warning("failed to write the charm metrics: %s", err)
+
     def _upstream_snap_present(self) -> bool:
         """Return True iff the legacy `golang-openstack-exporter` snap is installed and present."""
         try:
@@ -226,6 +870,24 @@ class OpenstackExporterOperatorCharm(ops.CharmBase):
         except snap.SnapNotFoundError:
             return False
 
+    def _refresh_status(self) -> Optional[ActiveStatus]:
+        """Return the status of a queued, warming up or pending refresh of the snap, if any."""
+        peers = self.model.get_relation(PEER_RELATION)
+        refresh_state = peers.data[self.unit].get(REFRESH_STATE) if peers else None
+        if refresh_state == "requested":
+            return ActiveStatus(f"{SNAP_NAME} refresh queued, waiting for the other units")
+        if refresh_state == "refreshed":
+            return ActiveStatus(
+                f"{SNAP_NAME} refreshed, waiting for the exporter to serve metrics"
+            )
+        if cast(bool, self._stored.refresh_pending):
+            window = self.model.config["snap_refresh_window"]
+            return ActiveStatus(
+                f"{SNAP_NAME} refresh pending, "
+                + (f"applied in window {window} UTC" if window else "held by the charm")
+            )
+        return None
+
     def _on_collect_unit_status(self, event: ops.CollectStatusEvent) -> None:
         """Handle collect unit status event (called after every event)."""
         if config_error := self.validate_configs():
@@ -278,6 +940,9 @@ class OpenstackExporterOperatorCharm(ops.CharmBase):
                 )
             )
 
+        for status in filter(None, (self._refresh_status(), self._probe_status())):
+            event.add_status(status)
+
         event.add_status(ActiveStatus())
 
 
@@ -0,0 +1,113 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Send the alert rules and dashboards to grafana-agent over the cos-agent relations.
+
+The provider of the cos_agent library builds the unit data for each relation in turn, loading
+the rules and compressing the dashboards again for every one of them. This provider builds the
+data once, without whitespace or null values, and writes it to every relation. The rules,
+the dashboards and the data are kept until the files in the rules and dashboards directories
+change, which the charm does in the middle of some hooks.
+
+The size of the data is logged when it changes, with a warning above UNIT_DATA_BUDGET.
+
+The module imports the cos_agent library, and with it pydantic, so it is imported lazily.
+"""
+
+import json
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Callable
+
+import pydantic
+from charms.grafana_agent.v0.cos_agent import COSAgentProvider, CosAgentProviderUnitData
+
+from generated import stat_digest
+
+logger = getLogger(__name__)
+
+# Size in bytes above which the unit data is reported. grafana-agent reads the data of every
+# unit in each relation-changed hook, and the databags are stored by the Juju controller.
+UNIT_DATA_BUDGET = 64 * 1024
+
+
+class CachedCOSAgentProvider(COSAgentProvider):
+    """Provider of the cos_agent interface sending the same data to every relation."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._cache: dict[str, tuple[str, Any]] = {}
+        # size in bytes of the unit data last written, in total and per key
+        self.unit_data_sizes: dict[str, int] = {}
+
+    def _memoised(self, name: str, compute: Callable[[], Any]) -> Any:
+        """Return the value computed for the current files, computing it on first use."""
+        directories = [self._metrics_rules, self._logs_rules, *self._dashboard_dirs]
+        digest = stat_digest(*map(Path, directories))
+        cached = self._cache.get(name)
+        if cached is None or cached[0] != digest:
+            cached = self._cache[name] = (digest, compute())
+        return cached[1]
+
+    @property
+    def _metrics_alert_rules(self) -> dict:
+        """The metrics alert rules, loaded once for the current files."""
+        return self._memoised(
+            "metrics_alert_rules", lambda: COSAgentProvider._metrics_alert_rules.fget(self)
+        )
+
+    @property
+    def _log_alert_rules(self) -> dict:
+        """The log alert rules, loaded once for the current files."""
+        return self._memoised(
+            "log_alert_rules", lambda: COSAgentProvider._log_alert_rules.fget(self)
+        )
+
+    @property
+    def _dashboards(self) -> list:
+        """The dashboards, compressed once for the current files."""
+        return self._memoised("dashboards", lambda: COSAgentProvider._dashboards.fget(self))
+
+    def _unit_data(self) -> tuple[str, dict[str, int]]:
+        """Return the serialised unit data and its size in bytes, in total and per key."""
+        data = CosAgentProviderUnitData(
+            metrics_alert_rules=self._metrics_alert_rules,
+            log_alert_rules=self._log_alert_rules,
+            dashboards=self._dashboards,
+            metrics_scrape_jobs=self._scrape_jobs,
+            log_slots=self._log_slots,
+        ).json(separators=(",", ":"), exclude_none=True)
+        sizes = {
+            key: len(json.dumps(value, separators=(",", ":")).encode())
+            for key, value in json.loads(data).items()
+        }
+        sizes["total"] = len(data.encode())
+        return data, sizes
+
+    def _on_refresh(self, event: Any) -> None:
+        """Write the unit data, built once, to every cos-agent relation."""
+        relations = [
+            relation
+            for relation in self._charm.model.relations[self._relation_name]
+            # the unit data cannot be read before the subordinate is related
+            if relation.data and self._charm.unit in relation.data
+        ]
+        if not relations:
+            return
+        try:
+            data, sizes = self._memoised("unit_data", self._unit_data)
+        except (pydantic.ValidationError, json.decoder.JSONDecodeError) as e:
+            logger.error("Invalid relation data provided: %s", e)
+            return
+        if sizes != self.unit_data_sizes:
+            details = ", ".join(f"{key} {size}" for key, size in sizes.items() if key != "total")
+            logger.info("cos-agent unit data of %d bytes: %s", sizes["total"], details)
+            if sizes["total"] > UNIT_DATA_BUDGET:
+                logger.warning(
+                    "cos-agent unit data of %d bytes exceeds %d bytes, relation-changed hooks "
+                    "of grafana-agent slow down",
+                    sizes["total"],
+                    UNIT_DATA_BUDGET,
+                )
+        self.unit_data_sizes = sizes
+        for relation in relations:
+            relation.data[self._charm.unit][CosAgentProviderUnitData.KEY] = data
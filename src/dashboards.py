@@ -0,0 +1,107 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Generate the Grafana dashboards for the services of the cloud.
+
+The dashboards in src/grafana_dashboards are templates, kept as exported by Grafana so they can
+be edited there. The generated dashboards are minified, without the null values and the empty
+ones Grafana defaults anyway, and without the panels querying the metrics of services the
+exporter does not report, so the cos-agent relation data and the dashboards Grafana renders are
+smaller.
+"""
+
+import json
+import re
+import shutil
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Collection, Optional
+
+from generated import write_files
+
+logger = getLogger(__name__)
+
+DASHBOARD_TEMPLATES_DIR = Path(__file__).parent / "grafana_dashboards"
+DASHBOARDS_DIR = Path("/var/lib/openstack-exporter-charm-dashboards")
+# e.g. openstack_nova_running_vms, named as in the openstack_<service>_up series
+SERVICE_METRIC_PATTERN = re.compile(
+    r"\bopenstack_(nova|neutron|cinder|glance|placement|identity|loadbalancer)_"
+)
+
+# Members Grafana defaults to an empty list or object when they are missing. Other empty
+# members, e.g. the overrides of a field config or the targets of a panel, are kept.
+EMPTY_DEFAULT_KEYS = {"aliasColors", "links", "mappings", "seriesOverrides", "transformations"}
+
+
+def compact(value: Any) -> Any:
+    """Return the value without the null members, and the empty ones Grafana defaults."""
+    if isinstance(value, dict):
+        members = ((key, compact(member)) for key, member in value.items())
+        return {
+            key: member
+            for key, member in members
+            if member is not None and not (key in EMPTY_DEFAULT_KEYS and member in ({}, []))
+        }
+    if isinstance(value, list):
+        return [compact(member) for member in value]
+    return value
+
+
+def _panel_services(panel: dict[str, Any]) -> set[str]:
+    """Return the services whose metrics the queries of a panel use."""
+    return set(SERVICE_METRIC_PATTERN.findall(json.dumps(panel.get("targets", []))))
+
+
+def filter_panels(panels: list[dict[str, Any]], services: Collection[str]) -> list[dict[str, Any]]:
+    """Return the panels that only query metrics of the given services, and their rows.
+
+    The panels that do not query OpenStack metrics are kept. A row left without panels, either
+    nested in it when collapsed or following it, is removed.
+    """
+    kept = []
+    for panel in panels:
+        if panel.get("type") == "row":
+            if "panels" in panel:
+                panel = {**panel, "panels": filter_panels(panel["panels"], services)}
+        elif not _panel_services(panel) <= set(services):
+            continue
+        kept.append(panel)
+
+    def has_panels(index: int) -> bool:
+        following = kept[index + 1] if index + 1 < len(kept) else {"type": "row"}
+        return bool(kept[index].get("panels")) or following.get("type") != "row"
+
+    return [
+        panel
+        for index, panel in enumerate(kept)
+        if panel.get("type") != "row" or has_panels(index)
+    ]
+
+
+def render_dashboards(services: Optional[Collection[str]]) -> dict[str, str]:
+    """Return the content of the dashboards for the services, by file name.
+
+    If the services are not known yet (None), all the panels are kept.
+    """
+    dashboards = {}
+    for template in sorted(DASHBOARD_TEMPLATES_DIR.glob("*.json")):
+        dashboard = json.loads(template.read_text())
+        if services is not None:
+            dashboard["panels"] = filter_panels(dashboard.get("panels", []), services)
+        dashboards[template.name] = json.dumps(compact(dashboard), separators=(",", ":"))
+    return dashboards
+
+
+def write_dashboards(services: Optional[Collection[str]]) -> bool:
+    """Write the dashboards for the services.
+
+    Return True if any dashboard was changed.
+    """
+    changed = write_files(DASHBOARDS_DIR, render_dashboards(services))
+    if changed:
+        logger.info("Generated the dashboards for services: %s", services or "all")
+    return changed
+
+
+def remove_dashboards() -> None:
+    """Remove the generated dashboards."""
+    shutil.rmtree(DASHBOARDS_DIR, ignore_errors=True)
@@ -0,0 +1,96 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Streaming parser of the Prometheus text exposition format.
+
+The metrics of the exporter reach hundreds of megabytes on large clouds, so they are never read
+into memory at once: the samples are parsed and yielded one line at a time, and the caller can
+stop reading as soon as it has what it needs.
+"""
+
+import re
+from logging import getLogger
+from typing import BinaryIO, Container, Iterable, Iterator, NamedTuple, Optional
+
+logger = getLogger(__name__)
+
+# Longest line kept, longer lines are skipped without being held in memory
+MAX_LINE = 1 << 20
+# e.g. openstack_neutron_port{device_owner="network:dhcp",mac_address="fa:16:3e:..."} 1
+SAMPLE_PATTERN = re.compile(rb"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)")
+LABEL_PATTERN = re.compile(rb'([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*"((?:[^"\\]|\\.)*)"')
+ESCAPE_PATTERN = re.compile(r"\\(.)")
+TYPE_PATTERN = re.compile(rb"^#\s+TYPE\s+(\S+)\s+(\w+)")
+# The series of a histogram or summary family are named after it with these suffixes
+FAMILY_SUFFIXES = ("_bucket", "_sum", "_count")
+
+
+class Sample(NamedTuple):
+    """A sample of the exposition, with the metric family it belongs to."""
+
+    family: str
+    name: str
+    labels: dict[str, str]
+    value: float
+
+
+def iter_lines(stream: BinaryIO, max_line: int = MAX_LINE) -> Iterator[bytes]:
+    """Yield the lines of a binary stream, e.g. a file or an HTTP response.
+
+    Lines longer than `max_line` bytes, newline excluded, are skipped, so a single line cannot
+    exhaust the memory.
+    """
+    while line := stream.readline(max_line + 1):
+        if len(line) > max_line and not line.endswith(b"\n"):
+            while (rest := stream.readline(max_line + 1)) and not rest.endswith(b"\n"):
+                pass
+            logger.debug("skipped a line longer than %d bytes", max_line)
+            continue
+        yield line
+
+
+def _unescape(value: bytes) -> str:
+    """Decode a label value, replacing the escaped backslashes, quotes and newlines."""
+    text = value.decode(errors="replace")
+    if "\\" not in text:
+        return text
+    return ESCAPE_PATTERN.sub(lambda match: "\n" if match[1] == "n" else match[1], text)
+
+
+def family_of(name: str, types: dict[str, str]) -> str:
+    """Return the metric family of a series name, given the types declared so far."""
+    for suffix in FAMILY_SUFFIXES:
+        base = name.removesuffix(suffix)
+        if base != name and types.get(base) in ("histogram", "summary"):
+            return base
+    return name
+
+
+def parse_samples(
+    lines: Iterable[bytes], families: Optional[Container[str]] = None
+) -> Iterator[Sample]:
+    """Yield the samples of the exposition lines.
+
+    If `families` is given, only the samples of these metric families are parsed and yielded.
+    Comments other than the type declarations and malformed lines are skipped.
+    """
+    types: dict[str, str] = {}
+    for line in lines:
+        if line.startswith(b"#"):
+            if match := TYPE_PATTERN.match(line):
+                types[match[1].decode()] = match[2].decode()
+            continue
+        if not (match := SAMPLE_PATTERN.match(line)):
+            continue
+        name = match[1].decode()
+        family = family_of(name, types)
+        if families is not None and family not in families:
+            continue
+        try:
+            value = float(match[3])
+        except ValueError:
+            logger.debug("skipped a sample of %s with an invalid value", name)
+            continue
+        labels = {
+            label.decode(): _unescape(raw) for label, raw in LABEL_PATTERN.findall(match[2] or b"")
+        }
+        yield Sample(family, name, labels, value)
@@ -0,0 +1,39 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Files generated by the charm and passed to grafana-agent through the cos-agent relation."""
+
+import hashlib
+from pathlib import Path
+from typing import Mapping
+
+
+def write_files(directory: Path, files: Mapping[str, str]) -> bool:
+    """Make the directory hold exactly these files, by name, writing only the changed ones.
+
+    Return True if any file was written or removed.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    changed = False
+    for path in directory.iterdir():
+        if path.name not in files:
+            path.unlink()
+            changed = True
+    for name, content in files.items():
+        path = directory / name
+        if not path.exists() or path.read_text() != content:
+            path.write_text(content)
+            changed = True
+    return changed
+
+
+def stat_digest(*directories: Path) -> str:
+    """Return a digest of the names, sizes and modification times of the files in directories.
+
+    This tells cheaply whether the templates or the generated files changed.
+    """
+    digest = hashlib.sha256()
+    for directory in directories:
+        for path in sorted(directory.glob("*")) if directory.is_dir() else []:
+            stat = path.stat()
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
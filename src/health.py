@@ -0,0 +1,47 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Assess the health of the exporter from the recent probes of its metrics endpoint.
+
+The assessment runs in collect-status on every dispatch, so it is kept apart from the scrape
+helpers, which are only imported by the handlers probing the exporter.
+"""
+
+from typing import Any, Optional, Sequence
+
+
+def median(values: Sequence[float]) -> float:
+    """Return the median of the values, which must not be empty."""
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def assess(
+    history: Sequence[dict[str, Any]], latency_threshold: float, empty_threshold: int
+) -> Optional[str]:
+    """Return why the exporter is degraded according to the recent probes, or None.
+
+    The exporter is degraded if the median latency of the probes is above `latency_threshold`
+    seconds, or if the last `empty_threshold` probes failed or returned no series at all. A
+    threshold of 0 disables its check. OpenStack services reported down are left to the
+    OpenStackServicesDown alert: they are outages of the cloud, not of the exporter.
+    """
+    if not history:
+        return None
+
+    reasons = []
+    latency = median([result["latency"] for result in history])
+    if latency_threshold and latency > latency_threshold:
+        reasons.append(f"median scrape latency {latency:.1f}s > {latency_threshold:g}s")
+
+    recent = history[-empty_threshold:]
+    if (
+        empty_threshold
+        and len(recent) == empty_threshold
+        and all(result["error"] or not result["series"] for result in recent)
+    ):
+        cause = recent[-1]["error"] or "empty"
+        reasons.append(f"no metrics in the last {empty_threshold} scrapes ({cause})")
+    return ", ".join(reasons) or None
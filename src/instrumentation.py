@@ -0,0 +1,195 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Self-instrumentation of the charm.
+
+Every dispatch records the hook name, its wall time, how many snapd API calls and subprocesses
+it made, and whether the exporter was restarted. The running totals per hook are rendered in
+the Prometheus text format and served on localhost by a small systemd unit, so they can be
+scraped by grafana-agent next to the exporter itself.
+"""
+
+import os
+import subprocess
+import sys
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Mapping, Optional
+
+logger = getLogger(__name__)
+
+SNAPD_SOCKET = "/run/snapd.socket"
+METRICS_DIR = Path("/var/lib/openstack-exporter-charm")
+METRICS_FILE = METRICS_DIR / "metrics.txt"
+METRICS_PATH = f"/{METRICS_FILE.name}"
+METRICS_SERVICE = "openstack-exporter-charm-metrics"
+METRICS_SERVICE_FILE = Path(f"/etc/systemd/system/{METRICS_SERVICE}.service")
+METRICS_SERVICE_TEMPLATE = """\
+[Unit]
+Description=Serve the openstack-exporter charm metrics
+After=network.target
+
+[Service]
+ExecStart=/usr/bin/python3 -m http.server --bind 127.0.0.1 --directory {directory} {port}
+StandardError=null
+Restart=on-failure
+# An unprivileged user that can only read the served directory
+DynamicUser=yes
+NoNewPrivileges=yes
+ProtectSystem=strict
+ProtectHome=yes
+PrivateTmp=yes
+ReadOnlyPaths={directory}
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+METRIC_PREFIX = "openstack_exporter_charm"
+# Per hook totals kept across dispatches: (key, metric suffix, type, help)
+_METRICS = [
+    ("count", "hook_dispatches_total", "counter", "Number of dispatches of the hook."),
+    ("seconds", "hook_duration_seconds_total", "counter", "Total wall time of the hook."),
+    ("last_seconds", "hook_last_duration_seconds", "gauge", "Wall time of the last dispatch."),
+    ("snapd_calls", "hook_snapd_api_calls_total", "counter", "Number of snapd API calls."),
+    ("subprocesses", "hook_subprocesses_total", "counter", "Number of subprocesses spawned."),
+    ("restarts", "hook_exporter_restarts_total", "counter", "Number of exporter restarts."),
+    ("timestamp", "hook_last_dispatch_timestamp_seconds", "gauge", "Time of the last dispatch."),
+]
+
+# The recorder receiving the audit events of the current process, see DispatchRecorder.start.
+_active_recorder: Optional["DispatchRecorder"] = None
+
+
+def _audit_hook(event: str, args: tuple[Any, ...]) -> None:
+    """Forward the audit events to the active recorder."""
+    if _active_recorder is not None:
+        _active_recorder.audit(event, args)
+
+
+def process_uptime() -> float:
+    """Return the seconds elapsed since this process started, or 0.0 if unknown.
+
+    This includes the interpreter start up and the imports, which are part of the hook cost.
+    """
+    try:
+        stat = Path("/proc/self/stat").read_text()
+        # The process name may contain spaces, so split after its closing parenthesis;
+        # starttime is the 22nd field, in clock ticks since boot.
+        start_ticks = int(stat.rsplit(")", 1)[1].split()[19])
+        started = start_ticks / os.sysconf("SC_CLK_TCK")
+        return max(time.clock_gettime(time.CLOCK_BOOTTIME) - started, 0.0)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def dispatch_name() -> str:
+    """Return the name of the hook or action being dispatched."""
+    kind, _, name = os.environ.get("JUJU_DISPATCH_PATH", "").partition("/")
+    if kind == "actions":
+        return f"{name}-action"
+    return name or "unknown"
+
+
+class DispatchRecorder:
+    """Record the cost of the current dispatch."""
+
+    _audit_hook_installed = False
+
+    def __init__(self) -> None:
+        self.hook = dispatch_name()
+        self.started_at = time.monotonic() - process_uptime()
+        self.snapd_calls = 0
+        self.subprocesses = 0
+        self.restarted = False
+
+    @classmethod
+    def start(cls) -> "DispatchRecorder":
+        """Create a recorder and make it receive the audit events of this process.
+
+        Audit hooks cannot be removed, so a single hook is installed per process and the
+        events are forwarded to the most recently started recorder.
+        """
+        global _active_recorder
+        _active_recorder = cls()
+        if not cls._audit_hook_installed:
+            sys.addaudithook(_audit_hook)
+            cls._audit_hook_installed = True
+        return _active_recorder
+
+    def audit(self, event: str, args: tuple[Any, ...]) -> None:
+        """Count the subprocesses and the connections to the snapd socket."""
+        if event == "subprocess.Popen":
+            self.subprocesses += 1
+        elif event == "socket.connect" and args[1] == SNAPD_SOCKET:
+            self.snapd_calls += 1
+
+    @property
+    def elapsed(self) -> float:
+        """Wall time of the dispatch so far."""
+        return time.monotonic() - self.started_at
+
+    def update_totals(self, totals: Mapping[str, float]) -> dict[str, float]:
+        """Return the given hook totals with this dispatch added."""
+        elapsed = self.elapsed
+        return {
+            "count": totals.get("count", 0) + 1,
+            "seconds": totals.get("seconds", 0.0) + elapsed,
+            "last_seconds": elapsed,
+            "snapd_calls": totals.get("snapd_calls", 0) + self.snapd_calls,
+            "subprocesses": totals.get("subprocesses", 0) + self.subprocesses,
+            "restarts": totals.get("restarts", 0) + int(self.restarted),
+            "timestamp": time.time(),
+        }
+
+
+def render_metrics(totals: Mapping[str, Mapping[str, float]]) -> str:
+    """Render the per hook totals in the Prometheus text format."""
+    lines = []
+    for key, suffix, metric_type, help_text in _METRICS:
+        name = f"{METRIC_PREFIX}_{suffix}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for hook in sorted(totals):
+            lines.append(f'{name}{{hook="{hook}"}} {totals[hook].get(key, 0)}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(text: str) -> None:
+    """Atomically replace the served metrics file."""
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = METRICS_FILE.with_suffix(".tmp")
+    tmp.write_text(text)
+    # readable by the dynamic user of the metrics server, whatever the umask of the hook
+    tmp.chmod(0o644)
+    os.replace(tmp, METRICS_FILE)
+
+
+def ensure_metrics_server(port: int) -> None:
+    """Install the systemd unit serving the metrics file on localhost.
+
+    The unit is only (re)written and restarted when its content changes.
+    """
+    content = METRICS_SERVICE_TEMPLATE.format(directory=METRICS_DIR, port=port)
+    try:
+        if METRICS_SERVICE_FILE.read_text() == content:
+            return
+    except FileNotFoundError:
+        pass
+
+    logger.info("Installing %s on port %d", METRICS_SERVICE, port)
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    METRICS_DIR.chmod(0o755)
+    METRICS_SERVICE_FILE.write_text(content)
+    subprocess.run(["systemctl", "daemon-reload"], check=True)
+    subprocess.run(["systemctl", "enable", METRICS_SERVICE], check=True)
+    subprocess.run(["systemctl", "restart", METRICS_SERVICE], check=True)
+
+
+def remove_metrics_server() -> None:
+    """Stop and remove the systemd unit serving the metrics file."""
+    if not METRICS_SERVICE_FILE.exists():
+        return
+    subprocess.run(["systemctl", "disable", "--now", METRICS_SERVICE], check=False)
+    METRICS_SERVICE_FILE.unlink()
+    subprocess.run(["systemctl", "daemon-reload"], check=True)
@@ -0,0 +1,188 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Scrape the exporter metrics endpoint on localhost.
+
+The snapd service state only tells whether the exporter process runs. These helpers look at what
+Prometheus actually gets: how long a scrape takes, how big it is, and whether it has any series.
+"""
+
+import http.client
+import math
+import re
+import time
+import urllib.request
+from collections import Counter, defaultdict
+from logging import getLogger
+from typing import Any, BinaryIO, Iterator, Sequence
+
+from exposition import iter_lines, parse_samples
+
+logger = getLogger(__name__)
+
+# e.g. openstack_nova_up 1, the exporter reports 0 when it cannot query the service
+UP_PATTERN = re.compile(r"^openstack_(\w+)_up$")
+READ_SIZE = 1 << 16
+TOP_LABEL_VALUES = 5
+# Distinct values counted per label by the cardinality report, the series with other values of
+# a label (e.g. the MAC address of every port of a large cloud) are only counted in total.
+MAX_LABEL_VALUES = 1000
+
+
+def metrics_url(port: int) -> str:
+    """Return the URL of the exporter metrics on localhost."""
+    return f"http://localhost:{port}/metrics"
+
+
+def _read_lines(
+    response: BinaryIO, start: float, timeout: float, stats: dict[str, Any]
+) -> Iterator[bytes]:
+    """Yield the lines of the response and count its bytes, until `timeout` seconds in total."""
+    for line in iter_lines(response):
+        if time.monotonic() - start > timeout:
+            raise TimeoutError(f"scrape not complete after {timeout}s")
+        stats["bytes"] += len(line)
+        yield line
+
+
+def probe(port: int, timeout: float) -> dict[str, Any]:
+    """Scrape the exporter once and return its latency, size, series and up values.
+
+    The response is parsed line by line, and the scrape is given up after `timeout` seconds in
+    total, so a slow exporter cannot hold the hook for longer than that.
+    """
+    result: dict[str, Any] = {
+        "time": time.time(),
+        "latency": 0.0,
+        "bytes": 0,
+        "series": 0,
+        "up": {},
+        "error": "",
+    }
+    start = time.monotonic()
+    try:
+        with urllib.request.urlopen(metrics_url(port), timeout=timeout) as response:
+            for sample in parse_samples(_read_lines(response, start, timeout, result)):
+                result["series"] += 1
+                if match := UP_PATTERN.match(sample.name):
+                    result["up"][match[1]] = sample.value
+    except (OSError, ValueError, http.client.HTTPException) as err:
+        logger.warning("failed to scrape the exporter: %s", err)
+        result["error"] = str(err) or type(err).__name__
+    result["latency"] = time.monotonic() - start
+    return result
+
+
+def _timed_scrape(url: str, timeout: float) -> tuple[float, int, str]:
+    """Scrape the exporter once, return the latency, the response size and the error if any."""
+    start = time.monotonic()
+    size = 0
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            while chunk := response.read(READ_SIZE):
+                size += len(chunk)
+    except (OSError, http.client.HTTPException) as err:
+        return time.monotonic() - start, size, str(err) or type(err).__name__
+    return time.monotonic() - start, size, ""
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    """Return the nearest-rank percentile of the values, 0 if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def benchmark(port: int, concurrency: int, duration: float, timeout: float) -> dict[str, Any]:
+    """Scrape the exporter from `concurrency` threads for `duration` seconds.
+
+    Each thread scrapes the exporter again as soon as the previous response is fully read.
+    Return the request and error counts, the throughput of successful scrapes per second, and
+    the latency (seconds) and response size (bytes) distributions.
+    """
+    # only the benchmark action needs threads, not the probe of every update-status
+    from concurrent.futures import ThreadPoolExecutor
+
+    url = metrics_url(port)
+    start = time.monotonic()
+    deadline = start + duration
+
+    def worker() -> list[tuple[float, int, str]]:
+        samples = []
+        while time.monotonic() < deadline:
+            samples.append(_timed_scrape(url, timeout))
+        return samples
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(worker) for _ in range(concurrency)]
+        samples = [sample for future in futures for sample in future.result()]
+    elapsed = time.monotonic() - start
+
+    latencies = [latency for latency, _, error in samples if not error]
+    sizes = [size for _, size, error in samples if not error]
+    errors = [error for *_, error in samples if error]
+    results: dict[str, Any] = {
+        "requests": len(samples),
+        "errors": len(errors),
+        "throughput": round(len(latencies) / elapsed, 3),
+        "latency-p50": round(percentile(latencies, 50), 4),
+        "latency-p95": round(percentile(latencies, 95), 4),
+        "latency-p99": round(percentile(latencies, 99), 4),
+        "size-min": min(sizes, default=0),
+        "size-p50": int(percentile(sizes, 50)),
+        "size-max": max(sizes, default=0),
+    }
+    if errors:
+        results["last-error"] = errors[-1]
+    return results
+
+
+def cardinality(port: int, timeout: float, top: int) -> dict[str, Any]:
+    """Count the series of the exporter per metric family and per label value.
+
+    The response is parsed line by line as it is read, so only the counters are kept in memory:
+    at most MAX_LABEL_VALUES values are counted per label, the series with other values are
+    counted as overflow.
+    Return the totals, the `top` families with the most series, and the `top` labels with the
+    most distinct values along with their most frequent values.
+    Raise OSError, ValueError or HTTPException if the scrape fails.
+    """
+    stats: dict[str, Any] = {"bytes": 0}
+    families: Counter[str] = Counter()
+    labels: defaultdict[str, Counter[str]] = defaultdict(Counter)
+    overflow: Counter[str] = Counter()
+    start = time.monotonic()
+    with urllib.request.urlopen(metrics_url(port), timeout=timeout) as response:
+        for sample in parse_samples(_read_lines(response, start, timeout, stats)):
+            families[sample.family] += 1
+            for label, value in sample.labels.items():
+                values = labels[label]
+                if value in values or len(values) < MAX_LABEL_VALUES:
+                    values[value] += 1
+                else:
+                    overflow[label] += 1
+
+    top_labels = sorted(
+        labels.items(), key=lambda item: (-len(item[1]), -overflow[item[0]], item[0])
+    )[:top]
+    return {
+        "bytes": stats["bytes"],
+        "series": families.total(),
+        "families": len(families),
+        "labels": len(labels),
+        "top-families": "\n".join(f"{name} {count}" for name, count in families.most_common(top)),
+        "top-labels": "\n".join(
+            _format_label(label, values, overflow[label]) for label, values in top_labels
+        ),
+    }
+
+
+def _format_label(label: str, values: Counter[str], overflow: int) -> str:
+    """Return the number of values of a label and its most frequent values."""
+    common = [f"{value}={count}" for value, count in values.most_common(TOP_LABEL_VALUES)]
+    if not overflow:
+        return f"{label} {len(values)} values ({', '.join(common)})"
+    return (
+        f"{label} over {len(values)} values ({', '.join(common)}, "
+        f"{overflow} series with other values)"
+    )
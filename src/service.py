@@ -2,18 +2,31 @@
 # See LICENSE file for licensing details.
 """Utility module to help manage the snap service with guarding functions."""
 
-import os
+import math
+import subprocess
+import time
+import urllib.request
 from logging import getLogger
+from pathlib import Path
 from typing import Any, Optional
 
 from charms.operator_libs_linux.v2 import snap
 
+from exposition import iter_lines, parse_samples
 from ssdlc import SSDLCSysEvent, log_ssdlc_system_event
 
 logger = getLogger(__name__)
 
 SNAP_NAME = "charmed-openstack-exporter"
 UPSTREAM_SNAP = "golang-openstack-exporter"
+# Transient systemd unit used to apply a coalesced restart at the end of the restart window.
+RESTART_TIMER_UNIT = f"{SNAP_NAME}-restart"
+# systemd drop-in managed by the charm for the exporter service.
+DROP_IN_DIR = Path(f"/etc/systemd/system/snap.{SNAP_NAME}.service.service.d")
+DROP_IN_FILE = DROP_IN_DIR / "charm.conf"
+# Drop-in written by older revisions of the charm, superseded by DROP_IN_FILE.
+LEGACY_DROP_IN_FILE = DROP_IN_DIR / "bug_268.conf"
+SNAP_RISKS = ("stable", "candidate", "beta", "edge")
 
 
 class SnapService:
@@ -27,15 +40,17 @@ class SnapService:
         """Return True if all snap service(s) is / are active."""
         return all(service.get("active", False) for service in self.snap_client.services.values())
 
-    def restart_and_enable(self) -> None:
+    def restart_and_enable(self, cause: str = "") -> None:
         """Restart and enable the snap service.
 
         Ensure:
         - service is running
         - service is enabled
         - service is restarted if already running to apply updated config
+
+        The SSDLC restart event records how long the restart took and its cause.
         """
-        log_ssdlc_system_event(SSDLCSysEvent.RESTART)
+        start = time.monotonic()
         try:
             # This is safe to always run,
             # because restarting when service is disabled has no effect,
@@ -44,13 +59,22 @@ class SnapService:
             # This is idempotent, so ok to always run to ensure it's started and enabled
             self.snap_client.start(enable=True)
         except Exception as err:
-            log_ssdlc_system_event(SSDLCSysEvent.CRASH, msg=str(err))
+            log_ssdlc_system_event(
+                SSDLCSysEvent.CRASH, msg=str(err), duration=time.monotonic() - start, cause=cause
+            )
             raise
+        else:
+            log_ssdlc_system_event(
+                SSDLCSysEvent.RESTART, duration=time.monotonic() - start, cause=cause
+            )
 
-    def stop(self) -> None:
+    def stop(self, cause: str = "") -> None:
         """Stop and disable the snap service."""
+        start = time.monotonic()
         self.snap_client.stop(disable=True)
-        log_ssdlc_system_event(SSDLCSysEvent.SHUTDOWN)
+        log_ssdlc_system_event(
+            SSDLCSysEvent.SHUTDOWN, duration=time.monotonic() - start, cause=cause
+        )
 
     def configure(self, snap_config: dict[str, Any]) -> None:
         """Configure the snap service."""
@@ -65,8 +89,76 @@ class SnapService:
         """Check if the snap client is present or not."""
         return self.snap_client.present
 
+    @property
+    def revision(self) -> str:
+        """Installed revision of the snap."""
+        return self.snap_client.revision
+
+    def hold_refresh(self, hold: bool) -> None:
+        """Hold or release the automatic refreshes of the snap by snapd."""
+        if hold:
+            self.snap_client.hold()
+        else:
+            self.snap_client.unhold()
+
+
+def refresh_pending(snap_name: str) -> bool:
+    """Return True if the store has a refresh available for the snap."""
+    result = subprocess.run(
+        ["snap", "refresh", "--list"], capture_output=True, text=True, check=False
+    )
+    if result.returncode != 0:
+        logger.warning("unable to list the pending snap refreshes: %s", result.stderr.strip())
+        return False
+    # The first line is the header: Name  Version  Rev  Size  Publisher  Notes
+    return any(line.split()[:1] == [snap_name] for line in result.stdout.splitlines()[1:])
+
+
+def schedule_restart(delay: float, cause: str = "") -> bool:
+    """Schedule a restart of the snap services in `delay` seconds.
+
+    A transient systemd timer restarts the services, so the restart happens even if no other
+    hook runs in the meantime. Any config written until then is applied by that single restart.
+    Only the scheduling is logged as an SSDLC event, the restart itself is run by systemd.
+
+    Return False if a restart is already scheduled, True otherwise.
+    """
+    timer = f"{RESTART_TIMER_UNIT}.timer"
+    if subprocess.run(["systemctl", "is-active", "--quiet", timer], check=False).returncode == 0:
+        logger.info("%s restart already scheduled, coalescing (%s)", SNAP_NAME, cause)
+        return False
+
+    seconds = max(math.ceil(delay), 1)
+    subprocess.run(
+        [
+            "systemd-run",
+            f"--unit={RESTART_TIMER_UNIT}",
+            f"--on-active={seconds}",
+            "--timer-property=AccuracySec=1s",
+            "--collect",
+            "/usr/bin/snap",
+            "restart",
+            SNAP_NAME,
+        ],
+        check=True,
+    )
+    log_ssdlc_system_event(SSDLCSysEvent.RESTART_SCHEDULED, msg=f"in {seconds}s", cause=cause)
+    return True
 
-def snap_install_or_refresh(resource: Optional[str], channel: str) -> None:
+
+def cancel_scheduled_restart() -> None:
+    """Cancel the scheduled restart of the snap services, if any."""
+    subprocess.run(["systemctl", "stop", f"{RESTART_TIMER_UNIT}.timer"], check=False)
+
+
+def snap_install_or_refresh(
+    resource: Optional[str],
+    channel: str,
+    resource_installed: bool = False,
+    revision: str = "",
+    cohort: str = "",
+    refresh: bool = False,
+) -> None:
     """Install or refresh the snap.
 
     Before installing the snap, it will try to remove the upstream snap that could be installed on
@@ -75,9 +167,26 @@ def snap_install_or_refresh(resource: Optional[str], channel: str) -> None:
     If the channel is changed, the snap.add method is able to identify and refresh the charm to the
     new channel.
 
+    The step is a no-op if the upstream snap is absent and the installed snap is already the
+    desired one: `resource_installed` is True, meaning the given resource has the same digest as
+    the one last installed, or the snap from the store tracks `channel` at the pinned `revision`.
+    Set `refresh` to refresh the snap from the store anyway.
+
     Raises an exception on error.
     """
-    remove_upstream_snap()
+    installed = get_installed_snaps()
+    if UPSTREAM_SNAP in installed:
+        remove_upstream_snap()
+
+    current = installed.get(SNAP_NAME)
+    if resource and resource_installed and current is not None:
+        logger.debug("%s resource is already installed, skipping.", SNAP_NAME)
+        return
+    if not resource and not refresh and snap_matches(current, channel, revision):
+        logger.debug("%s is already installed from %s, skipping.", SNAP_NAME, channel)
+        return
+
+    start = time.monotonic()
     try:
         if resource:
             logger.debug("installing %s from resource.", SNAP_NAME)
@@ -90,15 +199,84 @@ def snap_install_or_refresh(resource: Optional[str], channel: str) -> None:
             # it's necessary to remove it first
             remove_snap_as_resource()
             logger.debug("installing %s from snapcraft store", SNAP_NAME)
-            snap.add(SNAP_NAME, channel=channel)
+            snap.add(SNAP_NAME, channel=channel, revision=revision or None, cohort=cohort)
     except snap.SnapError as e:
         logger.error("failed to install snap: %s", str(e))
         raise e
     else:
         logger.info("installed %s snap.", SNAP_NAME)
         # Assume the service is started and enabled after installation, log the startup event here.
-        log_ssdlc_system_event(SSDLCSysEvent.STARTUP)
-        workaround_bug_268()
+        log_ssdlc_system_event(
+            SSDLCSysEvent.STARTUP, duration=time.monotonic() - start, cause="snap-install"
+        )
+
+
+def get_installed_snaps() -> dict[str, snap.Snap]:
+    """Return the installed snaps by name, read with a single snapd API call.
+
+    Unlike SnapCache()[name], this never asks the store about a snap which is not installed.
+    """
+    return {installed.name: installed for installed in snap.SnapCache() if installed is not None}
+
+
+def full_channel(channel: str) -> str:
+    """Return the channel as snapd reports it, with its track and risk, e.g. latest/stable.
+
+    Like snapd, the latest track is assumed when the channel starts with a risk, e.g. edge, and
+    the stable risk when the channel is only a track, e.g. 2.0.
+    """
+    parts = channel.split("/")
+    if parts[0] in SNAP_RISKS:
+        parts.insert(0, "latest")
+    if len(parts) == 1:
+        parts.append("stable")
+    return "/".join(parts)
+
+
+def snap_matches(installed: Optional[snap.Snap], channel: str, revision: str = "") -> bool:
+    """Return True if the snap is installed from the store, tracks `channel` and is at `revision`.
+
+    A revision starting with "x" was installed from a local file, i.e. a resource.
+    """
+    return (
+        installed is not None
+        and not installed.revision.startswith("x")
+        and full_channel(installed.channel) == full_channel(channel)
+        and (not revision or installed.revision == revision)
+    )
+
+
+def refresh_required(channel: str, revision: str = "") -> bool:
+    """Return True if the installed snap must be refreshed to track `channel` and `revision`."""
+    installed = get_installed_snaps().get(SNAP_NAME)
+    return installed is not None and not snap_matches(installed, channel, revision)
+
+
+def exporter_serving(port: int, timeout: float = 5.0) -> bool:
+    """Return True if the exporter serves metrics on localhost.
+
+    With the cache enabled, the exporter serves no samples until the cache is filled. The
+    response is only read up to its first sample.
+    """
+    try:
+        with urllib.request.urlopen(f"http://localhost:{port}/metrics", timeout=timeout) as res:
+            return res.status == 200 and next(parse_samples(iter_lines(res)), None) is not None
+    except OSError as err:
+        logger.debug("exporter not serving metrics yet: %s", err)
+        return False
+
+
+def wait_exporter_serving(port: int, timeout: float, interval: float = 5.0) -> bool:
+    """Wait up to `timeout` seconds for the exporter to serve non-empty metrics.
+
+    Return False if it does not serve them in time.
+    """
+    deadline = time.monotonic() + timeout
+    while not exporter_serving(port):
+        if time.monotonic() + interval > deadline:
+            return False
+        time.sleep(interval)
+    return True
 
 
 def remove_upstream_snap() -> None:
@@ -144,13 +322,45 @@ def get_installed_snap_service(snap_name: str) -> SnapService:
     return SnapService(snap_client)
 
 
-def workaround_bug_268() -> None:
-    """Workaround for a bug that blocks some nova metrics.
+def render_drop_in(environment: dict[str, str], directives: dict[str, str]) -> str:
+    """Render a systemd drop-in for the exporter service.
+
+    Args:
+        environment: environment variables of the service, e.g. GOMAXPROCS
+        directives: [Service] section directives, e.g. CPUQuota
 
-    https://github.com/openstack-exporter/openstack-exporter/issues/268
     """
-    logger.info("Adding service override to workaround bug 268")
-    dir = f"/etc/systemd/system/snap.{SNAP_NAME}.service.service.d"
-    os.makedirs(dir, exist_ok=True)
-    with open(f"{dir}/bug_268.conf", "w") as f:
-        f.write("[Service]\nEnvironment=OS_COMPUTE_API_VERSION=2.87\n")
+    lines = ["[Service]"]
+    lines.extend(f'Environment="{key}={value}"' for key, value in sorted(environment.items()))
+    lines.extend(f"{key}={value}" for key, value in sorted(directives.items()))
+    return "\n".join(lines) + "\n"
+
+
+def write_drop_in(content: str) -> bool:
+    """Write the exporter service drop-in and reload systemd if it changed.
+
+    Writing is idempotent: systemd is only reloaded when the content on disk changes.
+    The caller is responsible for restarting the service to apply it.
+
+    Return True if the drop-in changed.
+    """
+    changed = False
+    if LEGACY_DROP_IN_FILE.exists():
+        logger.info("Removing legacy drop-in %s", LEGACY_DROP_IN_FILE)
+        LEGACY_DROP_IN_FILE.unlink()
+        changed = True
+
+    try:
+        current = DROP_IN_FILE.read_text()
+    except FileNotFoundError:
+        current = None
+
+    if current != content:
+        logger.info("Updating service drop-in %s", DROP_IN_FILE)
+        DROP_IN_DIR.mkdir(parents=True, exist_ok=True)
+        DROP_IN_FILE.write_text(content)
+        changed = True
+
+    if changed:
+        subprocess.run(["systemctl", "daemon-reload"], check=True)
+    return changed
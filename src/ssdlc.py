@@ -7,12 +7,23 @@ These events provide critical visibility into the asset's lifecycle and health,
 detect potential tampering or malicious activities aimed at altering system behavior.
 """
 
+import json
+import os
+import uuid
 from datetime import datetime, timezone
 from enum import Enum
 from logging import getLogger
+from pathlib import Path
+from typing import Optional
+
+from instrumentation import dispatch_name
 
 logger = getLogger(__name__)
 
+# Juju gives every hook execution a unique context id; fall back to a random one so the events
+# of a single dispatch can still be correlated outside of a hook (e.g. in `juju exec`).
+CORRELATION_ID = os.environ.get("JUJU_CONTEXT_ID") or uuid.uuid4().hex
+
 
 class SSDLCSysEvent(str, Enum):  # noqa: N801
     """Constant event defined in SSDLC."""
@@ -20,6 +31,7 @@ class SSDLCSysEvent(str, Enum):  # noqa: N801
     STARTUP = "sys_startup"
     SHUTDOWN = "sys_shutdown"
     RESTART = "sys_restart"
+    RESTART_SCHEDULED = "sys_restart_scheduled"
     CRASH = "sys_crash"
 
 
@@ -28,6 +40,7 @@ _EVENT_LEVELS = {
     SSDLCSysEvent.SHUTDOWN: "WARN",
     SSDLCSysEvent.CRASH: "WARN",
     SSDLCSysEvent.RESTART: "WARN",
+    SSDLCSysEvent.RESTART_SCHEDULED: "INFO",
 }
 
 
@@ -35,6 +48,7 @@ _EVENT_DESCRIPTIONS = {
     SSDLCSysEvent.STARTUP: "openstack-exporter start service %s",
     SSDLCSysEvent.SHUTDOWN: "openstack-exporter shutdown service %s",
     SSDLCSysEvent.RESTART: "openstack-exporter restart service %s",
+    SSDLCSysEvent.RESTART_SCHEDULED: "openstack-exporter schedule restart of service %s",
     SSDLCSysEvent.CRASH: "openstack-exporter service %s crash",
 }
 
@@ -45,10 +59,21 @@ class Service(str, Enum):
     CHARMED_OPENSTACK_EXPORTER = "charmed-openstack-exporter"
 
 
+# The events are also appended as JSON lines to a file under /var/log, which the machine log job
+# of grafana-agent (related over cos-agent) ships to Loki with its /var/log/**/*log pattern. It
+# is rotated once, to ssdlc.log.1 which that pattern leaves out, when it reaches
+# SSDLC_LOG_MAX_BYTES.
+SSDLC_LOG_FILE = Path("/var/log/openstack-exporter-charm/ssdlc.log")
+SSDLC_LOG_MAX_BYTES = 1 << 20
+
+
 def log_ssdlc_system_event(
     event: SSDLCSysEvent,
     subject: Service = Service.CHARMED_OPENSTACK_EXPORTER,
     msg: str = "",
+    *,
+    duration: Optional[float] = None,
+    cause: str = "",
 ) -> None:
     """Log system event in SSDLC required format.
 
@@ -56,6 +81,8 @@ def log_ssdlc_system_event(
         event: The SSDLC system event type
         subject: Service enum (defaults to CHARMED_OPENSTACK_EXPORTER)
         msg: Optional additional message
+        duration: Optional time in seconds the service action took
+        cause: Optional reason of the event, e.g. the changed config keys
 
     """
     level = _EVENT_LEVELS[event]
@@ -64,12 +91,31 @@ def log_ssdlc_system_event(
 
     now = datetime.now(timezone.utc).astimezone()
 
-    logger.warning(
-        {
-            "datetime": now.isoformat(),
-            "appid": f"service.{subject.value}",
-            "event": f"{event.value}:{subject.value}",
-            "level": level,
-            "description": description,
-        },
-    )
+    record: dict[str, object] = {
+        "datetime": now.isoformat(),
+        "appid": f"service.{subject.value}",
+        "event": f"{event.value}:{subject.value}",
+        "level": level,
+        "description": description,
+        "hook": dispatch_name(),
+        "correlation_id": CORRELATION_ID,
+    }
+    if duration is not None:
+        record["duration"] = round(duration, 3)
+    if cause:
+        record["cause"] = cause
+
+    logger.warning(record)
+    _append_json_line(record)
+
+
+def _append_json_line(record: dict[str, object]) -> None:
+    """Append the event to the SSDLC log file, rotating it when it is full."""
+    try:
+        SSDLC_LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+        if SSDLC_LOG_FILE.exists() and SSDLC_LOG_FILE.stat().st_size >= SSDLC_LOG_MAX_BYTES:
+            SSDLC_LOG_FILE.replace(SSDLC_LOG_FILE.with_name(f"{SSDLC_LOG_FILE.name}.1"))
+        with SSDLC_LOG_FILE.open("a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as err:
+        logger.debug("cannot write SSDLC event to %s: %s", SSDLC_LOG_FILE, err)
@@ -6,6 +6,45 @@ import re
 from typing import Optional
 
 MAX_PORT = 65535
+# The probe runs in update-status, which should not be held for long
+MAX_PROBE_TIMEOUT = 120
+
+# https://pkg.go.dev/runtime#hdr-Environment_Variables
+GOMEMLIMIT_PATTERN = r"^\d+(B|KiB|MiB|GiB|TiB)?$"
+# https://www.freedesktop.org/software/systemd/man/latest/systemd.resource-control.html
+CPU_QUOTA_PATTERN = r"^\d+%$"
+MEMORY_HIGH_PATTERN = r"^(\d+[KMGT]?|\d+(\.\d+)?%|infinity)$"
+IO_SCHEDULING_CLASSES = {"realtime", "best-effort", "idle"}
+MIN_NICE, MAX_NICE = -20, 19
+
+# Daily snap refresh window in UTC, e.g. 02:00-04:00
+REFRESH_WINDOW_PATTERN = r"^([01]\d|2[0-3]):([0-5]\d)-([01]\d|2[0-3]):([0-5]\d)$"
+
+# Known-good API microversions per service: (major version, lowest minor, highest minor).
+# The highest minor is the maximum of yoga, the oldest OpenStack release the charm supports,
+# so that any of these can be requested against a supported cloud.
+API_MICROVERSIONS = {
+    "compute": (2, 1, 90),
+    "volume": (3, 0, 67),
+    "placement": (1, 0, 39),
+    "baremetal": (1, 1, 78),
+    "shared-file-system": (2, 0, 69),
+}
+
+# https://prometheus.io/docs/prometheus/latest/configuration/configuration/#duration
+PROMETHEUS_DURATION_PATTERN = r"^(\d+y)?(\d+w)?(\d+d)?(\d+h)?(\d+m)?(\d+s)?(\d+ms)?$"
+PROMETHEUS_DURATION_UNITS = {
+    "y": 365 * 86400,
+    "w": 7 * 86400,
+    "d": 86400,
+    "h": 3600,
+    "m": 60,
+    "s": 1,
+    "ms": 0.001,
+}
+# The lookback delta of Prometheus: a series recorded less often is missing from the queries
+# of the dashboards between two evaluations.
+MAX_CAPACITY_RULES_INTERVAL = 300
 
 # Allowable duration units for cache_ttl from https://pkg.go.dev/time#ParseDuration
 VALID_UNITS = {"ns", "us", "\u00b5s", "\u03bcs", "ms", "s", "m", "h"}
@@ -28,6 +67,230 @@ def validate_port(port: int) -> Optional[str]:
     return None
 
 
+def validate_restart_window(restart_window: int) -> Optional[str]:
+    """Validate restart_window configuration.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if restart_window < 0:
+        return f"Restart_window must be non-negative, got {restart_window}"
+    return None
+
+
+def validate_gomaxprocs(gomaxprocs: int) -> Optional[str]:
+    """Validate gomaxprocs configuration, 0 leaves it unset.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if gomaxprocs < 0:
+        return f"Gomaxprocs must be non-negative, got {gomaxprocs}"
+    return None
+
+
+def validate_gomemlimit(gomemlimit: str) -> Optional[str]:
+    """Validate gomemlimit configuration, empty leaves it unset.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if gomemlimit and not re.fullmatch(GOMEMLIMIT_PATTERN, gomemlimit):
+        return f"Gomemlimit must be a size such as '512MiB' or '2GiB', got {gomemlimit}"
+    return None
+
+
+def validate_cpu_quota(cpu_quota: str) -> Optional[str]:
+    """Validate cpu_quota configuration, empty leaves it unset.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if cpu_quota and not re.fullmatch(CPU_QUOTA_PATTERN, cpu_quota):
+        return f"Cpu_quota must be a percentage such as '150%', got {cpu_quota}"
+    return None
+
+
+def validate_memory_high(memory_high: str) -> Optional[str]:
+    """Validate memory_high configuration, empty leaves it unset.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if memory_high and not re.fullmatch(MEMORY_HIGH_PATTERN, memory_high):
+        return (
+            "Memory_high must be a size such as '2G', a percentage or 'infinity', "
+            f"got {memory_high}"
+        )
+    return None
+
+
+def validate_nice(nice: int) -> Optional[str]:
+    """Validate nice configuration.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if not MIN_NICE <= nice <= MAX_NICE:
+        return f"Nice must be between {MIN_NICE} and {MAX_NICE}, got {nice}"
+    return None
+
+
+def validate_io_scheduling_class(io_scheduling_class: str) -> Optional[str]:
+    """Validate io_scheduling_class configuration, empty leaves it unset.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if io_scheduling_class and io_scheduling_class not in IO_SCHEDULING_CLASSES:
+        return (
+            f"Io_scheduling_class must be one of {', '.join(sorted(IO_SCHEDULING_CLASSES))}, "
+            f"got {io_scheduling_class}"
+        )
+    return None
+
+
+def parse_api_microversions(api_microversions: str) -> dict[str, str]:
+    """Parse api_microversions configuration, e.g. "compute=2.87,volume=3.64".
+
+    Raise ValueError if an entry is not in the service=version format.
+    """
+    microversions = {}
+    for entry in api_microversions.split(","):
+        if not entry.strip():
+            continue
+        service, sep, version = entry.partition("=")
+        if not sep:
+            raise ValueError(f"expected service=version, got {entry.strip()}")
+        microversions[service.strip()] = version.strip()
+    return microversions
+
+
+def validate_api_microversions(api_microversions: str) -> Optional[str]:
+    """Validate api_microversions configuration against the known-good microversions.
+
+    Return error message if invalid, None if valid.
+
+    """
+    try:
+        microversions = parse_api_microversions(api_microversions)
+    except ValueError as err:
+        return f"Api_microversions is not in a valid format: {err}"
+
+    for service, version in microversions.items():
+        if service not in API_MICROVERSIONS:
+            return (
+                f"Api_microversions service must be one of {', '.join(API_MICROVERSIONS)}, "
+                f"got {service}"
+            )
+        major, lowest, highest = API_MICROVERSIONS[service]
+        match = re.fullmatch(r"(\d+)\.(\d+)", version)
+        if not match or int(match[1]) != major or not lowest <= int(match[2]) <= highest:
+            return (
+                f"Api_microversions {service} must be between {major}.{lowest} and "
+                f"{major}.{highest}, got {version}"
+            )
+    return None
+
+
+def parse_refresh_window(refresh_window: str) -> tuple[int, int]:
+    """Parse snap_refresh_window configuration into its start and end minutes of the day.
+
+    Raise ValueError if the window is not in the HH:MM-HH:MM format.
+    """
+    match = re.fullmatch(REFRESH_WINDOW_PATTERN, refresh_window)
+    if not match:
+        raise ValueError(refresh_window)
+    start_hour, start_minute, end_hour, end_minute = map(int, match.groups())
+    return start_hour * 60 + start_minute, end_hour * 60 + end_minute
+
+
+def validate_refresh_window(refresh_window: str) -> Optional[str]:
+    """Validate snap_refresh_window configuration, empty means no window.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if not refresh_window:
+        return None
+    try:
+        start, end = parse_refresh_window(refresh_window)
+    except ValueError:
+        return f"Snap_refresh_window must be in the HH:MM-HH:MM format, got {refresh_window}"
+    if start == end:
+        return f"Snap_refresh_window must not be empty, got {refresh_window}"
+    return None
+
+
+def validate_snap_revision(snap_revision: str) -> Optional[str]:
+    """Validate snap_revision configuration, empty follows the channel.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if snap_revision and not snap_revision.isdigit():
+        return f"Snap_revision must be a store revision number, got {snap_revision}"
+    return None
+
+
+def validate_probe_timeout(probe_timeout: int) -> Optional[str]:
+    """Validate probe_timeout configuration.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if not 1 <= probe_timeout <= MAX_PROBE_TIMEOUT:
+        return f"Probe_timeout must be between 1 and {MAX_PROBE_TIMEOUT}, got {probe_timeout}"
+    return None
+
+
+def validate_probe_latency_threshold(probe_latency_threshold: float) -> Optional[str]:
+    """Validate probe_latency_threshold configuration, 0 disables the check.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if probe_latency_threshold < 0:
+        return f"Probe_latency_threshold must be non-negative, got {probe_latency_threshold}"
+    return None
+
+
+def validate_probe_empty_threshold(probe_empty_threshold: int) -> Optional[str]:
+    """Validate probe_empty_threshold configuration, 0 disables the check.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if probe_empty_threshold < 0:
+        return f"Probe_empty_threshold must be non-negative, got {probe_empty_threshold}"
+    return None
+
+
+def validate_capacity_rules_interval(capacity_rules_interval: str) -> Optional[str]:
+    """Validate capacity_rules_interval configuration, a Prometheus duration.
+
+    Return error message if invalid, None if valid.
+
+    """
+    if not re.fullmatch(PROMETHEUS_DURATION_PATTERN, capacity_rules_interval) or not any(
+        int(number) for number in re.findall(r"\d+", capacity_rules_interval)
+    ):
+        return (
+            "Capacity_rules_interval must be a non-zero Prometheus duration, e.g. 1m or 30s, "
+            f"got {capacity_rules_interval}"
+        )
+    seconds = sum(
+        int(number) * PROMETHEUS_DURATION_UNITS[unit]
+        for number, unit in re.findall(r"(\d+)([a-z]+)", capacity_rules_interval)
+    )
+    if seconds > MAX_CAPACITY_RULES_INTERVAL:
+        return (
+            f"Capacity_rules_interval must be at most {MAX_CAPACITY_RULES_INTERVAL // 60}m, "
+            f"the lookback of the dashboard queries, got {capacity_rules_interval}"
+        )
+    return None
+
+
 def validate_cache_ttl(cache_ttl: str) -> Optional[str]:
     """Validate cache_ttl configuration.
 
@@ -0,0 +1,138 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+r"""Measure the exporter collection time and memory against fake large clouds.
+
+The clouds.yaml and the environment of the exporter are rendered by the charm itself, from the
+given charm config, and point the exporter at the fake OpenStack APIs. The exporter binary is
+run on localhost with its cache disabled, so each scrape collects from the APIs. Usage:
+
+    python tests/benchmark/benchmark_collection.py --servers 1000 10000 50000 \\
+        --exporter /snap/charmed-openstack-exporter/current/bin/openstack-exporter \\
+        --config api_microversions=compute=2.87,volume=3.64
+"""
+
+import argparse
+import contextlib
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import yaml
+from fake_openstack import FakeOpenStack, Scale
+from ops.testing import Harness
+
+import charm
+from scrape import probe
+from service import wait_exporter_serving
+
+EXPORTER_PORT = 19180
+ENVIRONMENT_PATTERN = re.compile(r'^Environment="([^=]+)=(.*)"$', re.MULTILINE)
+
+
+def render_exporter_config(url: str, config: dict[str, Any], tmp: Path) -> dict[str, str]:
+    """Render the clouds.yaml with the charm and return the environment of the exporter."""
+    host, port = url.rsplit("/", 1)[-1].split(":")
+    keystone_data = {
+        "service_protocol": "http",
+        "service_hostname": host,
+        "service_port": port,
+        "service_region": "RegionOne",
+        "service_username": "admin",
+        "service_password": "password",
+        "service_project_name": "admin",
+        "service_project_domain_name": "admin_domain",
+        "service_user_domain_name": "admin_domain",
+    }
+    # keep the files the charm writes on the host in the temporary directory, as the unit tests
+    paths = {
+        "charm.OS_CLIENT_CONFIG": tmp / "clouds.yaml",
+        "charm.OS_CLIENT_CONFIG_CACERT": tmp / "ca.pem",
+        "ssdlc.SSDLC_LOG_FILE": tmp / "ssdlc.log",
+        "instrumentation.METRICS_DIR": tmp / "metrics",
+        "instrumentation.METRICS_FILE": tmp / "metrics" / "metrics.txt",
+        "alert_rules.RULES_DIR": tmp / "alert-rules",
+        "charm.RULES_DIR": tmp / "alert-rules",
+        "dashboards.DASHBOARDS_DIR": tmp / "dashboards",
+        "charm.DASHBOARDS_DIR": tmp / "dashboards",
+    }
+    with contextlib.ExitStack() as stack:
+        for target, path in paths.items():
+            stack.enter_context(mock.patch(target, path))
+        harness = Harness(charm.OpenstackExporterOperatorCharm)
+        harness.update_config(config)
+        harness.begin()
+        harness.charm._write_cloud_config(keystone_data)
+        drop_in = harness.charm._service_drop_in()
+        harness.cleanup()
+    return dict(ENVIRONMENT_PATTERN.findall(drop_in))
+
+
+def peak_memory_mb(pid: int) -> float:
+    """Return the peak resident memory of a process, in megabytes."""
+    status = Path(f"/proc/{pid}/status").read_text()
+    match = re.search(r"^VmHWM:\s+(\d+) kB", status, re.MULTILINE)
+    return int(match[1]) / 1024 if match else 0.0
+
+
+def measure(exporter: str, servers: int, config: dict[str, Any], scrapes: int) -> None:
+    """Run the exporter against a fake cloud of this many servers and report the scrapes."""
+    cloud = FakeOpenStack(Scale(servers))
+    threading.Thread(target=cloud.serve_forever, daemon=True).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        environment = render_exporter_config(cloud.url, config, Path(tmp))
+        command = [
+            exporter,
+            f"--os-client-config={tmp}/clouds.yaml",
+            f"--web.listen-address=127.0.0.1:{EXPORTER_PORT}",
+            charm.CLOUD_NAME,
+        ]
+        with subprocess.Popen(
+            command,
+            env={**os.environ, **environment},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ) as process:
+            try:
+                wait_exporter_serving(EXPORTER_PORT, timeout=600, interval=1)
+                for attempt in range(1, scrapes + 1):
+                    result = probe(EXPORTER_PORT, timeout=600)
+                    print(
+                        f"{servers:7d} servers, scrape {attempt}: {result['latency']:7.2f}s, "
+                        f"{result['bytes'] / (1 << 20):7.1f} MB, {result['series']:8d} series, "
+                        f"peak memory {peak_memory_mb(process.pid):7.1f} MB"
+                        + (f", error: {result['error']}" if result["error"] else "")
+                    )
+            finally:
+                process.terminate()
+    requests = ", ".join(f"{service}={count}" for service, count in sorted(cloud.requests.items()))
+    print(f"{servers:7d} servers, API requests: {requests}")
+    cloud.shutdown()
+    cloud.server_close()
+
+
+def main() -> None:
+    """Measure the exporter against fake clouds of the given sizes."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--exporter", default="openstack-exporter")
+    parser.add_argument("--servers", type=int, nargs="+", default=[Scale.servers])
+    parser.add_argument("--scrapes", type=int, default=3)
+    parser.add_argument(
+        "--config", action="append", default=[], help="charm config option, as key=value"
+    )
+    args = parser.parse_args()
+
+    config = {
+        key: yaml.safe_load(value)
+        for key, value in (option.split("=", 1) for option in args.config)
+    }
+    for servers in args.servers:
+        measure(args.exporter, servers, config, args.scrapes)
+
+
+if __name__ == "__main__":
+    main()
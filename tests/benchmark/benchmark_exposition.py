@@ -0,0 +1,90 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Benchmark the streaming exposition parser over generated metrics files.
+
+The metrics mimic a large cloud: a neutron port and a nova server status per instance, with
+the label sets of the exporter, plus a few histograms. Usage:
+
+    python tests/benchmark/benchmark_exposition.py --size-mb 200 300
+"""
+
+import argparse
+import random
+import resource
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from exposition import iter_lines, parse_samples
+
+FAMILY = "openstack_request_duration_seconds"
+LINES = [
+    "# HELP openstack_neutron_port port\n",
+    "# TYPE openstack_neutron_port gauge\n",
+    "# HELP openstack_nova_server_status server status\n",
+    "# TYPE openstack_nova_server_status gauge\n",
+    f"# TYPE {FAMILY} histogram\n",
+]
+
+
+def generate(path: Path, size_mb: int) -> None:
+    """Write a metrics file of about `size_mb` megabytes."""
+    rng = random.Random(size_mb)
+    limit = size_mb << 20
+    with path.open("w") as metrics:
+        size = sum(metrics.write(line) for line in LINES)
+        instance = 0
+        while size < limit:
+            instance += 1
+            project = f"{rng.randrange(500):032x}"
+            uuid = f"{instance:032x}"
+            size += metrics.write(
+                f'openstack_neutron_port{{admin_state_up="true",binding_vif_type="ovs",'
+                f'device_owner="compute:nova",fixed_ips="10.{instance >> 16 & 255}.'
+                f'{instance >> 8 & 255}.{instance & 255}",mac_address="fa:16:3e:{instance:06x}",'
+                f'network_id="{project}",uuid="{uuid}"}} 1\n'
+                f'openstack_nova_server_status{{availability_zone="nova",flavor_id="m1.small",'
+                f'host_id="{rng.randrange(1000):056x}",id="{uuid}",name="instance-{instance}",'
+                f'status="ACTIVE",tenant_id="{project}"}} 0\n'
+            )
+            if instance % 1000 == 0:
+                size += metrics.write(
+                    f'{FAMILY}_bucket{{le="0.5"}} {instance}\n'
+                    f'{FAMILY}_bucket{{le="+Inf"}} {instance}\n'
+                    f"{FAMILY}_sum {instance * 0.1}\n{FAMILY}_count {instance}\n"
+                )
+
+
+def measure(path: Path, families: Optional[set[str]]) -> tuple[int, float]:
+    """Parse the file and return the number of samples and the elapsed seconds."""
+    start = time.monotonic()
+    with path.open("rb") as metrics:
+        count = sum(1 for _ in parse_samples(iter_lines(metrics), families))
+    return count, time.monotonic() - start
+
+
+def main() -> None:
+    """Generate the metrics files and report the parsing throughput and peak memory."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, nargs="+", default=[200])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in args.size_mb:
+            path = Path(tmp, f"metrics-{size_mb}.txt")
+            generate(path, size_mb)
+            real_mb = path.stat().st_size / (1 << 20)
+            for label, families in [("all", None), ("filtered", {FAMILY})]:
+                count, elapsed = measure(path, families)
+                print(
+                    f"{real_mb:7.1f} MB {label:>8}: {count:9d} samples in {elapsed:6.2f}s, "
+                    f"{real_mb / elapsed:6.1f} MB/s, {count / elapsed:9.0f} samples/s"
+                )
+            path.unlink()
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"peak resident memory: {peak_mb:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
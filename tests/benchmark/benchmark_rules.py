@@ -0,0 +1,197 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Rank the alert and recording rules by their evaluation time in the rule engine of the tests.
+
+The series are those the exporter reports for a cloud of the given scale, with the label sets
+of the exporter: two ports and a libvirt domain per server, the agents and placement resources
+of each hypervisor, and the limits and networks of each project. The rules are evaluated in
+the order of their groups, so the recording rules the others use are populated, with the rule
+engine of the unit tests.
+
+The timings are those of the Python engine, not of Prometheus: they rank the rules by the
+series they select and join, which drive the cost in both, but say nothing of how long
+Prometheus takes. Usage:
+
+    python tests/benchmark/benchmark_rules.py --servers 10000 100000
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Iterator
+
+from fake_openstack import Scale, resource_id
+
+# the rule engine is a module of the unit tests, run as a script from anywhere
+sys.path.append(str(Path(__file__).parents[1] / "unit"))
+from rule_engine import Engine, Labels, RuleEvaluator, load_rule_groups  # noqa: E402
+
+RULES_DIR = Path(__file__).parents[2] / "src" / "prometheus_alert_rules"
+EVALUATION_TIME = 3600.0
+EXPORTER_UNIT = "openstack-exporter/0"
+SERVICES = ["identity", "nova", "neutron", "cinder", "glance", "placement", "loadbalancer"]
+RESOURCE_CLASSES = {"VCPU": 64, "MEMORY_MB": 262144, "DISK_GB": 4096}
+
+
+def series(metric: str, /, **labels: str) -> Labels:
+    """Return the labels of a series, as the exporter unit of the charm reports it."""
+    return tuple(sorted({**labels, "__name__": metric, "juju_unit": EXPORTER_UNIT}.items()))
+
+
+def generate(scale: Scale, rng: random.Random) -> Iterator[tuple[Labels, float]]:  # noqa: C901
+    """Yield the series of a cloud of this scale, with their value."""
+    for service in SERVICES:
+        yield series(f"openstack_{service}_up"), 1.0
+
+    for index in range(scale.hypervisors):
+        hostname = f"compute-{index}"
+        aggregates = f"az{index % 3}"
+        yield (
+            series("openstack_nova_vcpus_available", hostname=hostname, aggregates=aggregates),
+            64,
+        )
+        for service, metric in [
+            ("nova-compute", "openstack_nova_agent_state"),
+            ("ovn-controller", "openstack_neutron_agent_state"),
+            ("cinder-volume", "openstack_cinder_agent_state"),
+        ]:
+            up = float(rng.random() > 0.01)
+            yield series(metric, adminState="enabled", hostname=hostname, service=service), up
+        for resourcetype, total in RESOURCE_CLASSES.items():
+            labels = {"hostname": hostname, "resourcetype": resourcetype}
+            yield series("openstack_placement_resource_total", **labels), total
+            yield series("openstack_placement_resource_reserved", **labels), total * 0.05
+            yield series("openstack_placement_resource_allocation_ratio", **labels), 1.5
+            yield series("openstack_placement_resource_usage", **labels), total * rng.random()
+
+    for index in range(scale.projects):
+        project = {"tenant": f"project-{index}", "tenant_id": resource_id(1, index)}
+        for metric, value in [
+            ("openstack_nova_limits_instances_used", 20),
+            ("openstack_nova_limits_instances_max", 50),
+            ("openstack_nova_limits_vcpus_used", 40),
+            ("openstack_nova_limits_vcpus_max", 200),
+            ("openstack_nova_limits_memory_used", 81920),
+            ("openstack_nova_limits_memory_max", 512000),
+            ("openstack_cinder_limits_volume_used_gb", 200),
+            ("openstack_cinder_limits_volume_max_gb", 1000),
+            ("openstack_cinder_limits_backup_used_gb", 0),
+            ("openstack_cinder_limits_backup_max_gb", 1000),
+        ]:
+            yield series(metric, **project), value
+        for subnet in range(2):
+            labels = {
+                "network_id": resource_id(2, index),
+                "project_id": project["tenant_id"],
+                "subnet_name": f"subnet-{index}-{subnet}",
+            }
+            yield series("openstack_neutron_network_ip_availabilities_used", **labels), 20
+            yield series("openstack_neutron_network_ip_availabilities_total", **labels), 253
+
+    for index in range(scale.servers):
+        project = resource_id(1, index % scale.projects)
+        for port in range(2):
+            failed = index % 1000 == 0 and port == 0
+            yield (
+                series(
+                    "openstack_neutron_port",
+                    admin_state_up="true",
+                    binding_vif_type="binding_failed" if failed else "ovs",
+                    device_owner="compute:nova",
+                    mac_address=f"fa:16:3e:{index:05x}{port}",
+                    network_id=resource_id(2, index % scale.projects),
+                    uuid=resource_id(3, index * 2 + port),
+                ),
+                1.0,
+            )
+        yield (
+            series(
+                "libvirt_domain_info_meta",
+                domain=f"instance-{index:08x}",
+                instance_name=f"server-{index}",
+                project_name=f"project-{index % scale.projects}",
+                project_uuid=project,
+            ),
+            1.0,
+        )
+        if index % 10 == 0:
+            yield (
+                series(
+                    "openstack_neutron_floating_ip",
+                    floating_ip_address=f"198.51.{index >> 8 & 255}.{index & 255}",
+                    id=resource_id(4, index),
+                    project_id=project,
+                ),
+                1.0,
+            )
+
+    for index in range(scale.loadbalancers):
+        status = "ERROR" if index % 50 == 0 else "ACTIVE"
+        yield (
+            series(
+                "openstack_loadbalancer_loadbalancer_status",
+                id=resource_id(5, index),
+                name=f"lb-{index}",
+                operating_status="ONLINE",
+                project_id=resource_id(1, index % scale.projects),
+                provider="amphora",
+                provisioning_status=status,
+                vip_address=f"10.1.{index >> 8 & 255}.{index & 255}",
+            ),
+            2.0,
+        )
+
+
+def load(scale: Scale, samples: int, step: float) -> tuple[Engine, int]:
+    """Return an engine with the series of the cloud, sampled until the evaluation time."""
+    engine = Engine()
+    count = 0
+    for labels, value in generate(scale, random.Random(scale.servers)):
+        for sample in range(samples):
+            engine.add(labels, EVALUATION_TIME - step * (samples - 1 - sample), float(value))
+        count += 1
+    return engine, count
+
+
+def measure(servers: int, samples: int, step: float, top: int) -> None:
+    """Evaluate the rules once and report the slowest ones."""
+    scale = Scale(servers=servers, projects=max(servers // 20, 1))
+    start = time.monotonic()
+    engine, count = load(scale, samples, step)
+    print(f"{servers} servers: {count} series generated in {time.monotonic() - start:.1f}s")
+    print("  evaluation time in the rule engine of the tests, not in Prometheus:")
+
+    groups = load_rule_groups(sorted(RULES_DIR.glob("*.yaml")))
+    evaluator = RuleEvaluator(engine, groups)
+    timings = []
+    for group in groups:
+        for rule in group.rules:
+            start = time.perf_counter()
+            evaluator.evaluate_rule(rule, EVALUATION_TIME)
+            timings.append((time.perf_counter() - start, group.name, rule.name))
+
+    timings.sort(reverse=True)
+    for elapsed, group_name, rule_name in timings[:top]:
+        print(f"  {elapsed * 1000:9.1f} ms  {group_name}: {rule_name}")
+    print(
+        f"  {sum(elapsed for elapsed, _, _ in timings) * 1000:9.1f} ms  all {len(timings)} rules"
+    )
+
+
+def main() -> None:
+    """Generate the clouds and report the evaluation time of each rule in the rule engine."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", type=int, nargs="+", default=[100000])
+    parser.add_argument("--samples", type=int, default=2, help="samples per series")
+    parser.add_argument("--step", type=float, default=300, help="seconds between samples")
+    parser.add_argument("--top", type=int, default=20, help="number of rules reported")
+    args = parser.parse_args()
+
+    for servers in args.servers:
+        measure(servers, args.samples, args.step, args.top)
+
+
+if __name__ == "__main__":
+    main()
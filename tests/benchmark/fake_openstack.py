@@ -0,0 +1,490 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Fake OpenStack APIs of a large cloud, to measure the exporter collection offline.
+
+A single HTTP server stands in for keystone and the nova, neutron, cinder, glance, placement
+and octavia list endpoints the exporter queries. The resources are generated on the fly from
+their index, so the same scale always gives the same cloud and nothing is held in memory. The
+lists are paginated with limit and marker, and the microversion headers are negotiated.
+Usage:
+
+    python tests/benchmark/fake_openstack.py --servers 20000 --port 5000
+"""
+
+import argparse
+import json
+import re
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+CREATED = "2025-01-01T00:00:00Z"
+DEFAULT_LIMIT = 1000
+# Highest microversion of each service, and the header names it is negotiated with
+MICROVERSIONS = {
+    "compute": ("2.96", "X-OpenStack-Nova-API-Version"),
+    "volume": ("3.70", None),
+    "placement": ("1.39", None),
+}
+SERVER_STATUSES = ["ACTIVE"] * 17 + ["SHUTOFF", "ERROR", "BUILD"]
+PORT_OWNERS = ["compute:nova", "compute:nova", "network:dhcp", "network:router_interface"]
+VOLUME_STATUSES = ["in-use"] * 8 + ["available", "error"]
+LB_STATUSES = ["ONLINE"] * 9 + ["ERROR"]
+
+
+def resource_id(kind: int, index: int) -> str:
+    """Return the UUID of the resource of this kind and index, which can be decoded back."""
+    return str(uuid.UUID(int=(kind << 64) | index))
+
+
+def resource_index(marker: str) -> int:
+    """Return the index of the resource a marker UUID refers to."""
+    return uuid.UUID(marker).int & ((1 << 64) - 1)
+
+
+@dataclass(frozen=True)
+class Scale:
+    """Number of resources of the fake cloud."""
+
+    servers: int = 10000
+    projects: int = 500
+
+    @property
+    def ports(self) -> int:
+        """Two ports per server."""
+        return self.servers * 2
+
+    @property
+    def volumes(self) -> int:
+        """A volume per server."""
+        return self.servers
+
+    @property
+    def hypervisors(self) -> int:
+        """Fifty servers per hypervisor."""
+        return max(self.servers // 50, 1)
+
+    @property
+    def images(self) -> int:
+        """An image per ten projects."""
+        return max(self.projects // 10, 1)
+
+    @property
+    def loadbalancers(self) -> int:
+        """A load balancer per hundred servers."""
+        return max(self.servers // 100, 1)
+
+
+class FakeCloud:
+    """Generate the resources of a cloud of the given scale."""
+
+    def __init__(self, scale: Scale) -> None:
+        self.scale = scale
+
+    def project(self, index: int) -> str:
+        """Return the project ID of a resource."""
+        return resource_id(1, index % self.scale.projects).replace("-", "")
+
+    def hypervisor(self, index: int) -> dict[str, Any]:
+        """Return a hypervisor."""
+        return {
+            "id": resource_id(2, index),
+            "hypervisor_hostname": f"compute-{index}.maas",
+            "hypervisor_type": "QEMU",
+            "host_ip": f"10.0.{index >> 8 & 255}.{index & 255}",
+            "state": "up",
+            "status": "enabled",
+            "vcpus": 64,
+            "vcpus_used": 50,
+            "memory_mb": 262144,
+            "memory_mb_used": 204800,
+            "local_gb": 2048,
+            "local_gb_used": 1024,
+            "running_vms": 50,
+            "service": {"host": f"compute-{index}", "id": resource_id(3, index)},
+        }
+
+    def server(self, index: int) -> dict[str, Any]:
+        """Return a server."""
+        return {
+            "id": resource_id(4, index),
+            "name": f"instance-{index}",
+            "status": SERVER_STATUSES[index % len(SERVER_STATUSES)],
+            "tenant_id": self.project(index),
+            "user_id": self.project(index + 1),
+            "created": CREATED,
+            "updated": CREATED,
+            "flavor": {"original_name": "m1.small", "vcpus": 1, "ram": 2048, "disk": 20},
+            "addresses": {},
+            "metadata": {},
+            "OS-EXT-AZ:availability_zone": "nova",
+            "OS-EXT-SRV-ATTR:host": f"compute-{index % self.scale.hypervisors}",
+            "OS-EXT-SRV-ATTR:hypervisor_hostname": (
+                f"compute-{index % self.scale.hypervisors}.maas"
+            ),
+        }
+
+    def port(self, index: int) -> dict[str, Any]:
+        """Return a port."""
+        network = resource_id(6, index % self.scale.projects)
+        return {
+            "id": resource_id(5, index),
+            "name": "",
+            "network_id": network,
+            "tenant_id": self.project(index // 2),
+            "project_id": self.project(index // 2),
+            "mac_address": f"fa:16:3e:{index >> 16 & 255:02x}:{index >> 8 & 255:02x}:"
+            f"{index & 255:02x}",
+            "device_owner": PORT_OWNERS[index % len(PORT_OWNERS)],
+            "device_id": resource_id(4, index // 2),
+            "status": "ACTIVE",
+            "admin_state_up": True,
+            "binding:vif_type": "ovs",
+            "fixed_ips": [
+                {
+                    "subnet_id": resource_id(7, index % self.scale.projects),
+                    "ip_address": f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}",
+                }
+            ],
+        }
+
+    def network(self, index: int) -> dict[str, Any]:
+        """Return a network."""
+        return {
+            "id": resource_id(6, index),
+            "name": f"network-{index}",
+            "tenant_id": self.project(index),
+            "project_id": self.project(index),
+            "status": "ACTIVE",
+            "subnets": [resource_id(7, index)],
+            "shared": False,
+        }
+
+    def volume(self, index: int) -> dict[str, Any]:
+        """Return a volume."""
+        return {
+            "id": resource_id(8, index),
+            "name": f"volume-{index}",
+            "status": VOLUME_STATUSES[index % len(VOLUME_STATUSES)],
+            "size": 20,
+            "bootable": "false",
+            "volume_type": "ceph",
+            "availability_zone": "nova",
+            "user_id": self.project(index + 1),
+            "os-vol-tenant-attr:tenant_id": self.project(index),
+            "created_at": CREATED,
+            "attachments": [],
+        }
+
+    def image(self, index: int) -> dict[str, Any]:
+        """Return an image."""
+        return {
+            "id": resource_id(9, index),
+            "name": f"image-{index}",
+            "status": "active",
+            "size": 2 << 30,
+            "visibility": "public",
+            "owner": self.project(index),
+            "created_at": CREATED,
+            "updated_at": CREATED,
+        }
+
+    def resource_provider(self, index: int) -> dict[str, Any]:
+        """Return the resource provider of a hypervisor."""
+        return {
+            "uuid": resource_id(2, index),
+            "name": f"compute-{index}.maas",
+            "generation": 1,
+        }
+
+    def loadbalancer(self, index: int) -> dict[str, Any]:
+        """Return a load balancer."""
+        return {
+            "id": resource_id(10, index),
+            "name": f"lb-{index}",
+            "project_id": self.project(index),
+            "provider": "ovn",
+            "vip_address": f"10.1.{index >> 8 & 255}.{index & 255}",
+            "provisioning_status": "ACTIVE",
+            "operating_status": LB_STATUSES[index % len(LB_STATUSES)],
+        }
+
+
+def paginate(
+    make: Callable[[int], dict[str, Any]], count: int, query: dict[str, list[str]]
+) -> tuple[list[dict[str, Any]], Optional[str]]:
+    """Return the page of resources selected by the limit and marker, and the next marker."""
+    limit = int(query.get("limit", [DEFAULT_LIMIT])[0])
+    start = resource_index(query["marker"][0]) + 1 if "marker" in query else 0
+    end = min(start + limit, count)
+    page = [make(index) for index in range(start, end)]
+    return page, (str(page[-1].get("id") or page[-1].get("uuid")) if end < count else None)
+
+
+class FakeOpenStackHandler(BaseHTTPRequestHandler):
+    """Serve the fake OpenStack APIs: keystone at the root, the others under a path per service."""
+
+    server: "FakeOpenStack"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args: Any) -> None:
+        """Keep the requests out of the benchmark output."""
+
+    def _send(
+        self, body: Any, status: int = 200, headers: Optional[dict[str, str]] = None
+    ) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _microversion(self, service: str) -> tuple[Optional[str], dict[str, str]]:
+        """Negotiate the microversion, return it (None if too high) and the response headers."""
+        highest, legacy_header = MICROVERSIONS[service]
+        requested = ""
+        if match := re.match(rf"{service}\s+(\S+)", self.headers.get("OpenStack-API-Version", "")):
+            requested = match[1]
+        elif legacy_header:
+            requested = self.headers.get(legacy_header, "")
+        version = requested or f"{highest.split('.')[0]}.0"
+        if requested == "latest":
+            version = highest
+        headers = {
+            "OpenStack-API-Version": f"{service} {version}",
+            "Vary": "OpenStack-API-Version",
+        }
+        if legacy_header:
+            headers[legacy_header] = version
+        if tuple(map(int, version.split("."))) > tuple(map(int, highest.split("."))):
+            return None, headers
+        return version, headers
+
+    def _list(
+        self,
+        key: str,
+        make: Callable[[int], dict[str, Any]],
+        count: int,
+        query: dict[str, list[str]],
+        headers: Optional[dict[str, str]] = None,
+    ) -> None:
+        page, marker = paginate(make, count, query)
+        body: dict[str, Any] = {key: page}
+        if marker:
+            # the next page keeps the filters of the query, e.g. all_tenants
+            params = {
+                **query,
+                "limit": query.get("limit", [str(DEFAULT_LIMIT)]),
+                "marker": [marker],
+            }
+            url = f"{self.server.url}{urlsplit(self.path).path}?{urlencode(params, doseq=True)}"
+            body[f"{key}_links"] = [{"rel": "next", "href": url}]
+            body["next"] = url
+        self._send(body, headers=headers)
+
+    def do_POST(self) -> None:  # noqa: N802
+        """Issue a token with the service catalog."""
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if urlsplit(self.path).path != "/v3/auth/tokens":
+            self._send({"error": "not found"}, 404)
+            return
+        catalog = [
+            {
+                "type": service_type,
+                "name": name,
+                "endpoints": [
+                    {"interface": interface, "region": "RegionOne", "url": url}
+                    for interface in ("public", "internal", "admin")
+                ],
+            }
+            for service_type, name, url in self.server.catalog()
+        ]
+        token = {
+            "token": {
+                "expires_at": "2099-01-01T00:00:00.000000Z",
+                "issued_at": CREATED,
+                "methods": ["password"],
+                "user": {"id": "admin", "name": "admin", "domain": {"id": "default"}},
+                "project": {"id": self.server.cloud.project(0), "name": "admin"},
+                "roles": [{"id": "admin", "name": "admin"}],
+                "catalog": catalog,
+            }
+        }
+        self._send(token, 201, {"X-Subject-Token": "fake-token"})
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Serve the version documents and the list endpoints."""
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        path = url.path.rstrip("/")
+        service, _, rest = path.lstrip("/").partition("/")
+        if service in ("", "v3"):
+            service, rest = "identity", path.lstrip("/")
+        self.server.requests[service] += 1
+        handler = getattr(self, f"_get_{service.replace('-', '_')}", None)
+        if handler is None or not handler(rest, query):
+            self._send({"error": f"{path} not found"}, 404)
+
+    def _get_identity(self, path: str, query: dict[str, list[str]]) -> bool:
+        cloud = self.server.cloud
+        if path in ("", "v3"):
+            version = {"id": "v3.14", "status": "stable", "links": []}
+            links = [{"rel": "self", "href": f"{self.server.url}/v3/"}]
+            version["links"] = links
+            self._send({"version": version} if path else {"versions": {"values": [version]}})
+        elif path == "v3/projects":
+            self._list(
+                "projects",
+                lambda index: {"id": cloud.project(index), "name": f"project-{index}"},
+                cloud.scale.projects,
+                query,
+            )
+        elif path in ("v3/domains", "v3/regions", "v3/users"):
+            self._send({path[3:]: [{"id": "default", "name": "Default", "enabled": True}]})
+        else:
+            return False
+        return True
+
+    def _get_compute(self, path: str, query: dict[str, list[str]]) -> bool:
+        cloud = self.server.cloud
+        if path == "":
+            highest = MICROVERSIONS["compute"][0]
+            self._send({"versions": [{"id": "v2.1", "version": highest, "min_version": "2.1"}]})
+            return True
+        version, headers = self._microversion("compute")
+        if version is None:
+            self._send({"error": "microversion not supported"}, 406, headers)
+        elif path == "v2.1/servers/detail":
+            self._list("servers", cloud.server, cloud.scale.servers, query, headers)
+        elif path == "v2.1/os-hypervisors/detail":
+            self._list("hypervisors", cloud.hypervisor, cloud.scale.hypervisors, query, headers)
+        elif path == "v2.1/flavors/detail":
+            flavor = {"id": "1", "name": "m1.small", "vcpus": 1, "ram": 2048, "disk": 20}
+            self._send({"flavors": [flavor]}, headers=headers)
+        elif path in ("v2.1/os-services", "v2.1/os-availability-zone/detail"):
+            self._send({"services": [], "availabilityZoneInfo": []}, headers=headers)
+        elif path.startswith("v2.1/limits") or path.startswith("v2.1/os-quota-sets"):
+            self._send({"limits": {"absolute": {}}, "quota_set": {}}, headers=headers)
+        else:
+            return False
+        return True
+
+    def _get_network(self, path: str, query: dict[str, list[str]]) -> bool:
+        cloud = self.server.cloud
+        if path == "v2.0/ports":
+            self._list("ports", cloud.port, cloud.scale.ports, query)
+        elif path == "v2.0/networks":
+            self._list("networks", cloud.network, cloud.scale.projects, query)
+        elif path.startswith("v2.0/"):
+            # subnets, routers, floatingips, agents, security_groups...
+            self._send({path[5:].replace("-", "_"): []})
+        else:
+            return False
+        return True
+
+    def _get_volume(self, path: str, query: dict[str, list[str]]) -> bool:
+        cloud = self.server.cloud
+        version, headers = self._microversion("volume")
+        if version is None:
+            self._send({"error": "microversion not supported"}, 406, headers)
+        elif path.endswith("/volumes/detail"):
+            self._list("volumes", cloud.volume, cloud.scale.volumes, query, headers)
+        elif path.endswith("/snapshots/detail"):
+            self._send({"snapshots": []}, headers=headers)
+        elif path.endswith("/os-services") or path.endswith("/scheduler-stats/get_pools"):
+            self._send({"services": [], "pools": []}, headers=headers)
+        else:
+            return False
+        return True
+
+    def _get_image(self, path: str, query: dict[str, list[str]]) -> bool:
+        if path != "v2/images":
+            return False
+        self._list("images", self.server.cloud.image, self.server.cloud.scale.images, query)
+        return True
+
+    def _get_placement(self, path: str, query: dict[str, list[str]]) -> bool:
+        cloud = self.server.cloud
+        version, headers = self._microversion("placement")
+        if version is None:
+            self._send({"error": "microversion not supported"}, 406, headers)
+        elif path == "resource_providers":
+            # placement lists all the resource providers in a single page
+            providers = [cloud.resource_provider(i) for i in range(cloud.scale.hypervisors)]
+            self._send({"resource_providers": providers}, headers=headers)
+        elif path.endswith("/inventories"):
+            inventory = {"total": 64, "reserved": 0, "allocation_ratio": 4.0}
+            body = {"resource_provider_generation": 1, "inventories": {"VCPU": inventory}}
+            self._send(body, headers=headers)
+        elif path.endswith("/usages"):
+            body = {"resource_provider_generation": 1, "usages": {"VCPU": 50}}
+            self._send(body, headers=headers)
+        else:
+            return False
+        return True
+
+    def _get_load_balancer(self, path: str, query: dict[str, list[str]]) -> bool:
+        cloud = self.server.cloud
+        if path == "v2/lbaas/loadbalancers":
+            self._list("loadbalancers", cloud.loadbalancer, cloud.scale.loadbalancers, query)
+        elif path in ("v2/octavia/amphorae", "v2/lbaas/pools"):
+            self._send({"amphorae": [], "pools": []})
+        else:
+            return False
+        return True
+
+
+class FakeOpenStack(ThreadingHTTPServer):
+    """HTTP server of the fake OpenStack APIs."""
+
+    daemon_threads = True
+
+    def __init__(self, scale: Scale, host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__((host, port), FakeOpenStackHandler)
+        self.cloud = FakeCloud(scale)
+        self.requests: Counter[str] = Counter()
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def catalog(self) -> list[tuple[str, str, str]]:
+        """Return the type, name and URL of the services in the catalog."""
+        project = self.cloud.project(0)
+        return [
+            ("identity", "keystone", f"{self.url}/v3"),
+            ("compute", "nova", f"{self.url}/compute/v2.1"),
+            ("network", "neutron", f"{self.url}/network"),
+            ("volumev3", "cinderv3", f"{self.url}/volume/v3/{project}"),
+            ("image", "glance", f"{self.url}/image"),
+            ("placement", "placement", f"{self.url}/placement"),
+            ("load-balancer", "octavia", f"{self.url}/load-balancer"),
+        ]
+
+
+def main() -> None:
+    """Serve the fake OpenStack APIs until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", type=int, default=Scale.servers)
+    parser.add_argument("--projects", type=int, default=Scale.projects)
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    server = FakeOpenStack(Scale(args.servers, args.projects), port=args.port)
+    print(f"Serving a fake cloud of {args.servers} servers on {server.url}/v3")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
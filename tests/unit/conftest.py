@@ -0,0 +1,20 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolate_host_paths(tmp_path, mocker):
+    """Keep the files the charm writes on the host inside a temporary directory."""
+    mocker.patch("ssdlc.SSDLC_LOG_FILE", tmp_path / "ssdlc.log")
+    mocker.patch("instrumentation.METRICS_DIR", tmp_path / "metrics")
+    mocker.patch("instrumentation.METRICS_FILE", tmp_path / "metrics" / "metrics.txt")
+    mocker.patch("instrumentation.METRICS_SERVICE_FILE", tmp_path / "metrics.service")
+    mocker.patch("service.DROP_IN_DIR", tmp_path / "drop-in")
+    mocker.patch("service.DROP_IN_FILE", tmp_path / "drop-in" / "charm.conf")
+    mocker.patch("service.LEGACY_DROP_IN_FILE", tmp_path / "drop-in" / "bug_268.conf")
+    mocker.patch("alert_rules.RULES_DIR", tmp_path / "alert-rules")
+    mocker.patch("charm.RULES_DIR", tmp_path / "alert-rules")
+    mocker.patch("dashboards.DASHBOARDS_DIR", tmp_path / "dashboards")
+    mocker.patch("charm.DASHBOARDS_DIR", tmp_path / "dashboards")
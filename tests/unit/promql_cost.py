@@ -0,0 +1,187 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Find the expensive PromQL patterns of the dashboards and alert rules.
+
+The checks are heuristics over the expression text, no PromQL parser is needed:
+
+- unbounded-regex: a regex matcher without a literal prefix, e.g. =~".*" or a template
+  variable whose "All" value is .*, or a regex on the metric name. Prometheus has to match the
+  regex against every value of the label in the index.
+- join-without-rollup: a group_left or group_right join where neither side is a recorded
+  series (level:metric:operation), so both sides are selected and matched on every evaluation.
+- high-cardinality-by: an aggregation by a label with a value per resource, e.g. per server or
+  per project, unless the selector pins that label with an equality matcher.
+
+The joins and aggregations of the recording rules are not reported: they are evaluated once per
+interval, that is where the dashboards and alerts should move them.
+
+The known violations are listed in promql_cost_baseline.yaml, the unit tests fail on new ones.
+Print the ranked report with:
+
+    python tests/unit/promql_cost.py
+"""
+
+import json
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Iterator, NamedTuple
+
+import yaml
+
+SRC_DIR = Path(__file__).parents[2] / "src"
+DASHBOARDS_DIR = SRC_DIR / "grafana_dashboards"
+RULES_DIR = SRC_DIR / "prometheus_alert_rules"
+BASELINE = Path(__file__).parent / "promql_cost_baseline.yaml"
+
+WEIGHTS = {"join-without-rollup": 5, "unbounded-regex": 3, "high-cardinality-by": 2}
+# Labels with a value per OpenStack resource
+HIGH_CARDINALITY_LABELS = {
+    "device_id",
+    "domain",
+    "fixed_ips",
+    "id",
+    "instance_name",
+    "mac_address",
+    "name",
+    "network_id",
+    "port_id",
+    "project_id",
+    "tenant_id",
+    "user_id",
+    "uuid",
+}
+STRING_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"')
+REGEX_MATCHER_PATTERN = re.compile(r'(\w+)\s*=~\s*"((?:[^"\\]|\\.)*)"')
+EQUALITY_MATCHER_PATTERN = re.compile(r'(\w+)\s*=\s*"')
+JOIN_PATTERN = re.compile(r"\bgroup_(?:left|right)\b")
+# e.g. openstack:service_up, once the string literals are removed
+RECORDED_SERIES_PATTERN = re.compile(r"\b[a-zA-Z_]\w*:[\w:]+")
+BY_PATTERN = re.compile(r"\bby\s*\(([^)]*)\)")
+
+
+class Expression(NamedTuple):
+    """A PromQL expression of a dashboard panel or an alert rule."""
+
+    source: str
+    location: str
+    expr: str
+    recording: bool = False
+
+
+class Violation(NamedTuple):
+    """An expensive pattern found in an expression."""
+
+    check: str
+    detail: str
+
+
+def _dashboard_variables(dashboard: dict[str, Any]) -> dict[str, str]:
+    """Return the regex "All" value of the dashboard variables, by name."""
+    return {
+        variable["name"]: variable["allValue"]
+        for variable in dashboard.get("templating", {}).get("list", [])
+        if variable.get("includeAll") and variable.get("allValue")
+    }
+
+
+def _panel_expressions(panels: list[dict[str, Any]]) -> Iterator[tuple[str, str]]:
+    """Yield the title and the expression of the panel queries, including the nested panels."""
+    for panel in panels:
+        for target in panel.get("targets", []):
+            if target.get("expr"):
+                yield panel.get("title") or "untitled", target["expr"]
+        yield from _panel_expressions(panel.get("panels", []))
+
+
+def dashboard_expressions() -> Iterator[Expression]:
+    """Yield the expressions of the dashboard panels, with the "All" value of the variables.
+
+    The default value of a variable is its "All" value, that is what a dashboard queries when
+    it is opened.
+    """
+    for path in sorted(DASHBOARDS_DIR.glob("*.json")):
+        dashboard = json.loads(path.read_text())
+        variables = _dashboard_variables(dashboard)
+        for title, expr in _panel_expressions(dashboard.get("panels", [])):
+            for name, value in variables.items():
+                expr = re.sub(rf"\$(?:{name}\b|\{{{name}\}})", value, expr)
+            yield Expression(path.name, title, expr)
+
+
+def rule_expressions() -> Iterator[Expression]:
+    """Yield the expressions of the alerting and recording rules."""
+    for path in sorted(RULES_DIR.glob("*.yaml")):
+        for group in yaml.safe_load(path.read_text())["groups"]:
+            for rule in group["rules"]:
+                name = rule.get("alert") or rule["record"]
+                yield Expression(path.name, name, rule["expr"], recording="record" in rule)
+
+
+def check(expr: str, recording: bool = False) -> list[Violation]:
+    """Return the expensive patterns of an expression, of a recording rule if `recording`."""
+    violations = []
+    for label, regex in REGEX_MATCHER_PATTERN.findall(expr):
+        if label == "__name__" or regex.startswith((".*", ".+")):
+            violations.append(Violation("unbounded-regex", f'{label}=~"{regex}"'))
+    if recording:
+        return violations
+
+    pinned = set(EQUALITY_MATCHER_PATTERN.findall(expr))
+    code = STRING_PATTERN.sub('""', expr)
+    if not RECORDED_SERIES_PATTERN.search(code):
+        violations.extend(
+            Violation("join-without-rollup", join) for join in JOIN_PATTERN.findall(code)
+        )
+    for labels in BY_PATTERN.findall(code):
+        if expensive := sorted(
+            {label.strip() for label in labels.split(",")} & HIGH_CARDINALITY_LABELS - pinned
+        ):
+            violations.append(Violation("high-cardinality-by", f"by({', '.join(expensive)})"))
+    return violations
+
+
+def score(violations: list[Violation]) -> int:
+    """Return the estimated cost of the violations of an expression."""
+    return sum(WEIGHTS[violation.check] for violation in violations)
+
+
+def findings() -> list[tuple[Expression, list[Violation]]]:
+    """Return the expressions with violations, the most expensive first."""
+    found = [
+        (expression, violations)
+        for expression in [*dashboard_expressions(), *rule_expressions()]
+        if (violations := check(expression.expr, expression.recording))
+    ]
+    return sorted(found, key=lambda finding: -score(finding[1]))
+
+
+def violation_counts(found: list[tuple[Expression, list[Violation]]]) -> Counter[str]:
+    """Return the number of violations by source, location and check, as in the baseline."""
+    return Counter(
+        f"{expression.source}: {expression.location}: {violation.check}"
+        for expression, violations in found
+        for violation in violations
+    )
+
+
+def load_baseline() -> Counter[str]:
+    """Return the number of known violations by source, location and check."""
+    return Counter(yaml.safe_load(BASELINE.read_text()) or {})
+
+
+def report(found: list[tuple[Expression, list[Violation]]]) -> str:
+    """Return the ranked report of the violations."""
+    lines = []
+    for rank, (expression, violations) in enumerate(found, start=1):
+        lines.append(
+            f"{rank:3d}. [{score(violations):2d}] {expression.source}: {expression.location}"
+        )
+        lines.extend(f"       {violation.check}: {violation.detail}" for violation in violations)
+    total = sum(score(violations) for _, violations in found)
+    lines.append(f"{len(found)} expressions with violations, total cost {total}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(report(findings()))
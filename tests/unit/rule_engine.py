@@ -0,0 +1,926 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Evaluate the Prometheus rules against synthetic series, as `promtool test rules` does.
+
+The engine supports the subset of PromQL used by the rules of this charm: selectors, the
+*_over_time and absent functions, label_replace, aggregations, and the arithmetic, comparison
+and set operators with their vector matching. It runs the test files of promtool, so the same
+files can also be run by promtool where it is installed:
+
+- input_series use the expanding notation of promtool, e.g. '1+0x10' or '_x5 0'.
+- alert_rule_test compares the firing alerts, labels and annotations, at eval_time.
+- promql_expr_test compares the samples of an expression at eval_time.
+
+Unsupported PromQL raises ValueError rather than being evaluated differently from Prometheus.
+"""
+
+import ast
+import bisect
+import math
+import operator
+import re
+from pathlib import Path
+from typing import Any, Callable, Iterable, NamedTuple, Optional, Union
+
+import yaml
+
+LOOKBACK = 300.0
+# sorted (name, value) pairs, including __name__
+Labels = tuple[tuple[str, str], ...]
+
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "y": 31536000}
+DURATION_PATTERN = re.compile(r"(\d+)(ms|s|m|h|d|w|y)")
+TOKEN_PATTERN = re.compile(
+    r"""\s*(?:
+    (?P<duration>(?:\d+(?:ms|s|m|h|d|w|y))+)(?![\w:])
+    |(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    |(?P<ident>[a-zA-Z_][\w:]*)
+    |(?P<op>==|!=|<=|>=|=~|!~|[-+*/%^<>=(){}\[\],])
+    )""",
+    re.VERBOSE,
+)
+# e.g. '1+2x3', '5x2', '_x4', '_' or '7'
+NUMBER = r"(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?"
+SERIES_VALUE_PATTERN = re.compile(
+    rf"^(?:(?P<blank>_)|(?P<start>-?{NUMBER}|stale))(?:(?P<step>[+-]{NUMBER})?x(?P<times>\d+))?$"
+)
+TEMPLATE_PATTERN = re.compile(
+    r"\{\{\s*(?:\$labels(?:\.(?P<label>\w+))?|(?P<value>\$value))\s*\}\}"
+)
+ANY_TEMPLATE_PATTERN = re.compile(r"\{\{.*?\}\}")
+
+PRECEDENCE = {
+    "or": 1,
+    "and": 2,
+    "unless": 2,
+    "==": 3,
+    "!=": 3,
+    "<": 3,
+    ">": 3,
+    "<=": 3,
+    ">=": 3,
+    "+": 4,
+    "-": 4,
+    "*": 5,
+    "/": 5,
+    "%": 5,
+    "^": 6,
+}
+SET_OPERATORS = {"and", "or", "unless"}
+COMPARISONS: dict[str, Callable[[float, float], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+}
+AGGREGATIONS = {"sum", "min", "max", "avg", "count", "group", "stddev", "topk", "bottomk"}
+OVER_TIME: dict[str, Callable[[list[float]], float]] = {
+    "avg_over_time": lambda values: sum(values) / len(values),
+    "count_over_time": len,
+    "last_over_time": lambda values: values[-1],
+    "max_over_time": max,
+    "min_over_time": min,
+    "sum_over_time": sum,
+}
+
+
+def parse_duration(text: str) -> float:
+    """Return a Prometheus duration, e.g. 1h30m, in seconds."""
+    if not text or DURATION_PATTERN.sub("", text):
+        raise ValueError(f"invalid duration: {text!r}")
+    return sum(
+        int(number) * DURATION_UNITS[unit] for number, unit in DURATION_PATTERN.findall(text)
+    )
+
+
+def _arithmetic(op: str, left: float, right: float) -> float:
+    """Return the result of an arithmetic operator, with the float semantics of Go."""
+    if op == "+":
+        return left + right
+    if op == "-":
+        return left - right
+    if op == "*":
+        return left * right
+    if op == "^":
+        return math.pow(left, right)
+    if right == 0:
+        if op == "%" or left == 0 or math.isnan(left):
+            return math.nan
+        return math.copysign(math.inf, left) * math.copysign(1, right)
+    return left / right if op == "/" else math.fmod(left, right)
+
+
+def without_name(labels: Labels) -> Labels:
+    """Return the labels without the metric name."""
+    return tuple(label for label in labels if label[0] != "__name__")
+
+
+class Sample(NamedTuple):
+    """A sample of an instant vector."""
+
+    labels: Labels
+    value: float
+
+
+class Series(NamedTuple):
+    """The samples of a series in a range, as (timestamp, value) pairs."""
+
+    labels: Labels
+    points: list[tuple[float, float]]
+
+
+Value = Union[float, str, list[Sample], list[Series]]
+
+
+class NumberLiteral(NamedTuple):
+    value: float
+
+
+class StringLiteral(NamedTuple):
+    value: str
+
+
+class Selector(NamedTuple):
+    name: Optional[str]
+    matchers: list[tuple[str, str, str]]
+    range: Optional[float] = None
+
+
+class Call(NamedTuple):
+    function: str
+    args: list[Any]
+
+
+class Aggregate(NamedTuple):
+    operation: str
+    expr: Any
+    param: Any
+    grouping: list[str]
+    without: bool
+
+
+class Matching(NamedTuple):
+    """The vector matching of a binary operator: on (or ignoring) labels, and group labels."""
+
+    on: bool
+    labels: list[str]
+    group: Optional[str] = None
+    include: list[str] = []
+
+
+class Binary(NamedTuple):
+    op: str
+    lhs: Any
+    rhs: Any
+    bool_modifier: bool
+    matching: Matching
+
+
+class Negation(NamedTuple):
+    expr: Any
+
+
+class Parser:
+    """Parse a PromQL expression into a tree of the node tuples above."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens: list[tuple[str, str]] = []
+        position = 0
+        text = re.sub(r"#[^\n]*", "", text).rstrip()
+        while position < len(text):
+            match = TOKEN_PATTERN.match(text, position)
+            if not match or match.end() == position:
+                raise ValueError(f"unexpected character at {position} in: {self.text}")
+            kind = match.lastgroup
+            assert kind is not None
+            self.tokens.append((kind, match[kind]))
+            position = match.end()
+        self.position = 0
+
+    def peek(self) -> str:
+        """Return the text of the next token, or an empty string at the end."""
+        return self.tokens[self.position][1] if self.position < len(self.tokens) else ""
+
+    def take(self, kind: Optional[str] = None) -> str:
+        """Return the text of the next token, checking its kind."""
+        if self.position >= len(self.tokens):
+            raise ValueError(f"unexpected end of: {self.text}")
+        token_kind, text = self.tokens[self.position]
+        if kind and token_kind != kind:
+            raise ValueError(f"expected {kind}, got {text!r} in: {self.text}")
+        self.position += 1
+        return text
+
+    def accept(self, text: str) -> bool:
+        """Consume the next token if it is the given text."""
+        if self.peek() == text:
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, text: str) -> None:
+        """Consume the next token, which must be the given text."""
+        if not self.accept(text):
+            raise ValueError(f"expected {text!r}, got {self.peek()!r} in: {self.text}")
+
+    def parse(self) -> Any:
+        """Parse the whole expression."""
+        node = self.expression(1)
+        if self.position != len(self.tokens):
+            raise ValueError(f"unexpected {self.peek()!r} in: {self.text}")
+        return node
+
+    def expression(self, min_precedence: int) -> Any:
+        """Parse binary operators of at least the given precedence, by precedence climbing."""
+        lhs = self.unary()
+        while (op := self.peek()) in PRECEDENCE and PRECEDENCE[op] >= min_precedence:
+            self.position += 1
+            bool_modifier = self.accept("bool")
+            matching = Matching(on=False, labels=[])
+            if self.peek() in ("on", "ignoring"):
+                on = self.take() == "on"
+                matching = Matching(on=on, labels=self.label_list())
+                if self.peek() in ("group_left", "group_right"):
+                    group = self.take()
+                    include = self.label_list() if self.peek() == "(" else []
+                    matching = matching._replace(group=group, include=include)
+            # ^ is right associative, the other operators are left associative
+            rhs = self.expression(PRECEDENCE[op] + (op != "^"))
+            lhs = Binary(op, lhs, rhs, bool_modifier, matching)
+        return lhs
+
+    def unary(self) -> Any:
+        """Parse an expression with an optional sign."""
+        if self.accept("-"):
+            return Negation(self.unary())
+        self.accept("+")
+        return self.primary()
+
+    def label_list(self) -> list[str]:
+        """Parse a parenthesised list of label names."""
+        self.expect("(")
+        labels = []
+        while not self.accept(")"):
+            labels.append(self.take("ident"))
+            if not self.accept(","):
+                self.expect(")")
+                break
+        return labels
+
+    def primary(self) -> Any:
+        """Parse a literal, a parenthesised expression, a call, an aggregation or a selector."""
+        kind, text = self.tokens[self.position] if self.position < len(self.tokens) else ("", "")
+        if kind == "number":
+            self.position += 1
+            return NumberLiteral(float(text))
+        if kind == "string":
+            self.position += 1
+            return StringLiteral(ast.literal_eval(text))
+        if self.accept("("):
+            node = self.expression(1)
+            self.expect(")")
+            return node
+        following = (
+            self.tokens[self.position + 1][1] if self.position + 1 < len(self.tokens) else ""
+        )
+        if kind == "ident" and text in AGGREGATIONS and following in ("(", "by", "without"):
+            self.position += 1
+            return self.aggregate(text)
+        if kind == "ident" and following == "(":
+            self.position += 2
+            args = []
+            while not self.accept(")"):
+                args.append(self.expression(1))
+                if not self.accept(","):
+                    self.expect(")")
+                    break
+            return Call(text, args)
+        if kind == "ident" or text == "{":
+            return self.selector()
+        raise ValueError(f"unexpected {text!r} in: {self.text}")
+
+    def aggregate(self, operation: str) -> Aggregate:
+        """Parse an aggregation, with its grouping before or after its arguments."""
+        grouping, without = [], False
+        if self.peek() in ("by", "without"):
+            without = self.take() == "without"
+            grouping = self.label_list()
+        self.expect("(")
+        param = None
+        if operation in ("topk", "bottomk"):
+            param = self.expression(1)
+            self.expect(",")
+        expr = self.expression(1)
+        self.expect(")")
+        if self.peek() in ("by", "without"):
+            without = self.take() == "without"
+            grouping = self.label_list()
+        return Aggregate(operation, expr, param, grouping, without)
+
+    def selector(self) -> Selector:
+        """Parse a vector selector, with an optional range."""
+        name = None if self.peek() == "{" else self.take("ident")
+        matchers = []
+        if self.accept("{"):
+            while not self.accept("}"):
+                label = self.take("ident")
+                match_op = self.take("op")
+                if match_op not in ("=", "!=", "=~", "!~"):
+                    raise ValueError(f"invalid matcher {match_op!r} in: {self.text}")
+                matchers.append((label, match_op, ast.literal_eval(self.take("string"))))
+                if not self.accept(","):
+                    self.expect("}")
+                    break
+        if name is not None:
+            matchers.insert(0, ("__name__", "=", name))
+        duration = None
+        if self.accept("["):
+            duration = parse_duration(self.take("duration"))
+            self.expect("]")
+        if self.peek() in ("offset", "@"):
+            raise ValueError(f"unsupported modifier {self.peek()!r} in: {self.text}")
+        return Selector(name, matchers, duration)
+
+
+def parse(text: str) -> Any:
+    """Parse a PromQL expression."""
+    return Parser(text).parse()
+
+
+def parse_series(text: str) -> Labels:
+    """Return the labels of a series written as a selector, e.g. up{job="a"}."""
+    node = parse(text)
+    if not isinstance(node, Selector) or any(op != "=" for _, op, _ in node.matchers):
+        raise ValueError(f"invalid series: {text}")
+    return tuple(sorted((label, value) for label, _, value in node.matchers))
+
+
+def expand_values(text: str) -> list[Optional[float]]:
+    """Return the values of the expanding notation of promtool, None for the missing ones."""
+    values: list[Optional[float]] = []
+    for token in str(text).split():
+        match = SERIES_VALUE_PATTERN.match(token)
+        if not match:
+            raise ValueError(f"invalid series value: {token}")
+        times = int(match["times"]) if match["times"] else 0
+        if match["blank"] or match["start"] == "stale":
+            values.extend([None] * (times + 1 if match["times"] else 1))
+            continue
+        start, step = float(match["start"]), float(match["step"] or 0)
+        values.extend(start + step * index for index in range(times + 1))
+    return values
+
+
+class _Stored:
+    """The samples of a series in the storage."""
+
+    __slots__ = ("labels", "label_map", "times", "values")
+
+    def __init__(self, labels: Labels):
+        self.labels = labels
+        self.label_map = dict(labels)
+        self.times: list[float] = []
+        self.values: list[float] = []
+
+
+class Engine:
+    """Store the series and evaluate PromQL expressions at a timestamp, in seconds."""
+
+    def __init__(self) -> None:
+        self._series: dict[Labels, _Stored] = {}
+        self._by_name: dict[str, list[_Stored]] = {}
+
+    def add(self, labels: Labels, timestamp: float, value: float) -> None:
+        """Append a sample to a series, after its last sample."""
+        stored = self._series.get(labels)
+        if stored is None:
+            stored = self._series[labels] = _Stored(labels)
+            self._by_name.setdefault(stored.label_map.get("__name__", ""), []).append(stored)
+        stored.times.append(timestamp)
+        stored.values.append(value)
+
+    def load(self, series: str, values: str, interval: float) -> None:
+        """Add a series in the notation of the promtool input_series."""
+        labels = parse_series(series)
+        for index, value in enumerate(expand_values(values)):
+            if value is not None:
+                self.add(labels, index * interval, value)
+
+    def query(self, text: str, timestamp: float) -> Value:
+        """Evaluate an expression."""
+        return self.evaluate(parse(text), timestamp)
+
+    def evaluate(self, node: Any, timestamp: float) -> Value:  # noqa: C901
+        """Evaluate a parsed expression."""
+        if isinstance(node, NumberLiteral):
+            return node.value
+        if isinstance(node, StringLiteral):
+            return node.value
+        if isinstance(node, Selector):
+            return self._select(node, timestamp)
+        if isinstance(node, Negation):
+            value = self.evaluate(node.expr, timestamp)
+            if isinstance(value, float):
+                return -value
+            return [Sample(without_name(s.labels), -s.value) for s in _vector(value)]
+        if isinstance(node, Call):
+            return self._call(node, timestamp)
+        if isinstance(node, Aggregate):
+            return self._aggregate(node, timestamp)
+        if isinstance(node, Binary):
+            return self._binary(node, timestamp)
+        raise ValueError(f"unsupported expression: {node}")
+
+    def _candidates(self, selector: Selector) -> Iterable[_Stored]:
+        """Return the series that may match a selector."""
+        if selector.name is not None:
+            return self._by_name.get(selector.name, [])
+        return self._series.values()
+
+    def _select(self, selector: Selector, timestamp: float) -> Union[list[Sample], list[Series]]:
+        """Return the samples of the matching series, in the lookback window or the range."""
+        tests = []
+        for label, match_op, value in selector.matchers:
+            if match_op in ("=~", "!~"):
+                pattern = re.compile(value)
+                positive = match_op == "=~"
+                tests.append((
+                    label,
+                    lambda v, p=pattern, pos=positive: bool(p.fullmatch(v)) == pos,
+                ))
+            else:
+                positive = match_op == "="
+                tests.append((label, lambda v, value=value, pos=positive: (v == value) == pos))
+        matching = [
+            stored
+            for stored in self._candidates(selector)
+            if all(test(stored.label_map.get(label, "")) for label, test in tests)
+        ]
+        if selector.range is None:
+            samples = []
+            for stored in matching:
+                index = bisect.bisect_right(stored.times, timestamp) - 1
+                if index >= 0 and stored.times[index] > timestamp - LOOKBACK:
+                    samples.append(Sample(stored.labels, stored.values[index]))
+            return samples
+        series = []
+        for stored in matching:
+            start = bisect.bisect_right(stored.times, timestamp - selector.range)
+            end = bisect.bisect_right(stored.times, timestamp)
+            if end > start:
+                points = list(zip(stored.times[start:end], stored.values[start:end]))
+                series.append(Series(stored.labels, points))
+        return series
+
+    def _call(self, call: Call, timestamp: float) -> Value:
+        """Evaluate a function call."""
+        function, args = call.function, call.args
+        if function in ("absent", "absent_over_time"):
+            if not isinstance(args[0], Selector) or (function == "absent") != (
+                args[0].range is None
+            ):
+                raise ValueError(f"unsupported argument of {function}")
+            if self._select(args[0], timestamp):
+                return []
+            labels = {
+                label: value
+                for label, match_op, value in args[0].matchers
+                if match_op == "=" and label != "__name__"
+            }
+            return [Sample(tuple(sorted(labels.items())), 1.0)]
+        if function in OVER_TIME:
+            aggregate = OVER_TIME[function]
+            return [
+                Sample(
+                    without_name(series.labels), float(aggregate([v for _, v in series.points]))
+                )
+                for series in _matrix(self.evaluate(args[0], timestamp))
+            ]
+        if function == "label_replace":
+            vector = _vector(self.evaluate(args[0], timestamp))
+            destination, replacement, source, regex = (
+                _string(self.evaluate(arg, timestamp)) for arg in args[1:]
+            )
+            return [_label_replace(s, destination, replacement, source, regex) for s in vector]
+        if function == "vector":
+            return [Sample((), _scalar(self.evaluate(args[0], timestamp)))]
+        if function == "scalar":
+            vector = _vector(self.evaluate(args[0], timestamp))
+            return vector[0].value if len(vector) == 1 else math.nan
+        if function == "time":
+            return timestamp
+        if function in ("abs", "clamp_min", "clamp_max"):
+            vector = _vector(self.evaluate(args[0], timestamp))
+            bound = _scalar(self.evaluate(args[1], timestamp)) if len(args) > 1 else 0.0
+            compute = {"abs": lambda v: abs(v), "clamp_min": lambda v: max(v, bound)}.get(
+                function, lambda v: min(v, bound)
+            )
+            return [Sample(without_name(s.labels), compute(s.value)) for s in vector]
+        raise ValueError(f"unsupported function: {function}")
+
+    def _aggregate(self, node: Aggregate, timestamp: float) -> list[Sample]:  # noqa: C901
+        """Evaluate an aggregation."""
+        vector = _vector(self.evaluate(node.expr, timestamp))
+        groups: dict[Labels, list[Sample]] = {}
+        for sample in vector:
+            if node.without:
+                key = tuple(
+                    (n, v) for n, v in without_name(sample.labels) if n not in node.grouping
+                )
+            else:
+                key = tuple((n, v) for n, v in sample.labels if n in node.grouping)
+            groups.setdefault(key, []).append(sample)
+
+        if node.operation in ("topk", "bottomk"):
+            k = int(_scalar(self.evaluate(node.param, timestamp)))
+            result = []
+            for samples in groups.values():
+                ordered = sorted(samples, key=lambda s: s.value, reverse=node.operation == "topk")
+                result.extend(ordered[:k])
+            return result
+
+        def combine(values: list[float]) -> float:
+            if node.operation == "sum":
+                return sum(values)
+            if node.operation == "min":
+                return min(values)
+            if node.operation == "max":
+                return max(values)
+            if node.operation == "count":
+                return float(len(values))
+            if node.operation == "group":
+                return 1.0
+            mean = sum(values) / len(values)
+            if node.operation == "avg":
+                return mean
+            return math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+
+        return [
+            Sample(key, combine([s.value for s in samples])) for key, samples in groups.items()
+        ]
+
+    def _binary(self, node: Binary, timestamp: float) -> Value:  # noqa: C901
+        """Evaluate a binary operator."""
+        lhs = self.evaluate(node.lhs, timestamp)
+        rhs = self.evaluate(node.rhs, timestamp)
+        op = node.op
+        comparison = COMPARISONS.get(op)
+        if isinstance(lhs, float) and isinstance(rhs, float):
+            if comparison is None:
+                return _arithmetic(op, lhs, rhs)
+            if not node.bool_modifier:
+                raise ValueError("comparisons between scalars must use the bool modifier")
+            return float(comparison(lhs, rhs))
+
+        if isinstance(lhs, float) or isinstance(rhs, float):
+            if op in SET_OPERATORS:
+                raise ValueError(f"{op} is not defined between a scalar and a vector")
+            scalar_on_left = isinstance(lhs, float)
+            scalar = _scalar(lhs if scalar_on_left else rhs)
+            result = []
+            for sample in _vector(rhs if scalar_on_left else lhs):
+                left, right = (scalar, sample.value) if scalar_on_left else (sample.value, scalar)
+                if comparison is None:
+                    result.append(
+                        Sample(without_name(sample.labels), _arithmetic(op, left, right))
+                    )
+                elif node.bool_modifier:
+                    result.append(
+                        Sample(without_name(sample.labels), float(comparison(left, right)))
+                    )
+                elif comparison(left, right):
+                    result.append(sample)
+            return result
+
+        left_vector, right_vector = _vector(lhs), _vector(rhs)
+        matching = node.matching
+        signature = _signature_function(matching)
+        if op in SET_OPERATORS:
+            right_signatures = {signature(sample.labels) for sample in right_vector}
+            if op == "and":
+                return [s for s in left_vector if signature(s.labels) in right_signatures]
+            if op == "unless":
+                return [s for s in left_vector if signature(s.labels) not in right_signatures]
+            left_signatures = {signature(sample.labels) for sample in left_vector}
+            return left_vector + [
+                s for s in right_vector if signature(s.labels) not in left_signatures
+            ]
+
+        # the "one" side of the matching is indexed, and must be unique per signature
+        many, one = (
+            (right_vector, left_vector)
+            if matching.group == "group_right"
+            else (left_vector, right_vector)
+        )
+        index: dict[Labels, Sample] = {}
+        for sample in one:
+            key = signature(sample.labels)
+            if key in index:
+                raise ValueError(f"found duplicate series for the match group {dict(key)}")
+            index[key] = sample
+        matched: set[Labels] = set()
+        result = []
+        for sample in many:
+            key = signature(sample.labels)
+            other = index.get(key)
+            if other is None:
+                continue
+            if matching.group is None:
+                if key in matched:
+                    raise ValueError(
+                        "multiple matches for labels: many-to-one matching must be explicit"
+                    )
+                matched.add(key)
+            left, right = (other, sample) if matching.group == "group_right" else (sample, other)
+            if comparison is None:
+                value = _arithmetic(op, left.value, right.value)
+            elif node.bool_modifier:
+                value = float(comparison(left.value, right.value))
+            elif comparison(left.value, right.value):
+                value = left.value
+            else:
+                continue
+            labels = dict(sample.labels)
+            if comparison is None or node.bool_modifier:
+                labels.pop("__name__", None)
+            if matching.group is None:
+                if matching.on:
+                    labels = {n: v for n, v in labels.items() if n in matching.labels}
+                else:
+                    labels = {n: v for n, v in labels.items() if n not in matching.labels}
+            else:
+                other_labels = dict(other.labels)
+                for name in matching.include:
+                    if other_labels.get(name):
+                        labels[name] = other_labels[name]
+                    else:
+                        labels.pop(name, None)
+            result.append(Sample(tuple(sorted(labels.items())), value))
+        return result
+
+
+def _vector(value: Value) -> list[Sample]:
+    """Return the value, which must be an instant vector."""
+    if not isinstance(value, list) or (value and not isinstance(value[0], Sample)):
+        raise ValueError(f"expected an instant vector, got {type(value).__name__}")
+    return value  # type: ignore[return-value]
+
+
+def _matrix(value: Value) -> list[Series]:
+    """Return the value, which must be a range vector."""
+    if not isinstance(value, list) or (value and not isinstance(value[0], Series)):
+        raise ValueError(f"expected a range vector, got {type(value).__name__}")
+    return value  # type: ignore[return-value]
+
+
+def _scalar(value: Value) -> float:
+    """Return the value, which must be a scalar."""
+    if not isinstance(value, float):
+        raise ValueError(f"expected a scalar, got {type(value).__name__}")
+    return value
+
+
+def _string(value: Value) -> str:
+    """Return the value, which must be a string."""
+    if not isinstance(value, str):
+        raise ValueError(f"expected a string, got {type(value).__name__}")
+    return value
+
+
+def _signature_function(matching: Matching) -> Callable[[Labels], Labels]:
+    """Return the function of the labels on which two samples are matched."""
+    if matching.on:
+        return lambda labels: tuple((n, v) for n, v in labels if n in matching.labels)
+    return lambda labels: tuple(
+        (n, v) for n, v in labels if n != "__name__" and n not in matching.labels
+    )
+
+
+def _label_replace(
+    sample: Sample, destination: str, replacement: str, source: str, regex: str
+) -> Sample:
+    """Return the sample with the destination label replaced, if the source label matches."""
+    labels = dict(sample.labels)
+    match = re.fullmatch(regex, labels.get(source, ""))
+    if match is None:
+        return sample
+    value = match.expand(re.sub(r"\$\{?(\w+)\}?", r"\\g<\1>", replacement))
+    if value:
+        labels[destination] = value
+    else:
+        labels.pop(destination, None)
+    return Sample(tuple(sorted(labels.items())), sample.value)
+
+
+def format_value(value: float) -> str:
+    """Format a float as the %v verb of Go templates."""
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer() and abs(value) < 1e21:
+        return str(int(value))
+    return repr(value)
+
+
+def expand_template(text: str, labels: Labels, value: float) -> str:
+    """Expand the $labels and $value of an alert template."""
+    label_map = dict(labels)
+
+    def substitute(match: re.Match) -> str:
+        if match["value"]:
+            return format_value(value)
+        if match["label"]:
+            return label_map.get(match["label"], "<no value>")
+        return "map[" + " ".join(f"{name}:{label}" for name, label in labels) + "]"
+
+    expanded = TEMPLATE_PATTERN.sub(substitute, text)
+    if unsupported := ANY_TEMPLATE_PATTERN.search(expanded):
+        raise ValueError(f"unsupported template: {unsupported[0]}")
+    return expanded
+
+
+class Rule(NamedTuple):
+    """A recording or an alerting rule."""
+
+    name: str
+    expr: Any
+    recording: bool
+    for_seconds: float
+    labels: dict[str, str]
+    annotations: dict[str, str]
+
+
+class RuleGroup(NamedTuple):
+    """A group of rules, evaluated in order at its interval."""
+
+    name: str
+    interval: float
+    rules: list[Rule]
+
+
+class Alert(NamedTuple):
+    """A firing or pending alert."""
+
+    labels: Labels
+    annotations: Labels
+    active_since: float
+
+
+def load_rule_groups(paths: Iterable[Path], default_interval: float = 60) -> list[RuleGroup]:
+    """Load and parse the rule groups of the rule files."""
+    groups = []
+    for path in paths:
+        for group in yaml.safe_load(Path(path).read_text())["groups"]:
+            rules = [
+                Rule(
+                    name=rule.get("record") or rule["alert"],
+                    expr=parse(rule["expr"]),
+                    recording="record" in rule,
+                    for_seconds=parse_duration(rule["for"]) if "for" in rule else 0.0,
+                    labels={name: str(value) for name, value in rule.get("labels", {}).items()},
+                    annotations=rule.get("annotations", {}),
+                )
+                for rule in group["rules"]
+            ]
+            interval = (
+                parse_duration(group["interval"]) if "interval" in group else default_interval
+            )
+            groups.append(RuleGroup(group["name"], interval, rules))
+    return groups
+
+
+class RuleEvaluator:
+    """Evaluate rule groups over time, recording their series and tracking their alerts."""
+
+    def __init__(self, engine: Engine, groups: list[RuleGroup]):
+        self.engine = engine
+        self.groups = groups
+        self.alerts: dict[str, dict[Labels, Alert]] = {}
+
+    def evaluate_rule(self, rule: Rule, timestamp: float) -> None:
+        """Evaluate a rule once."""
+        vector = _vector(self.engine.evaluate(rule.expr, timestamp))
+        if rule.recording:
+            for sample in vector:
+                labels = {**dict(sample.labels), **rule.labels, "__name__": rule.name}
+                self.engine.add(tuple(sorted(labels.items())), timestamp, sample.value)
+            return
+        previous = self.alerts.get(rule.name, {})
+        active = {}
+        for sample in vector:
+            labels = dict(without_name(sample.labels))
+            for name, value in rule.labels.items():
+                labels[name] = expand_template(value, sample.labels, sample.value)
+            labels["alertname"] = rule.name
+            key = tuple(sorted(labels.items()))
+            annotations = tuple(
+                sorted(
+                    (name, expand_template(value, sample.labels, sample.value))
+                    for name, value in rule.annotations.items()
+                )
+            )
+            since = previous[key].active_since if key in previous else timestamp
+            active[key] = Alert(key, annotations, since)
+        self.alerts[rule.name] = active
+
+    def evaluate(self, timestamp: float) -> None:
+        """Evaluate the groups due at this timestamp, since the start."""
+        for group in self.groups:
+            if timestamp % group.interval == 0:
+                for rule in group.rules:
+                    self.evaluate_rule(rule, timestamp)
+
+    def firing(self, alertname: str, timestamp: float) -> list[Alert]:
+        """Return the alerts of a rule active for longer than its `for` duration."""
+        rule = next(r for g in self.groups for r in g.rules if r.name == alertname)
+        return sorted(
+            alert
+            for alert in self.alerts.get(alertname, {}).values()
+            if timestamp - alert.active_since >= rule.for_seconds
+        )
+
+
+def _string_labels(labels: Optional[dict[str, Any]], **extra: str) -> Iterable[tuple[str, str]]:
+    """Return the labels of a test file as strings, YAML may have parsed them as numbers."""
+    return {**{name: str(value) for name, value in (labels or {}).items()}, **extra}.items()
+
+
+def run_test_file(path: Path) -> list[str]:
+    """Run the tests of a promtool rule test file, return the failures."""
+    spec = yaml.safe_load(path.read_text())
+    evaluation_interval = parse_duration(spec.get("evaluation_interval", "1m"))
+    rule_files = [path.parent / rule_file for rule_file in spec["rule_files"]]
+    failures = []
+    for number, test in enumerate(spec["tests"]):
+        name = test.get("name", f"test {number}")
+        failures.extend(
+            f"{name}: {failure}" for failure in _run_test(test, rule_files, evaluation_interval)
+        )
+    return failures
+
+
+def _run_test(
+    test: dict[str, Any], rule_files: list[Path], evaluation_interval: float
+) -> list[str]:
+    """Run a test of a promtool rule test file, return the failures."""
+    engine = Engine()
+    interval = parse_duration(test.get("interval", "1m"))
+    for series in test.get("input_series", []):
+        engine.load(series["series"], series["values"], interval)
+    evaluator = RuleEvaluator(engine, load_rule_groups(rule_files, evaluation_interval))
+
+    alert_tests: dict[float, list[dict[str, Any]]] = {}
+    for alert_test in test.get("alert_rule_test", []):
+        alert_tests.setdefault(parse_duration(alert_test["eval_time"]), []).append(alert_test)
+    promql_tests = test.get("promql_expr_test", [])
+    end = max([*alert_tests, *(parse_duration(t["eval_time"]) for t in promql_tests), 0.0])
+
+    failures = []
+    timestamp = 0.0
+    while timestamp <= end:
+        evaluator.evaluate(timestamp)
+        for alert_test in alert_tests.get(timestamp, []):
+            alertname = alert_test["alertname"]
+            got = [
+                (alert.labels, alert.annotations)
+                for alert in evaluator.firing(alertname, timestamp)
+            ]
+            expected = sorted(
+                (
+                    tuple(sorted(_string_labels(alert.get("exp_labels"), alertname=alertname))),
+                    tuple(sorted(alert.get("exp_annotations", {}).items())),
+                )
+                for alert in alert_test.get("exp_alerts") or []
+            )
+            if got != expected:
+                failures.append(
+                    f"{alertname} at {alert_test['eval_time']}: expected {expected}, got {got}"
+                )
+        timestamp += evaluation_interval
+
+    for promql_test in promql_tests:
+        timestamp = parse_duration(promql_test["eval_time"])
+        got_samples = sorted(
+            (sample.labels, sample.value)
+            for sample in _vector(engine.query(promql_test["expr"], timestamp))
+        )
+        expected_samples = sorted(
+            (parse_series(sample.get("labels", "{}")), float(sample["value"]))
+            for sample in promql_test.get("exp_samples") or []
+        )
+        if [labels for labels, _ in got_samples] != [
+            labels for labels, _ in expected_samples
+        ] or any(
+            not math.isclose(got, expected)
+            for (_, got), (_, expected) in zip(got_samples, expected_samples)
+        ):
+            failures.append(
+                f"{promql_test['expr']} at {promql_test['eval_time']}: "
+                f"expected {expected_samples}, got {got_samples}"
+            )
+    return failures
@@ -0,0 +1,56 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import re
+from pathlib import Path
+
+import pytest
+import yaml
+
+RULES_DIR = Path(__file__).parents[2] / "src" / "prometheus_alert_rules"
+RULES = [
+    pytest.param(rule, id=rule.get("alert") or rule.get("record"))
+    for path in sorted(RULES_DIR.glob("*.yaml"))
+    for group in yaml.safe_load(path.read_text())["groups"]
+    for rule in group["rules"]
+]
+# e.g. {__name__=~"openstack_(.+)"}, which matches every series of the head block
+NAME_MATCHER = re.compile(r"__name__\s*(=~|!~|!=|=)")
+
+
+@pytest.mark.parametrize("rule", RULES)
+def test_rule_selects_metrics_by_exact_name(rule):
+    """Test no rule selects its series with a matcher on the metric name.
+
+    Prometheus has to scan every series of the head block to evaluate such a selector, on
+    every evaluation of the rule. Select exact metric names, or the openstack:service_up rollup.
+    """
+    assert not NAME_MATCHER.search(rule["expr"])
+    assert "label_replace" not in rule["expr"] or "record" in rule
+
+
+def test_services_rollup_covers_the_services_alerted_on():
+    """Test the per-service missing metrics alerts use an up series of the rollup."""
+    rollup = next(
+        rule.values[0] for rule in RULES if rule.values[0].get("record") == "openstack:service_up"
+    )
+    for param in RULES:
+        if match := re.search(r"absent_over_time\((openstack_\w+_up)\[", param.values[0]["expr"]):
+            assert f"{match[1]}," in rollup["expr"]
+
+
+def test_project_capacity_rollups():
+    """Test the usage and the quota of a project resource are recorded with the same labels."""
+    recorded = {
+        rule.values[0]["record"]: rule.values[0]["expr"]
+        for rule in RULES
+        if "record" in rule.values[0]
+    }
+    for service in ("nova", "cinder", "neutron"):
+        used = re.findall(
+            r'"resource", "(\w+)"', recorded[f"tenant_id:openstack_{service}_quota:used"]
+        )
+        quota = re.findall(
+            r'"resource", "(\w+)"', recorded[f"tenant_id:openstack_{service}_quota:max"]
+        )
+        assert set(quota) <= set(used)
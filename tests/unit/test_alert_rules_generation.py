@@ -0,0 +1,108 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import alert_rules
+
+# The services queried by openstack-exporter, as in their openstack_<service>_up series
+EXPORTER_SERVICES = [
+    "cinder",
+    "container_infra",
+    "designate",
+    "glance",
+    "gnocchi",
+    "heat",
+    "identity",
+    "ironic",
+    "loadbalancer",
+    "neutron",
+    "nova",
+    "object_store",
+    "placement",
+    "sharev2",
+    "trove",
+]
+TEMPLATES = {path.name: path.read_text() for path in alert_rules.RULE_TEMPLATES_DIR.glob("*.yaml")}
+
+
+def test_render_rules_all():
+    """Test all the rules are rendered as long as the services are not known."""
+    assert alert_rules.render_rules(None) == TEMPLATES
+
+
+def test_render_rules_services():
+    """Test only the rules of the reported services are rendered."""
+    rules = alert_rules.render_rules(["identity", "loadbalancer", "nova"])
+
+    assert sorted(rules) == ["general.yaml", "nova_compute.yaml", "octavia_rules.yaml"]
+    assert rules["nova_compute.yaml"] == TEMPLATES["nova_compute.yaml"]
+    rollup = rules["general.yaml"]
+    assert (
+        '      expr: |\n        label_replace(openstack_identity_up, "service", "identity", "", "")\n'
+        '        or label_replace(openstack_loadbalancer_up, "service", "loadbalancer", "", "")\n'
+        '        or label_replace(openstack_nova_up, "service", "nova", "", "")\n'
+        "\n    - alert: OpenStackServicesDown\n"
+    ) in rollup
+    assert "openstack_cinder_up" not in rollup
+    # only the rollup terms are removed
+    assert len(rollup.splitlines()) == len(TEMPLATES["general.yaml"].splitlines()) - 12
+
+
+def test_render_rules_interval():
+    """Test the evaluation interval of the capacity rollups is set, for all services or some."""
+    for services in (None, ["nova"]):
+        rules = alert_rules.render_rules(services, "5m")
+
+        assert "- name: NovaProjectCapacity\n  interval: 5m\n" in rules["nova_compute.yaml"]
+        assert "interval: 1m" not in "".join(rules.values())
+    assert "interval: 1m" in alert_rules.render_rules(None)["cinder_rules.yaml"]
+    # the capacity planning rollups are always hourly
+    assert "- name: NovaCapacityPlanning\n  interval: 1h\n" in rules["nova_compute.yaml"]
+
+
+def test_render_rules_unknown_services():
+    """Test the services missing from the template are in the rollup."""
+    rollup = alert_rules.render_rules(["new_service", "nova"])["general.yaml"]
+
+    assert (
+        '        label_replace(openstack_new_service_up, "service", "new_service", "", "")\n'
+        '        or label_replace(openstack_nova_up, "service", "nova", "", "")\n\n'
+    ) in rollup
+
+
+def test_render_rules_no_services():
+    """Test the whole rollup is kept when the exporter reports no service."""
+    assert alert_rules.render_rules([]) == {"general.yaml": TEMPLATES["general.yaml"]}
+
+
+def test_rollup_template_covers_the_exporter_services():
+    """Test the rollup of the template has the up series of every service of the exporter."""
+    rollup = TEMPLATES["general.yaml"]
+
+    for service in EXPORTER_SERVICES:
+        assert alert_rules.ROLLUP_TERM.format(service=service) in rollup, service
+
+
+def test_write_rules(tmp_path):
+    """Test the rule files are only written when they change, and stale ones are removed."""
+    assert alert_rules.write_rules(None) is True
+    assert sorted(path.name for path in alert_rules.RULES_DIR.iterdir()) == sorted(TEMPLATES)
+    assert alert_rules.write_rules(None) is False
+
+    assert alert_rules.write_rules(["nova"]) is True
+    assert sorted(path.name for path in alert_rules.RULES_DIR.iterdir()) == [
+        "general.yaml",
+        "nova_compute.yaml",
+    ]
+    assert alert_rules.write_rules(["nova"]) is False
+
+    (alert_rules.RULES_DIR / "general.yaml").write_text("edited")
+    assert alert_rules.write_rules(["nova"]) is True
+    assert (alert_rules.RULES_DIR / "general.yaml").read_text() != "edited"
+
+
+def test_remove_rules():
+    """Test the generated rules are removed, even if there are none."""
+    alert_rules.write_rules(None)
+    alert_rules.remove_rules()
+    assert not alert_rules.RULES_DIR.exists()
+    alert_rules.remove_rules()
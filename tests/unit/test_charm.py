@@ -3,6 +3,13 @@
 #
 # Learn more about testing at: https://juju.is/docs/sdk/testing
 
+import hashlib
+import http.client
+import json
+import os
+import subprocess
+import sys
+import time
 from pathlib import Path
 from unittest import mock
 
@@ -11,9 +18,59 @@ import ops.testing
 import pytest
 from charms.operator_libs_linux.v2.snap import SnapError
 
-from charm import CLOUD_NAME, OS_CLIENT_CONFIG, SNAP_NAME, OpenstackExporterOperatorCharm
+import alert_rules
+import dashboards
+from charm import (
+    CLOUD_NAME,
+    OS_CLIENT_CONFIG,
+    PEER_RELATION,
+    PROBE_HISTORY_SIZE,
+    REFRESH_DEADLINE,
+    REFRESH_STATE,
+    REFRESH_TOKEN,
+    REFRESH_WARMUP_TIMEOUT,
+    SNAP_NAME,
+    OpenstackExporterOperatorCharm,
+)
+from instrumentation import METRICS_PATH
 from service import UPSTREAM_SNAP, SnapService
 
+# Loose upper bound (seconds) for a cold-start import of charm.py, including ops itself, which
+# takes about 0.2s. The modules loaded are checked exactly, the time only catches gross regressions.
+CHARM_IMPORT_TIME_BUDGET = 1.5
+# Modules that must only be loaded by the handlers that need them, not on every dispatch by the
+# import or the collect-status assessment. yaml and concurrent.futures are not listed, ops itself
+# imports them.
+LAZY_MODULES = [
+    "pydantic",
+    "cosl",
+    "ops.testing",
+    "charms.grafana_agent.v0.cos_agent",
+    "cos_agent_provider",
+    "scrape",
+    "statistics",
+]
+
+
+def test_charm_cold_start_import():
+    """Test importing charm.py and assessing the probes do not load the heavy libraries."""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import charm\n"
+        "print(time.perf_counter() - start)\n"
+        "charm.assess([{'latency': 1.0, 'series': 1, 'error': '', 'up': {}}], 5.0, 1)\n"
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))\n"
+    )
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    result = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+    )
+    import_time, loaded = result.stdout.splitlines()
+
+    assert loaded == ""
+    assert float(import_time) < CHARM_IMPORT_TIME_BUDGET
+
 
 class TestCharm:
     def setup_method(self, _):
@@ -22,6 +79,21 @@ class TestCharm:
     def teardown_method(self, _):
         self.harness.cleanup()
 
+    @pytest.fixture(autouse=True)
+    def mock_ensure_metrics_server(self, mocker):
+        return mocker.patch("charm.ensure_metrics_server")
+
+    @pytest.fixture(autouse=True)
+    def mock_write_drop_in(self, mocker):
+        return mocker.patch("charm.write_drop_in")
+
+    @pytest.fixture(autouse=True)
+    def mock_probe(self, mocker):
+        return mocker.patch(
+            "scrape.probe",
+            return_value={"latency": 0.1, "bytes": 10, "series": 1, "up": {}, "error": ""},
+        )
+
     @pytest.mark.parametrize(
         "config",
         [
@@ -29,7 +101,7 @@ class TestCharm:
             ({"cache": True, "cache_ttl": "200s"}),
         ],
     )
-    def test_config_changed(self, config, mocker):
+    def test_config_changed(self, config, mock_write_drop_in, mocker):
         mock_get_installed_snap_service = mocker.patch("charm.get_installed_snap_service")
         mock_snap_service = mocker.Mock(spec_set=SnapService)
         mock_upstream_service = mocker.Mock(spec_set=SnapService)
@@ -43,7 +115,7 @@ class TestCharm:
         self.harness.begin()
 
         # mock get_keystone_data
-        mock_expect_keystone_data = mocker.Mock()
+        mock_expect_keystone_data = {"service_password": "password"}
         self.harness.charm._get_keystone_data = mocker.Mock()
         self.harness.charm._get_keystone_data.return_value = mock_expect_keystone_data
 
@@ -64,8 +136,359 @@ class TestCharm:
             "cache-ttl": config["cache_ttl"],
         })
         self.harness.charm._write_cloud_config.assert_called_with(mock_expect_keystone_data)
+        mock_write_drop_in.assert_called_with(self.harness.charm._service_drop_in())
         mock_snap_service.restart_and_enable.assert_called()
         mock_snap_service.stop.assert_not_called()
+        assert self.harness.charm._recorder.restarted
+
+    @pytest.mark.parametrize(
+        "drop_in_changed, active, cause",
+        [(False, True, None), (True, True, "config:drop-in"), (False, False, "inactive")],
+    )
+    def test_config_changed_no_change(
+        self, drop_in_changed, active, cause, mock_write_drop_in, mocker
+    ):
+        """Test a reconfigure applying the same state only restarts an inactive exporter."""
+        mock_snap_service = mocker.patch("charm.get_installed_snap_service").return_value
+        mock_snap_service.present = False
+        mock_snap_service.revision = "10"
+        mocker.patch("charm.OpenstackExporterOperatorCharm.install")
+        mocker.patch(
+            "charm.OpenstackExporterOperatorCharm._get_keystone_data",
+            return_value={"service_password": "password"},
+        )
+        mocker.patch("charm.OpenstackExporterOperatorCharm._write_cloud_config")
+        self.harness.add_relation("cos-agent", "grafana-agent")
+        self.harness.begin()
+        self.harness.charm.on.config_changed.emit()
+        mock_snap_service.restart_and_enable.reset_mock()
+
+        mock_write_drop_in.return_value = drop_in_changed
+        mock_snap_service.is_active.return_value = active
+        self.harness.charm.on.config_changed.emit()
+
+        if cause:
+            mock_snap_service.restart_and_enable.assert_called_once_with(cause=cause)
+        else:
+            mock_snap_service.restart_and_enable.assert_not_called()
+
+    def test_restart_without_window(self, mocker):
+        """Test the exporter is restarted on every request when there is no window."""
+        mock_schedule = mocker.patch("charm.schedule_restart")
+        snap_service = mocker.Mock(spec_set=SnapService)
+        self.harness.begin()
+
+        self.harness.charm._restart(snap_service, "credentials")
+        self.harness.charm._restart(snap_service, "credentials")
+
+        assert snap_service.restart_and_enable.call_count == 2
+        mock_schedule.assert_not_called()
+
+    def test_restart_coalesced_in_window(self, mocker):
+        """Test restarts inside the window are coalesced into one scheduled restart."""
+        mock_schedule = mocker.patch("charm.schedule_restart")
+        mock_time = mocker.patch("charm.time.time", return_value=1000.0)
+        snap_service = mocker.Mock(spec_set=SnapService)
+        self.harness.update_config({"restart_window": 60})
+        self.harness.begin()
+        charm = self.harness.charm
+
+        # first restart happens right away
+        charm._restart(snap_service, "config:cache")
+        snap_service.restart_and_enable.assert_called_once_with(cause="config:cache")
+        assert charm._recorder.restarted
+
+        # 10s later: scheduled at the end of the window
+        mock_time.return_value = 1010.0
+        charm._restart(snap_service, "credentials")
+        mock_schedule.assert_called_once_with(50.0, cause="credentials")
+        assert charm._stored.last_restart == 1060.0
+
+        # 20s later: already scheduled, nothing more to do
+        mock_time.return_value = 1020.0
+        charm._restart(snap_service, "credentials")
+        mock_schedule.assert_called_once()
+
+        # 10s after the scheduled restart: the next one is scheduled a window later
+        mock_time.return_value = 1070.0
+        charm._restart(snap_service, "credentials")
+        mock_schedule.assert_called_with(50.0, cause="credentials")
+
+        # a window after the last restart: restart right away again
+        mock_time.return_value = 1200.0
+        charm._restart(snap_service, "snap-refresh")
+        assert snap_service.restart_and_enable.call_count == 2
+        assert charm._stored.last_restart == 1200.0
+
+    @pytest.mark.parametrize("last_restart, cancelled", [(2000.0, True), (900.0, False)])
+    def test_stop_cancels_scheduled_restart(self, last_restart, cancelled, mocker):
+        """Test stopping the exporter drops a pending scheduled restart."""
+        mock_cancel = mocker.patch("charm.cancel_scheduled_restart")
+        mocker.patch("charm.time.time", return_value=1000.0)
+        snap_service = mocker.Mock(spec_set=SnapService)
+        self.harness.begin()
+        self.harness.charm._stored.last_restart = last_restart
+
+        self.harness.charm._stop(snap_service, "credentials not available")
+
+        assert mock_cancel.called is cancelled
+        snap_service.stop.assert_called_once_with(cause="credentials not available")
+        assert self.harness.charm._stored.last_restart == 0.0
+
+    def test_restart_cause(self):
+        """Test the restart cause lists what changed since the last restart."""
+        self.harness.begin()
+        self.harness.disable_hooks()
+        charm = self.harness.charm
+        snap_config = {"web": {"listen-address": ":9180"}, "cache": True}
+        data = {"service_password": "password"}
+
+        assert charm._restart_cause(snap_config, "[Service]\n", data, "10") == (
+            "config:cache, config:drop-in, config:ssl_ca, config:web, credentials, snap-refresh"
+        )
+        assert charm._restart_cause(snap_config, "[Service]\n", data, "10") == "no-change"
+
+        snap_config["cache"] = False
+        assert charm._restart_cause(snap_config, "[Service]\n", data, "10") == "config:cache"
+
+        data = {"service_password": "rotated"}
+        assert charm._restart_cause(snap_config, "[Service]\n", data, "11") == (
+            "credentials, snap-refresh"
+        )
+
+        self.harness.update_config({"ssl_ca": "new ca"})
+        assert charm._restart_cause(snap_config, "[Service]\n", data, "11") == "config:ssl_ca"
+
+        assert charm._restart_cause(snap_config, "[Service]\nNice=5\n", data, "11") == (
+            "config:drop-in"
+        )
+
+    @pytest.mark.parametrize(
+        "config, expected",
+        [
+            # defaults: only the compute microversion of bug 268
+            ({}, '[Service]\nEnvironment="OS_COMPUTE_API_VERSION=2.87"\n'),
+            # microversions of several services, none at all
+            (
+                {"api_microversions": "compute=2.90, volume=3.64,shared-file-system=2.70"},
+                "[Service]\n"
+                'Environment="OS_COMPUTE_API_VERSION=2.90"\n'
+                'Environment="OS_SHARED_FILE_SYSTEM_API_VERSION=2.70"\n'
+                'Environment="OS_VOLUME_API_VERSION=3.64"\n',
+            ),
+            ({"api_microversions": ""}, "[Service]\n"),
+            # everything tuned
+            (
+                {
+                    "gomaxprocs": 2,
+                    "gomemlimit": "1GiB",
+                    "cpu_quota": "150%",
+                    "memory_high": "2G",
+                    "nice": 10,
+                    "io_scheduling_class": "idle",
+                },
+                "[Service]\n"
+                'Environment="GOMAXPROCS=2"\n'
+                'Environment="GOMEMLIMIT=1GiB"\n'
+                'Environment="OS_COMPUTE_API_VERSION=2.87"\n'
+                "CPUQuota=150%\n"
+                "IOSchedulingClass=idle\n"
+                "MemoryHigh=2G\n"
+                "Nice=10\n",
+            ),
+        ],
+    )
+    def test_service_drop_in(self, config, expected):
+        """Test the drop-in of the exporter service is rendered from the config."""
+        self.harness.update_config(config)
+        self.harness.begin()
+        assert self.harness.charm._service_drop_in() == expected
+
+    def test_scrape_jobs_include_charm_metrics(self):
+        """Test grafana-agent is asked to scrape both the exporter and the charm metrics."""
+        self.harness.update_config({"port": 9000, "charm_metrics_port": 9001})
+        self.harness.begin()
+        jobs = self.harness.charm._grafana_agent._scrape_jobs
+        assert [(job["metrics_path"], job["static_configs"]) for job in jobs] == [
+            ("/metrics", [{"targets": ["localhost:9000"]}]),
+            (METRICS_PATH, [{"targets": ["localhost:9001"]}]),
+        ]
+
+    def test_install_ensures_metrics_server(self, mock_ensure_metrics_server, mocker):
+        """Test install sets up the server for the charm metrics."""
+        mocker.patch("charm.snap_install_or_refresh")
+        mocker.patch("charm.OpenstackExporterOperatorCharm.get_resource", return_value=None)
+        self.harness.update_config({"charm_metrics_port": 9999})
+        self.harness.begin()
+        self.harness.charm.install()
+        mock_ensure_metrics_server.assert_called_once_with(9999)
+
+    def test_on_remove(self, mocker):
+        """Test the charm metrics server, alert rules and dashboards are removed with the unit."""
+        mock_remove = mocker.patch("charm.remove_metrics_server")
+        mock_remove_rules = mocker.patch("charm.remove_rules")
+        mock_remove_dashboards = mocker.patch("charm.remove_dashboards")
+        self.harness.begin()
+        self.harness.charm.on.remove.emit()
+        mock_remove.assert_called_once()
+        mock_remove_rules.assert_called_once()
+        mock_remove_dashboards.assert_called_once()
+
+    def test_on_pre_commit_records_dispatch(self, mocker):
+        """Test the dispatch cost is accumulated per hook and written out."""
+        mock_write = mocker.patch("charm.write_metrics")
+        self.harness.begin()
+        recorder = self.harness.charm._recorder
+        recorder.hook = "config-changed"
+        recorder.snapd_calls = 3
+        recorder.subprocesses = 2
+        recorder.restarted = True
+
+        self.harness.charm.framework.on.pre_commit.emit()
+        self.harness.charm.framework.on.pre_commit.emit()
+
+        totals = self.harness.charm._stored.hook_metrics["config-changed"]
+        assert totals["count"] == 2
+        assert totals["snapd_calls"] == 6
+        assert totals["subprocesses"] == 4
+        assert totals["restarts"] == 2
+        assert (
+            'openstack_exporter_charm_hook_dispatches_total{hook="config-changed"} 2'
+            in (mock_write.call_args[0][0])
+        )
+
+    def test_on_pre_commit_write_error(self, mocker):
+        """Test a failure to write the charm metrics does not fail the hook."""
+        mocker.patch("charm.write_metrics", side_effect=PermissionError("denied"))
+        mock_logger = mocker.patch("charm.logger.warning")
+        self.harness.begin()
+        self.harness.charm.framework.on.pre_commit.emit()
+        mock_logger.assert_called_once()
+
+    def test_fast_path_hook_skips_cos_agent(self, monkeypatch):
+        """Test the cos_agent provider is not set up for status-only hooks."""
+        monkeypatch.setenv("JUJU_HOOK_NAME", "update-status")
+        self.harness.begin()
+        assert self.harness.charm._grafana_agent is None
+
+    def test_grafana_agent_files_written_for_other_hooks(self, monkeypatch):
+        """Test the rules and dashboards passed to grafana-agent are generated for all services."""
+        monkeypatch.setenv("JUJU_HOOK_NAME", "config-changed")
+        self.harness.begin()
+        assert sorted(path.name for path in alert_rules.RULES_DIR.iterdir()) == [
+            "cinder_rules.yaml",
+            "general.yaml",
+            "neutron_rules.yaml",
+            "nova_compute.yaml",
+            "octavia_rules.yaml",
+        ]
+        assert self.harness.charm._grafana_agent._metrics_rules == str(alert_rules.RULES_DIR)
+        assert sorted(path.name for path in dashboards.DASHBOARDS_DIR.iterdir()) == [
+            "cloud.json",
+            "compute.json",
+            "project.json",
+            "service.json",
+        ]
+        assert self.harness.charm._grafana_agent._dashboard_dirs == [
+            str(dashboards.DASHBOARDS_DIR)
+        ]
+
+    def test_grafana_agent_files_kept_on_failed_probe(self, mock_probe, monkeypatch, mocker):
+        """Test a timed-out probe with the up series of some services only changes nothing."""
+        monkeypatch.setenv("JUJU_HOOK_NAME", "update-status")
+        mocker.patch("charm.get_installed_snap_service")
+        self.harness.begin()
+        self.harness.charm._stored.reported_services = ["cinder", "neutron", "nova"]
+        alert_rules.write_rules(["cinder", "neutron", "nova"])
+        mock_probe.return_value = {
+            **mock_probe.return_value,
+            "up": {"cinder": 1},
+            "error": "scrape not complete after 30s",
+        }
+
+        self.harness.charm.on.update_status.emit()
+
+        assert self.harness.charm._stored.reported_services == ["cinder", "neutron", "nova"]
+        assert "nova_compute.yaml" in [path.name for path in alert_rules.RULES_DIR.iterdir()]
+
+    def test_grafana_agent_files_follow_reported_services(self, mock_probe, monkeypatch, mocker):
+        """Test the rules and dashboards are regenerated and sent when the services change."""
+        monkeypatch.setenv("JUJU_HOOK_NAME", "update-status")
+        mocker.patch("charm.get_installed_snap_service")
+        mock_probe.return_value = {**mock_probe.return_value, "up": {"nova": 1, "identity": 1}}
+        rel_id = self.harness.add_relation("cos-agent", "grafana-agent")
+        self.harness.add_relation_unit(rel_id, "grafana-agent/0")
+        self.harness.begin()
+
+        self.harness.charm.on.update_status.emit()
+
+        assert self.harness.charm._stored.reported_services == ["identity", "nova"]
+        assert sorted(path.name for path in alert_rules.RULES_DIR.iterdir()) == [
+            "general.yaml",
+            "nova_compute.yaml",
+        ]
+        data = self.harness.get_relation_data(rel_id, self.harness.charm.unit.name)
+        assert "NovaMetricsMissing" in data["config"]
+        assert "CinderMetricsMissing" not in data["config"]
+        service_dashboard = json.loads((dashboards.DASHBOARDS_DIR / "service.json").read_text())
+        assert "Cinder agent up" not in [
+            panel.get("title") for panel in service_dashboard["panels"]
+        ]
+
+        # unchanged services, nothing is sent again
+        self.harness.update_relation_data(rel_id, self.harness.charm.unit.name, {"config": "sent"})
+        self.harness.charm.on.update_status.emit()
+        data = self.harness.get_relation_data(rel_id, self.harness.charm.unit.name)
+        assert data["config"] == "sent"
+
+    def test_grafana_agent_files_capacity_rules_interval(self, monkeypatch):
+        """Test the capacity rollups are evaluated at the configured interval, if valid."""
+        monkeypatch.setenv("JUJU_HOOK_NAME", "config-changed")
+        self.harness.update_config({"capacity_rules_interval": "5m"})
+        self.harness.begin()
+        assert "  interval: 5m\n" in (alert_rules.RULES_DIR / "nova_compute.yaml").read_text()
+
+        self.harness.update_config({"capacity_rules_interval": "5 minutes"})
+        assert self.harness.charm._write_grafana_agent_files() is True
+        assert "  interval: 1m\n" in (alert_rules.RULES_DIR / "nova_compute.yaml").read_text()
+
+    def test_grafana_agent_files_not_rendered_again(self, mocker):
+        """Test the files are only rendered again when their inputs or outputs changed."""
+        self.harness.begin()
+        mock_render = mocker.patch(
+            "dashboards.render_dashboards", wraps=dashboards.render_dashboards
+        )
+
+        assert self.harness.charm._write_grafana_agent_files() is False
+        mock_render.assert_not_called()
+
+        (dashboards.DASHBOARDS_DIR / "cloud.json").unlink()
+        assert self.harness.charm._write_grafana_agent_files() is True
+        assert (dashboards.DASHBOARDS_DIR / "cloud.json").exists()
+        mock_render.assert_called_once_with(None)
+
+    def test_grafana_agent_files_unchanged(self, mock_probe, mocker):
+        """Test grafana-agent is not updated when the generated files are the same."""
+        mocker.patch("charm.get_installed_snap_service")
+        mock_probe.return_value = {**mock_probe.return_value, "up": {"trove": 1}}
+        mock_emit = mocker.patch.object(self.harness.framework, "_emit")
+        self.harness.begin()
+        self.harness.charm._stored.reported_services = ["manila"]
+        # already generated for the services now reported
+        alert_rules.write_rules(["trove"])
+        dashboards.write_dashboards(["trove"])
+        mock_emit.reset_mock()
+
+        self.harness.charm._probe_exporter()
+
+        assert self.harness.charm._stored.reported_services == ["trove"]
+        mock_emit.assert_not_called()
+
+    def test_cos_agent_set_up_for_other_hooks(self, monkeypatch):
+        """Test the cos_agent provider is set up for hooks outside the fast path."""
+        monkeypatch.setenv("JUJU_HOOK_NAME", "config-changed")
+        self.harness.begin()
+        assert self.harness.charm._grafana_agent is not None
 
     @mock.patch("charm.get_installed_snap_service")
     @mock.patch("charm.OpenstackExporterOperatorCharm.install")
@@ -93,7 +516,589 @@ class TestCharm:
     def test_install_snap(self, mock_install, _):
         self.harness.begin()
         self.harness.charm.on.install.emit()
-        mock_install.assert_called_with("", "latest/stable")
+        mock_install.assert_called_with(
+            "", "latest/stable", resource_installed=False, revision="", cohort="", refresh=False
+        )
+
+    @pytest.mark.parametrize(
+        "installed_digest, expected_installed",
+        [
+            ("", False),
+            ("other-digest", False),
+            ("my-digest", True),
+        ],
+    )
+    def test_install_snap_resource_digest(self, installed_digest, expected_installed, mocker):
+        """Test install only skips the local install when the resource digest is unchanged."""
+        mock_install = mocker.patch("charm.snap_install_or_refresh")
+        mocker.patch(
+            "charm.OpenstackExporterOperatorCharm.get_resource", return_value="/path/to/resource"
+        )
+        self.harness.begin()
+        self.harness.charm._stored.resource_digest = "my-digest"
+        self.harness.charm._stored.installed_resource_digest = installed_digest
+
+        self.harness.charm.install()
+
+        mock_install.assert_called_once_with(
+            "/path/to/resource",
+            "latest/stable",
+            resource_installed=expected_installed,
+            revision="",
+            cohort="",
+            refresh=False,
+        )
+        assert self.harness.charm._stored.installed_resource_digest == "my-digest"
+
+    @pytest.mark.parametrize(
+        "config, gmtime, refresh",
+        [
+            # snapd refreshes on its own, the charm follows the channel
+            ({}, (2024, 1, 1, 12, 0, 0, 0, 1, 0), False),
+            # held: only refreshed inside the window, which may span midnight
+            ({"snap_hold_refresh": True}, (2024, 1, 1, 12, 0, 0, 0, 1, 0), False),
+            ({"snap_refresh_window": "02:00-04:00"}, (2024, 1, 1, 3, 0, 0, 0, 1, 0), True),
+            ({"snap_refresh_window": "02:00-04:00"}, (2024, 1, 1, 4, 0, 0, 0, 1, 0), False),
+            ({"snap_refresh_window": "22:00-02:00"}, (2024, 1, 1, 23, 0, 0, 0, 1, 0), True),
+            ({"snap_refresh_window": "22:00-02:00"}, (2024, 1, 1, 1, 0, 0, 0, 1, 0), True),
+            ({"snap_refresh_window": "22:00-02:00"}, (2024, 1, 1, 12, 0, 0, 0, 1, 0), False),
+            # an invalid window is never open
+            ({"snap_refresh_window": "2-4"}, (2024, 1, 1, 3, 0, 0, 0, 1, 0), False),
+        ],
+    )
+    def test_install_snap_refresh_held(self, config, gmtime, refresh, mocker):
+        """Test the charm only refreshes a held snap inside the refresh window."""
+        mock_install = mocker.patch("charm.snap_install_or_refresh")
+        mock_get_installed_snap_service = mocker.patch("charm.get_installed_snap_service")
+        mocker.patch("charm.time.gmtime", return_value=time.struct_time(gmtime))
+        self.harness.update_config(config)
+        self.harness.begin()
+        self.harness.charm._stored.refresh_pending = True
+
+        self.harness.charm.install()
+
+        assert mock_install.call_args.kwargs["refresh"] is refresh
+        assert self.harness.charm._stored.refresh_pending is not refresh
+        held = bool(config)
+        assert self.harness.charm._stored.refresh_held is held
+        if held:
+            mock_get_installed_snap_service.return_value.hold_refresh.assert_called_once_with(True)
+        else:
+            mock_get_installed_snap_service.assert_not_called()
+
+    def test_install_snap_pinned_revision(self, mocker):
+        """Test the pinned revision and the cohort are installed, and the refreshes held."""
+        mock_install = mocker.patch("charm.snap_install_or_refresh")
+        mock_get_installed_snap_service = mocker.patch("charm.get_installed_snap_service")
+        self.harness.update_config({"snap_revision": "42", "snap_cohort": "cohort-key"})
+        self.harness.begin()
+
+        self.harness.charm.install()
+        mock_install.assert_called_once_with(
+            None,
+            "latest/stable",
+            resource_installed=False,
+            revision="42",
+            cohort="cohort-key",
+            # joining the cohort needs a refresh
+            refresh=True,
+        )
+        mock_get_installed_snap_service.return_value.hold_refresh.assert_called_once_with(True)
+
+        # the cohort is only joined once, and the hold only changed when needed
+        self.harness.charm.install()
+        assert mock_install.call_args.kwargs["refresh"] is False
+        mock_get_installed_snap_service.return_value.hold_refresh.assert_called_once()
+
+        self.harness.update_config(unset=["snap_revision"])
+        self.harness.charm.install()
+        mock_get_installed_snap_service.return_value.hold_refresh.assert_called_with(False)
+        assert self.harness.charm._stored.refresh_held is False
+
+    def test_install_snap_resource_not_held(self, mocker):
+        """Test the refreshes of a snap installed from a resource are not managed."""
+        mocker.patch("charm.snap_install_or_refresh")
+        mock_get_installed_snap_service = mocker.patch("charm.get_installed_snap_service")
+        mocker.patch(
+            "charm.OpenstackExporterOperatorCharm.get_resource", return_value="/path/to/resource"
+        )
+        self.harness.update_config({"snap_hold_refresh": True})
+        self.harness.begin()
+        self.harness.charm._stored.refresh_held = True
+
+        self.harness.charm.install()
+
+        mock_get_installed_snap_service.assert_not_called()
+        assert self.harness.charm._stored.refresh_held is False
+
+    @pytest.mark.parametrize(
+        "config, resource, pending, in_window, configured",
+        [
+            # not held, pinned or installed from a resource: nothing to check
+            ({}, None, True, True, False),
+            ({"snap_revision": "42"}, None, True, True, False),
+            ({"snap_hold_refresh": True}, "/path/to/resource", True, True, False),
+            # held: refreshed only if pending and inside the window
+            ({"snap_hold_refresh": True}, None, False, True, False),
+            ({"snap_hold_refresh": True}, None, True, False, False),
+            ({"snap_refresh_window": "02:00-04:00"}, None, True, True, True),
+        ],
+    )
+    def test_on_update_status(self, config, resource, pending, in_window, configured, mocker):
+        """Test a held refresh is detected and applied in the refresh window."""
+        mock_refresh_pending = mocker.patch("charm.refresh_pending", return_value=pending)
+        mocker.patch("charm.OpenstackExporterOperatorCharm.get_resource", return_value=resource)
+        mocker.patch(
+            "charm.OpenstackExporterOperatorCharm._in_refresh_window", return_value=in_window
+        )
+        mocker.patch("charm.get_installed_snap_service")
+        self.harness.update_config(config)
+        self.harness.begin()
+        mock_configure = self.harness.charm._configure = mocker.Mock()
+
+        self.harness.charm.on.update_status.emit()
+
+        checked = bool(config) and "snap_revision" not in config and resource is None
+        assert mock_refresh_pending.called is checked
+        assert self.harness.charm._stored.refresh_pending is (checked and pending)
+        assert mock_configure.called is configured
+
+    @pytest.mark.parametrize(
+        "config, message",
+        [
+            (
+                {"snap_refresh_window": "02:00-04:00"},
+                f"{SNAP_NAME} refresh pending, applied in window 02:00-04:00 UTC",
+            ),
+            ({"snap_hold_refresh": True}, f"{SNAP_NAME} refresh pending, held by the charm"),
+        ],
+    )
+    def test_collect_status_refresh_pending(self, config, message, mocker):
+        """Test the unit status shows a pending refresh."""
+        mocker.patch("charm.get_installed_snap_service")
+        mocker.patch("charm.OpenstackExporterOperatorCharm._get_keystone_data", return_value={})
+        mocker.patch(
+            "charm.OpenstackExporterOperatorCharm._upstream_snap_present", return_value=False
+        )
+        mock_event = mock.MagicMock()
+        self.harness.update_config(config)
+        self.harness.begin()
+        self.harness.charm._stored.refresh_pending = True
+
+        self.harness.charm._on_collect_unit_status(mock_event)
+
+        mock_event.add_status.assert_any_call(ops.ActiveStatus(message))
+
+    def _add_peers(self, *states):
+        """Add the peer relation with a unit per refresh state, this unit being the first."""
+        rel_id = self.harness.add_relation(PEER_RELATION, "openstack-exporter")
+        for index, state in enumerate(states):
+            unit = f"openstack-exporter/{index}"
+            if index:
+                self.harness.add_relation_unit(rel_id, unit)
+            if state:
+                self.harness.update_relation_data(rel_id, unit, {REFRESH_STATE: state})
+        return rel_id
+
+    @pytest.mark.parametrize(
+        "leader, required, expected_install, expected_state",
+        [
+            # no refresh of the installed snap needed: install right away
+            (False, False, True, None),
+            # the leader hands the token to itself
+            (True, True, True, "refreshed"),
+            # another unit waits for its turn
+            (False, True, False, "requested"),
+        ],
+    )
+    def test_install_rolling_refresh(
+        self, leader, required, expected_install, expected_state, mocker
+    ):
+        """Test the snap is only refreshed by the unit holding the refresh token."""
+        mock_install = mocker.patch("charm.snap_install_or_refresh")
+        mock_required = mocker.patch("charm.refresh_required", return_value=required)
+        rel_id = self._add_peers(None, "refreshed")
+        self.harness.set_leader(leader)
+        self.harness.begin()
+
+        self.harness.charm.install()
+
+        mock_required.assert_called_once_with("latest/stable", "")
+        assert mock_install.called is expected_install
+        unit_data = self.harness.get_relation_data(rel_id, "openstack-exporter/0")
+        assert unit_data.get(REFRESH_STATE) == expected_state
+
+    def test_install_alone_without_refresh_token(self, mocker):
+        """Test a unit alone in the application refreshes without asking for the token."""
+        mock_install = mocker.patch("charm.snap_install_or_refresh")
+        mock_required = mocker.patch("charm.refresh_required")
+        self._add_peers(None)
+        self.harness.begin()
+
+        self.harness.charm.install()
+
+        mock_required.assert_not_called()
+        mock_install.assert_called_once()
+
+    def test_grant_refresh_token(self):
+        """Test the leader hands the token to one unit at a time, in order."""
+        rel_id = self._add_peers(None, "requested", "requested")
+        self.harness.set_leader(True)
+        self.harness.begin()
+        charm = self.harness.charm
+
+        charm._grant_refresh_token()
+        assert charm._refresh_token() == "openstack-exporter/1"
+
+        # kept while warming up with the token
+        self.harness.update_relation_data(
+            rel_id, "openstack-exporter/1", {REFRESH_STATE: "refreshed"}
+        )
+        charm._grant_refresh_token()
+        assert charm._refresh_token() == "openstack-exporter/1"
+
+        # released: the next unit gets it, then nobody
+        self.harness.update_relation_data(rel_id, "openstack-exporter/1", {REFRESH_STATE: ""})
+        assert charm._refresh_token() == "openstack-exporter/2"
+        self.harness.update_relation_data(rel_id, "openstack-exporter/2", {REFRESH_STATE: ""})
+        assert charm._refresh_token() == ""
+
+    def test_grant_refresh_token_departed_unit(self, mocker):
+        """Test the token of a unit which departed is handed to the next one."""
+        rel_id = self._add_peers("requested", "refreshed")
+        self.harness.set_leader(True)
+        self.harness.begin()
+        mock_configure = self.harness.charm._configure = mocker.Mock()
+        self.harness.update_relation_data(
+            rel_id, "openstack-exporter", {REFRESH_TOKEN: "openstack-exporter/1"}
+        )
+
+        self.harness.remove_relation_unit(rel_id, "openstack-exporter/1")
+
+        assert self.harness.charm._refresh_token() == "openstack-exporter/0"
+        mock_configure.assert_called_once()
+
+    def test_grant_refresh_token_without_peers(self):
+        """Test nothing is handed out before the peer relation exists."""
+        self.harness.set_leader(True)
+        self.harness.begin()
+        self.harness.charm._grant_refresh_token()
+        assert self.harness.charm._refresh_token() == ""
+
+    def test_on_update_status_rolling_refresh(self, mocker):
+        """Test the token is released and handed out again on update-status."""
+        mocker.patch("charm.exporter_serving", return_value=True)
+        mocker.patch("charm.get_installed_snap_service")
+        rel_id = self._add_peers("refreshed", "requested")
+        self.harness.set_leader(True)
+        self.harness.begin()
+        self.harness.disable_hooks()
+        self.harness.update_relation_data(
+            rel_id, "openstack-exporter", {REFRESH_TOKEN: "openstack-exporter/0"}
+        )
+        self.harness.enable_hooks()
+
+        self.harness.charm.on.update_status.emit()
+
+        assert self.harness.charm._refresh_token() == "openstack-exporter/1"
+
+    @pytest.mark.parametrize(
+        "present, active, config, probed",
+        [
+            (True, True, {}, True),
+            (True, False, {}, False),
+            (False, False, {}, False),
+            (True, True, {"probe_timeout": 0}, False),
+        ],
+    )
+    def test_probe_exporter(self, present, active, config, probed, mock_probe, mocker):
+        """Test update-status probes the running exporter and keeps a rolling window."""
+        mock_snap_service = mocker.patch("charm.get_installed_snap_service").return_value
+        mock_snap_service.present = present
+        mock_snap_service.is_active.return_value = active
+        self.harness.update_config({"port": 9000, **config})
+        self.harness.begin()
+        self.harness.charm._stored.probe_history = [{"latency": 1.0}] * PROBE_HISTORY_SIZE
+
+        self.harness.charm.on.update_status.emit()
+
+        history = self.harness.charm._stored.probe_history
+        if probed:
+            mock_probe.assert_called_once_with(9000, 30)
+            assert len(history) == PROBE_HISTORY_SIZE
+            assert history[-1] == mock_probe.return_value
+        else:
+            mock_probe.assert_not_called()
+            assert len(history) == 0
+
+    def test_probe_status(self, mocker):
+        """Test the unit is blocked when the recent probes show a degraded exporter."""
+        mock_assess = mocker.patch("charm.assess", return_value="empty")
+        self.harness.update_config({"probe_latency_threshold": 5.0, "probe_empty_threshold": 2})
+        self.harness.begin()
+        self.harness.charm._stored.probe_history = [{"latency": 1.0}]
+
+        status = self.harness.charm._probe_status()
+
+        assert status == ops.BlockedStatus("Exporter degraded: empty")
+        mock_assess.assert_called_once_with([{"latency": 1.0}], 5.0, 2)
+        mock_assess.return_value = None
+        assert self.harness.charm._probe_status() is None
+
+    def test_benchmark_scrape(self, mocker):
+        """Test the benchmark results are reported for the configured cache setting."""
+        mock_snap_service = mocker.patch("charm.get_installed_snap_service").return_value
+        mock_benchmark = mocker.patch("scrape.benchmark", return_value={"requests": 10})
+        self.harness.update_config({"port": 9000, "probe_timeout": 10})
+        self.harness.begin()
+
+        output = self.harness.run_action("benchmark-scrape", {"concurrency": 8, "duration": 5})
+
+        mock_benchmark.assert_called_once_with(9000, 8, 5.0, 10.0)
+        assert output.results == {"cache-on": {"requests": 10}}
+        mock_snap_service.restart_and_enable.assert_not_called()
+
+    @pytest.mark.parametrize("cache, modes", [(True, ["on", "off"]), (False, ["off", "on"])])
+    def test_benchmark_scrape_compare_cache(self, cache, modes, mocker):
+        """Test the benchmark is run with the cache switched, then the setting restored."""
+        mock_snap_service = mocker.patch("charm.get_installed_snap_service").return_value
+        mocker.patch("scrape.benchmark", side_effect=[{"requests": 1}, {"requests": 2}])
+        mock_wait = mocker.patch("charm.wait_exporter_serving", side_effect=[False, True])
+        self.harness.update_config({"cache": cache})
+        self.harness.begin()
+
+        output = self.harness.run_action("benchmark-scrape", {"compare-cache": True})
+
+        assert output.results == {
+            f"cache-{modes[0]}": {"requests": 1},
+            f"cache-{modes[1]}": {"requests": 2},
+        }
+        mock_snap_service.configure.assert_has_calls([
+            mock.call({"cache": not cache}),
+            mock.call({"cache": cache}),
+        ])
+        assert mock_snap_service.restart_and_enable.call_count == 2
+        assert mock_wait.call_count == 2
+        assert "The exporter serves no metrics after 300s" in output.logs
+
+    def test_benchmark_scrape_restores_cache_on_error(self, mocker):
+        """Test the cache setting is restored even if the benchmark fails."""
+        mock_snap_service = mocker.patch("charm.get_installed_snap_service").return_value
+        mocker.patch("scrape.benchmark", side_effect=[{"requests": 1}, RuntimeError("boom")])
+        mocker.patch("charm.wait_exporter_serving", return_value=True)
+        self.harness.begin()
+
+        with pytest.raises(RuntimeError):
+            self.harness.run_action("benchmark-scrape", {"compare-cache": True})
+
+        mock_snap_service.configure.assert_called_with({"cache": True})
+
+    def test_benchmark_scrape_not_active(self, mocker):
+        """Test the benchmark fails when the exporter is not running."""
+        mock_snap_service = mocker.patch("charm.get_installed_snap_service").return_value
+        mock_snap_service.is_active.return_value = False
+        mock_benchmark = mocker.patch("scrape.benchmark")
+        self.harness.begin()
+
+        with pytest.raises(ops.testing.ActionFailed, match="snap service is not active"):
+            self.harness.run_action("benchmark-scrape")
+
+        mock_benchmark.assert_not_called()
+
+    def test_cardinality_report(self, mocker):
+        """Test the cardinality of the exporter metrics is reported."""
+        mock_cardinality = mocker.patch("scrape.cardinality", return_value={"series": 10})
+        self.harness.update_config({"port": 9000, "probe_timeout": 10})
+        self.harness.begin()
+
+        output = self.harness.run_action("cardinality-report", {"top": 5})
+
+        mock_cardinality.assert_called_once_with(9000, 10.0, 5)
+        assert output.results == {"series": 10}
+
+    @pytest.mark.parametrize(
+        "error, message",
+        [
+            (TimeoutError("scrape not complete after 30s"), "scrape not complete after 30s"),
+            (http.client.RemoteDisconnected(), "RemoteDisconnected"),
+        ],
+    )
+    def test_cardinality_report_error(self, error, message, mocker):
+        """Test the action fails when the exporter cannot be scraped."""
+        mocker.patch("scrape.cardinality", side_effect=error)
+        self.harness.begin()
+
+        with pytest.raises(ops.testing.ActionFailed, match=f"Failed to scrape.*: {message}"):
+            self.harness.run_action("cardinality-report")
+
+    def test_on_leader_elected(self):
+        """Test a new leader takes over the refresh token handling."""
+        self._add_peers("requested")
+        self.harness.begin()
+        self.harness.set_leader(True)
+        assert self.harness.charm._refresh_token() == "openstack-exporter/0"
+
+    @pytest.mark.parametrize(
+        "state, serving, released",
+        [
+            (None, True, False),
+            ("requested", True, False),
+            ("refreshed", False, False),
+            ("refreshed", True, True),
+        ],
+    )
+    def test_release_refresh_token(self, state, serving, released, mocker):
+        """Test the token is released once the refreshed exporter serves metrics."""
+        mock_serving = mocker.patch("charm.exporter_serving", return_value=serving)
+        rel_id = self._add_peers(state, "requested")
+        self.harness.set_leader(True)
+        self.harness.begin()
+        self.harness.disable_hooks()
+        self.harness.update_relation_data(
+            rel_id, "openstack-exporter", {REFRESH_TOKEN: "openstack-exporter/0"}
+        )
+
+        self.harness.charm._release_refresh_token()
+
+        unit_data = self.harness.get_relation_data(rel_id, "openstack-exporter/0")
+        assert (REFRESH_STATE not in unit_data) is (state is None or released)
+        if state == "refreshed":
+            mock_serving.assert_called_once_with(9180)
+        expected_token = "openstack-exporter/1" if released else "openstack-exporter/0"
+        assert self.harness.charm._refresh_token() == expected_token
+
+    @pytest.mark.parametrize(
+        "config, state",
+        [
+            # not related to cos-agent: the exporter is stopped after the refresh
+            ({}, "refreshed"),
+            # not configured: the snap is not even refreshed
+            ({"port": 0}, "requested"),
+        ],
+    )
+    def test_release_refresh_token_exporter_stopped(self, config, state, mocker):
+        """Test the token is released when the exporter is stopped on purpose."""
+        mocker.patch("charm.exporter_serving", return_value=False)
+        mocker.patch("charm.get_installed_snap_service").return_value.present = False
+        mocker.patch("charm.OpenstackExporterOperatorCharm.install")
+        rel_id = self._add_peers(state, "requested")
+        self.harness.set_leader(True)
+        self.harness.update_config(config)
+        self.harness.begin()
+        self.harness.disable_hooks()
+        self.harness.update_relation_data(
+            rel_id, "openstack-exporter", {REFRESH_TOKEN: "openstack-exporter/0"}
+        )
+
+        self.harness.charm._configure(mocker.Mock())
+
+        assert REFRESH_STATE not in self.harness.get_relation_data(rel_id, "openstack-exporter/0")
+        assert self.harness.charm._refresh_token() == "openstack-exporter/1"
+
+    def test_release_refresh_token_past_deadline(self, mocker):
+        """Test the token is released once the exporter did not warm up before the deadline."""
+        mocker.patch("charm.exporter_serving", return_value=False)
+        mock_time = mocker.patch("charm.time.time", return_value=1000.0)
+        rel_id = self._add_peers("requested", "requested")
+        self.harness.begin()
+        self.harness.disable_hooks()
+        self.harness.update_relation_data(
+            rel_id, "openstack-exporter", {REFRESH_TOKEN: "openstack-exporter/0"}
+        )
+        self.harness.charm._set_refresh_state("refreshed")
+        unit_data = self.harness.get_relation_data(rel_id, "openstack-exporter/0")
+        assert unit_data[REFRESH_DEADLINE] == str(1000 + REFRESH_WARMUP_TIMEOUT)
+
+        self.harness.charm._release_refresh_token()
+        assert unit_data[REFRESH_STATE] == "refreshed"
+
+        mock_time.return_value = 1001.0 + REFRESH_WARMUP_TIMEOUT
+        self.harness.charm._release_refresh_token()
+        assert REFRESH_STATE not in unit_data
+        assert REFRESH_DEADLINE not in unit_data
+
+    def test_grant_refresh_token_past_deadline(self, mocker):
+        """Test the leader takes the token back from a unit which never warms up."""
+        mocker.patch("charm.time.time", return_value=1000.0)
+        rel_id = self._add_peers(None, "refreshed", "requested")
+        self.harness.set_leader(True)
+        self.harness.begin()
+        self.harness.disable_hooks()
+        self.harness.update_relation_data(
+            rel_id, "openstack-exporter", {REFRESH_TOKEN: "openstack-exporter/1"}
+        )
+
+        self.harness.update_relation_data(
+            rel_id, "openstack-exporter/1", {REFRESH_DEADLINE: "2000"}
+        )
+        self.harness.charm._grant_refresh_token()
+        assert self.harness.charm._refresh_token() == "openstack-exporter/1"
+
+        self.harness.update_relation_data(
+            rel_id, "openstack-exporter/1", {REFRESH_DEADLINE: "999"}
+        )
+        self.harness.charm._grant_refresh_token()
+        assert self.harness.charm._refresh_token() == "openstack-exporter/2"
+
+    def test_release_refresh_token_without_peers(self, mocker):
+        """Test there is nothing to release before the peer relation exists."""
+        mock_serving = mocker.patch("charm.exporter_serving")
+        self.harness.begin()
+        self.harness.charm._release_refresh_token()
+        mock_serving.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "token, state, configured",
+        [
+            ("openstack-exporter/0", "requested", True),
+            ("openstack-exporter/0", "refreshed", False),
+            ("openstack-exporter/1", "requested", False),
+        ],
+    )
+    def test_on_peers_changed(self, token, state, configured, mocker):
+        """Test the unit refreshes the snap when it receives the refresh token."""
+        mocker.patch("charm.exporter_serving", return_value=False)
+        rel_id = self._add_peers(state, "requested")
+        self.harness.begin()
+        mock_configure = self.harness.charm._configure = mocker.Mock()
+
+        self.harness.update_relation_data(rel_id, "openstack-exporter", {REFRESH_TOKEN: token})
+
+        assert mock_configure.called is configured
+
+    def test_on_peers_changed_leader(self, mocker):
+        """Test the leader hands out the token when a unit requests it."""
+        rel_id = self._add_peers(None, None)
+        self.harness.set_leader(True)
+        self.harness.begin()
+
+        self.harness.update_relation_data(
+            rel_id, "openstack-exporter/1", {REFRESH_STATE: "requested"}
+        )
+
+        assert self.harness.charm._refresh_token() == "openstack-exporter/1"
+
+    @pytest.mark.parametrize(
+        "state, message",
+        [
+            ("requested", f"{SNAP_NAME} refresh queued, waiting for the other units"),
+            ("refreshed", f"{SNAP_NAME} refreshed, waiting for the exporter to serve metrics"),
+        ],
+    )
+    def test_collect_status_rolling_refresh(self, state, message, mocker):
+        """Test the unit status shows the progress of the rolling refresh."""
+        mocker.patch("charm.get_installed_snap_service")
+        mocker.patch("charm.OpenstackExporterOperatorCharm._get_keystone_data", return_value={})
+        mocker.patch(
+            "charm.OpenstackExporterOperatorCharm._upstream_snap_present", return_value=False
+        )
+        mock_event = mock.MagicMock()
+        self._add_peers(state)
+        self.harness.begin()
+
+        self.harness.charm._on_collect_unit_status(mock_event)
+
+        mock_event.add_status.assert_any_call(ops.ActiveStatus(message))
 
     @mock.patch("charm.snap_install_or_refresh")
     def test_install_snap_error(self, mock_install):
@@ -286,7 +1291,7 @@ class TestCharm:
         mocker.patch("charm.snap_install_or_refresh")
 
         mock_cacert = mocker.patch("charm.OS_CLIENT_CONFIG_CACERT")
-        mock_yaml_dump = mocker.patch("charm.yaml.dump")
+        mock_yaml_dump = mocker.patch("yaml.dump")
         mock_yaml_dump.return_value = "yaml content"
 
         mock_get_installed_snap_service = mocker.patch("charm.get_installed_snap_service")
@@ -531,6 +1536,7 @@ class TestCharm:
         self.harness.begin()
         mock_getsize = mocker.patch("charm.os.path.getsize")
         mock_getsize.return_value = 1024  # Non-empty file
+        mocker.patch("charm.file_digest", return_value="my-digest")
 
         mock_fetch = mocker.patch.object(self.harness.charm.model.resources, "fetch")
         mock_fetch.return_value = Path("/path/to/snap/resource")
@@ -578,12 +1584,103 @@ class TestCharm:
         result = self.harness.charm.get_resource()
         assert result is None
 
+    def test_get_resource_is_cached(self, tmp_path):
+        """Test get_resource fetches once and remembers the path, size and digest."""
+        resource = tmp_path / "openstack-exporter.snap"
+        resource.write_bytes(b"snap contents")
+        self.harness.begin()
+
+        with mock.patch.object(
+            self.harness.charm.model.resources, "fetch", return_value=resource
+        ) as mock_fetch:
+            assert self.harness.charm.get_resource() == str(resource)
+            assert self.harness.charm.get_resource() == str(resource)
+
+        mock_fetch.assert_called_once()
+        assert self.harness.charm._stored.resource_path == str(resource)
+        assert self.harness.charm._stored.resource_size == len(b"snap contents")
+        assert (
+            self.harness.charm._stored.resource_digest
+            == hashlib.sha256(b"snap contents").hexdigest()
+        )
+
+    def test_get_resource_absent_is_cached(self):
+        """Test get_resource remembers there is no resource until upgrade-charm."""
+        self.harness.begin()
+
+        with (
+            mock.patch.object(
+                self.harness.charm.model.resources,
+                "fetch",
+                side_effect=ops.model.ModelError("cannot fetch charm resource"),
+            ) as mock_fetch,
+            mock.patch.object(self.harness.charm, "install"),
+        ):
+            assert self.harness.charm.get_resource() is None
+            assert self.harness.charm.get_resource() is None
+            mock_fetch.assert_called_once()
+
+            self.harness.charm.on.upgrade_charm.emit()
+
+        assert mock_fetch.call_count == 2
+
+    def test_get_resource_refetch_when_file_changed(self, tmp_path):
+        """Test get_resource fetches again when the cached file changed size."""
+        resource = tmp_path / "openstack-exporter.snap"
+        resource.write_bytes(b"snap contents")
+        self.harness.begin()
+
+        with mock.patch.object(
+            self.harness.charm.model.resources, "fetch", return_value=resource
+        ) as mock_fetch:
+            self.harness.charm.get_resource()
+            resource.write_bytes(b"new snap")
+            self.harness.charm.get_resource()
+
+        assert mock_fetch.call_count == 2
+        assert self.harness.charm._stored.resource_size == len(b"new snap")
+
+    def test_get_resource_refetch_when_file_missing(self, tmp_path):
+        """Test get_resource fetches again when the cached file is gone."""
+        resource = tmp_path / "openstack-exporter.snap"
+        resource.write_bytes(b"snap contents")
+        self.harness.begin()
+
+        with mock.patch.object(
+            self.harness.charm.model.resources,
+            "fetch",
+            side_effect=[resource, ops.model.ModelError("cannot fetch charm resource")],
+        ) as mock_fetch:
+            self.harness.charm.get_resource()
+            resource.unlink()
+            assert self.harness.charm.get_resource() is None
+
+        assert mock_fetch.call_count == 2
+        assert self.harness.charm._stored.resource_path == ""
+
+    def test_get_resource_refresh(self, tmp_path):
+        """Test get_resource fetches again when asked to refresh."""
+        resource = tmp_path / "openstack-exporter.snap"
+        resource.write_bytes(b"")
+        self.harness.begin()
+
+        with mock.patch.object(
+            self.harness.charm.model.resources, "fetch", return_value=resource
+        ) as mock_fetch:
+            assert self.harness.charm.get_resource() is None
+            assert self.harness.charm.get_resource(refresh=True) is None
+
+        assert mock_fetch.call_count == 2
+        assert self.harness.charm._stored.resource_digest == ""
+
+    @mock.patch("charm.OpenstackExporterOperatorCharm.get_resource")
     @mock.patch("charm.OpenstackExporterOperatorCharm.install")
-    def test_on_upgrade(self, mock_install):
-        """Test the charm is installed in upgrade event."""
+    def test_on_upgrade(self, mock_install, mock_get_resource):
+        """Test the resource is fetched again and the charm is installed in upgrade event."""
         self.harness.begin()
         upgrade_event = mock.MagicMock()
         self.harness.charm._on_upgrade(upgrade_event)
+        mock_get_resource.assert_called_once_with(refresh=True)
         mock_install.assert_called_once()
 
     @pytest.mark.parametrize(
@@ -606,6 +1703,19 @@ class TestCharm:
             ("cache_ttl", "2m3.4s"),
             ("cache_ttl", "1h2m3s4ms5us6ns"),
             ("cache_ttl", "39h9m14s"),
+            ("restart_window", 0),
+            ("restart_window", 300),
+            ("gomaxprocs", 4),
+            ("gomemlimit", "512MiB"),
+            ("cpu_quota", "150%"),
+            ("memory_high", "2G"),
+            ("nice", 10),
+            ("io_scheduling_class", "best-effort"),
+            ("api_microversions", "compute=2.87,placement=1.29"),
+            ("probe_timeout", 60),
+            ("probe_latency_threshold", 0.0),
+            ("probe_empty_threshold", 0),
+            ("capacity_rules_interval", "5m"),
         ],
     )
     def test_config_change_with_valid_config(self, config_option, config_value, mocker):
@@ -0,0 +1,134 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+
+import ops.testing
+import pytest
+from charms.grafana_agent.v0 import cos_agent
+
+import alert_rules
+import cos_agent_provider
+import dashboards
+from charm import OpenstackExporterOperatorCharm
+
+
+@pytest.fixture
+def harness():
+    harness = ops.testing.Harness(OpenstackExporterOperatorCharm)
+    yield harness
+    harness.cleanup()
+
+
+def add_relations(harness, count):
+    """Relate the charm to `count` grafana-agent applications, return the relation ids."""
+    rel_ids = []
+    for index in range(count):
+        rel_id = harness.add_relation("cos-agent", f"grafana-agent-{index}")
+        harness.add_relation_unit(rel_id, f"grafana-agent-{index}/0")
+        rel_ids.append(rel_id)
+    return rel_ids
+
+
+@pytest.mark.parametrize("relations", [1, 20])
+def test_refresh_cost_does_not_grow_with_relations(harness, relations, mocker):
+    """Test the rules are loaded and the dashboards compressed once, whatever the relations."""
+    rel_ids = add_relations(harness, relations)
+    harness.begin()
+    mock_serialize = mocker.spy(cos_agent.GrafanaDashboard, "_serialize")
+    mock_add_path = mocker.spy(cos_agent.AlertRules, "add_path")
+    mock_unit_data = mocker.spy(harness.charm._grafana_agent, "_unit_data")
+
+    harness.charm._grafana_agent._on_refresh(None)
+    harness.charm._grafana_agent._on_refresh(None)
+
+    assert mock_serialize.call_count == len(list(dashboards.DASHBOARDS_DIR.iterdir()))
+    # the metrics and the log alert rules
+    assert mock_add_path.call_count == 2
+    mock_unit_data.assert_called_once()
+    data = {
+        harness.get_relation_data(rel_id, harness.charm.unit.name)["config"] for rel_id in rel_ids
+    }
+    assert len(data) == 1
+    assert "NovaMetricsMissing" in data.pop()
+
+
+def test_refresh_after_files_changed(harness):
+    """Test the data is built again when the generated files changed during the hook."""
+    [rel_id] = add_relations(harness, 1)
+    harness.begin()
+    harness.charm._grafana_agent._on_refresh(None)
+
+    alert_rules.write_rules(["nova"])
+    harness.charm._grafana_agent._on_refresh(None)
+
+    data = json.loads(harness.get_relation_data(rel_id, harness.charm.unit.name)["config"])
+    rules = json.dumps(data["metrics_alert_rules"])
+    assert "NovaMetricsMissing" in rules
+    assert "CinderMetricsMissing" not in rules
+
+
+def test_refresh_not_related(harness, mocker):
+    """Test nothing is built without cos-agent relations."""
+    harness.begin()
+    mock_unit_data = mocker.spy(harness.charm._grafana_agent, "_unit_data")
+
+    harness.charm._grafana_agent._on_refresh(None)
+
+    mock_unit_data.assert_not_called()
+
+
+def test_refresh_invalid_data(harness, mocker):
+    """Test invalid data is logged and not written."""
+    [rel_id] = add_relations(harness, 1)
+    harness.begin()
+    mocker.patch.object(
+        harness.charm._grafana_agent,
+        "_unit_data",
+        side_effect=json.decoder.JSONDecodeError("invalid", "", 0),
+    )
+    mock_logger = mocker.patch("cos_agent_provider.logger")
+
+    harness.charm._grafana_agent._on_refresh(None)
+
+    mock_logger.error.assert_called_once()
+    assert "config" not in harness.get_relation_data(rel_id, harness.charm.unit.name)
+
+
+def test_unit_data_within_budget(harness):
+    """Test the unit data with the rules and dashboards of all the services is within budget."""
+    [rel_id] = add_relations(harness, 1)
+    harness.begin()
+
+    harness.charm._grafana_agent._on_refresh(None)
+
+    data = harness.get_relation_data(rel_id, harness.charm.unit.name)["config"]
+    sizes = harness.charm._grafana_agent.unit_data_sizes
+    assert sizes["total"] == len(data.encode())
+    assert sizes["total"] <= cos_agent_provider.UNIT_DATA_BUDGET
+    assert sizes.keys() == {
+        "metrics_alert_rules",
+        "log_alert_rules",
+        "dashboards",
+        "metrics_scrape_jobs",
+        "log_slots",
+        "total",
+    }
+    # minified, without the null subordinate flag
+    assert data.startswith('{"metrics_alert_rules":{"groups":[{')
+    assert "subordinate" not in data
+
+
+def test_unit_data_sizes_logged(harness, mocker):
+    """Test the size of the unit data is logged when it changes, with a warning over budget."""
+    add_relations(harness, 1)
+    harness.begin()
+    mocker.patch("cos_agent_provider.UNIT_DATA_BUDGET", 100)
+    mock_logger = mocker.patch("cos_agent_provider.logger")
+
+    harness.charm._grafana_agent._on_refresh(None)
+    harness.charm._grafana_agent._on_refresh(None)
+
+    mock_logger.info.assert_called_once()
+    assert "dashboards" in mock_logger.info.call_args.args[2]
+    mock_logger.warning.assert_called_once()
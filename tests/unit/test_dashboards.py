@@ -0,0 +1,235 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import re
+
+import pytest
+import yaml
+
+import alert_rules
+import dashboards
+
+TEMPLATES = {
+    path.name: json.loads(path.read_text())
+    for path in dashboards.DASHBOARD_TEMPLATES_DIR.glob("*.json")
+}
+
+VARIABLES = [
+    pytest.param(variable, id=f"{name}:{variable['name']}")
+    for name, template in sorted(TEMPLATES.items())
+    for variable in template.get("templating", {}).get("list", [])
+    if variable.get("type") == "query"
+]
+RECORDED_SERIES = {
+    rule["record"]
+    for path in alert_rules.RULE_TEMPLATES_DIR.glob("*.yaml")
+    for group in yaml.safe_load(path.read_text())["groups"]
+    for rule in group["rules"]
+    if "record" in rule
+}
+# A series per scrape target
+BOUNDED_SERIES = {"up"}
+# Series of the exporters of other charms: a rule of this charm would be evaluated with its own
+# juju topology matchers and select nothing, label_values() at least asks Prometheus for the
+# values of the label only instead of every series.
+FOREIGN_SERIES = {"libvirt_domain_info_meta"}
+LABEL_VALUES_PATTERN = re.compile(r"^label_values\((?P<series>[\w:]+)(?:\{[^}]*\})?, *\w+\)$")
+# A single series, e.g. query_result(max(...))
+AGGREGATED_RESULT_PATTERN = re.compile(r"^query_result\((?:max|min|sum|count|avg)\(")
+
+# e.g. tenant_id:openstack_nova_quota:used
+RECORDED_SERIES_PATTERN = re.compile(r"\b\w+:\w+:\w+\b")
+
+
+def panel(title, expr=None, panel_type="stat", **extra):
+    """Return a panel querying the given expression."""
+    targets = [{"expr": expr}] if expr else []
+    return {"type": panel_type, "title": title, "targets": targets, **extra}
+
+
+def row(title, **extra):
+    """Return a row."""
+    return {"type": "row", "title": title, **extra}
+
+
+def iter_panels(panels):
+    """Yield the panels and the panels nested in collapsed rows."""
+    for item in panels:
+        yield item
+        yield from iter_panels(item.get("panels", []))
+
+
+def test_compact():
+    """Test the null members and the empty ones Grafana defaults are removed, recursively."""
+    value = {
+        "id": None,
+        "links": [],
+        "options": {"legend": {}, "reduce": {"calcs": []}},
+        "title": "",
+        "panels": [
+            {
+                "fieldConfig": {"defaults": {"mappings": []}, "overrides": []},
+                "gridPos": {"x": 0},
+                "targets": [],
+                "transformations": [],
+            },
+            None,
+        ],
+        "version": 0,
+    }
+    assert dashboards.compact(value) == {
+        "options": {"legend": {}, "reduce": {"calcs": []}},
+        "title": "",
+        "panels": [
+            {"fieldConfig": {"defaults": {}, "overrides": []}, "gridPos": {"x": 0}, "targets": []},
+            None,
+        ],
+        "version": 0,
+    }
+
+
+def test_templates_have_no_duplicated_panels():
+    """Test no panel of the templates is a copy of another, but for its id and position."""
+    seen = {}
+    for name, template in TEMPLATES.items():
+        for panel in iter_panels(template.get("panels", [])):
+            if panel.get("type") == "row":
+                continue
+            key = json.dumps(
+                {k: v for k, v in panel.items() if k not in ("id", "gridPos")}, sort_keys=True
+            )
+            assert key not in seen, f"{name}: {panel.get('title')} duplicates {seen[key]}"
+            seen[key] = f"{name}: {panel.get('title')}"
+
+
+@pytest.mark.parametrize(
+    "services, expected",
+    [
+        (
+            ["nova", "cinder"],
+            ["Status", "Nova agents", "Cinder agents", "Nova and cinder", "Usage", "Ceph"],
+        ),
+        (["nova"], ["Status", "Nova agents", "Usage", "Ceph"]),
+        (["neutron"], ["Usage", "Ceph"]),
+        ([], ["Usage", "Ceph"]),
+    ],
+)
+def test_filter_panels(services, expected):
+    """Test the panels of other services are removed, along with the rows left empty."""
+    panels = [
+        row("Status"),
+        panel("Nova agents", "count(openstack_nova_agent_state)"),
+        panel("Cinder agents", 'openstack_cinder_agent_state{adminState="enabled"}'),
+        panel("Nova and cinder", "openstack_nova_up + openstack_cinder_up"),
+        row("Usage"),
+        panel("Ceph", "ceph_cluster_total_bytes"),
+        row("Neutron", collapsed=True, panels=[panel("Ports", "openstack_neutron_port")]),
+        row("Empty"),
+    ]
+    kept = dashboards.filter_panels(panels, services)
+    titles = [panel["title"] for panel in kept]
+    assert titles == expected + (["Neutron"] if "neutron" in services else [])
+    if "neutron" in services:
+        assert kept[-1]["panels"] == panels[-2]["panels"]
+
+
+def test_render_dashboards_all():
+    """Test all the panels are kept, minified, as long as the services are not known."""
+    rendered = dashboards.render_dashboards(None)
+
+    assert sorted(rendered) == sorted(TEMPLATES)
+    for name, content in rendered.items():
+        assert "\n" not in content
+        assert json.loads(content) == dashboards.compact(TEMPLATES[name])
+
+
+def test_render_dashboards_services():
+    """Test the panels of the services not reported are removed."""
+    rendered = dashboards.render_dashboards(["nova", "identity"])
+
+    titles = [panel.get("title") for panel in json.loads(rendered["service.json"])["panels"]]
+    assert titles == [
+        "Service status",
+        "Nova agents down",
+        "Nova agent status",
+        "Nova agents up",
+        "Resource Usage",
+        "Keystone stats",
+        "Virtual Machines",
+    ]
+    assert len(rendered["service.json"]) < len(dashboards.render_dashboards(None)["service.json"])
+
+
+def test_write_dashboards():
+    """Test the dashboards are only written when they change."""
+    assert dashboards.write_dashboards(None) is True
+    assert sorted(path.name for path in dashboards.DASHBOARDS_DIR.iterdir()) == sorted(TEMPLATES)
+    assert dashboards.write_dashboards(None) is False
+    assert dashboards.write_dashboards(["nova"]) is True
+
+
+def test_remove_dashboards():
+    """Test the generated dashboards are removed, even if there are none."""
+    dashboards.write_dashboards(None)
+    dashboards.remove_dashboards()
+    assert not dashboards.DASHBOARDS_DIR.exists()
+    dashboards.remove_dashboards()
+
+
+@pytest.mark.parametrize("variable", VARIABLES)
+def test_variable_queries_bounded_series(variable):
+    """Test the variables are populated from a recorded, aggregated or foreign series, on load.
+
+    Listing every series of a metric with a label per instance or port to extract the values
+    of a variable takes longer than the panels on a large cloud. The variables are refreshed
+    when the dashboard is loaded (1), not again on every time range change (2).
+    """
+    query = variable["query"]
+    query = query["query"] if isinstance(query, dict) else query
+
+    if match := LABEL_VALUES_PATTERN.match(query):
+        assert match["series"] in RECORDED_SERIES | BOUNDED_SERIES | FOREIGN_SERIES
+        assert not variable.get("regex")
+    else:
+        assert AGGREGATED_RESULT_PATTERN.match(query)
+    assert variable["refresh"] == 1
+
+
+def test_project_dashboard_capacity_reads_recorded_series():
+    """Test the usage and quota panels of the project dashboard only read recorded series."""
+    exprs = [
+        target["expr"]
+        for panel in TEMPLATES["project.json"]["panels"]
+        if panel["type"] in ("piechart", "stat")
+        for target in panel["targets"]
+    ]
+
+    assert len(exprs) == 13
+    for expr in exprs:
+        assert set(RECORDED_SERIES_PATTERN.findall(expr)) <= RECORDED_SERIES
+        assert re.sub(RECORDED_SERIES_PATTERN, "", expr).count("openstack_") == 0
+
+
+def test_capacity_planning_reads_hourly_series():
+    """Test the capacity planning panels read hourly series, at most one sample per hour.
+
+    They are opened over months, where the raw series of every hypervisor would be read. The
+    series are selected over the last hour, as they are older than the 5m lookback between two
+    evaluations.
+    """
+    row = next(
+        panel
+        for panel in TEMPLATES["cloud.json"]["panels"]
+        if panel.get("title") == "Capacity planning"
+    )
+
+    assert len(row["panels"]) == 3
+    for panel in row["panels"]:
+        assert panel["interval"] == "1h"
+        for target in panel["targets"]:
+            series = RECORDED_SERIES_PATTERN.search(target["expr"])[0]
+            assert series.endswith("_1h")
+            assert series in RECORDED_SERIES
+            assert target["expr"].startswith(f"last_over_time({series}")
+            assert target["expr"].endswith("[1h])")
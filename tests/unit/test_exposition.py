@@ -0,0 +1,116 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import io
+
+import pytest
+
+import exposition
+from exposition import Sample
+
+METRICS = b"""\
+# HELP openstack_neutron_port port
+# TYPE openstack_neutron_port gauge
+openstack_neutron_port{device_owner="compute:nova",name="a \\"quoted\\"\\\\ name\\n"} 1
+openstack_neutron_port{ device_owner = "network:dhcp" , name="b" } 1 1700000000000
+# TYPE openstack_request_duration_seconds histogram
+openstack_request_duration_seconds_bucket{le="+Inf"} 2
+openstack_request_duration_seconds_sum 1.5
+openstack_request_duration_seconds_count 2
+# TYPE openstack_placement_count gauge
+openstack_placement_count NaN
+
+not a sample
+openstack_nova_up one
+"""
+
+
+def test_iter_lines():
+    """Test the lines are yielded with their newline, the last one may have none."""
+    stream = io.BytesIO(b"a 1\nb 2\nc 3")
+    assert list(exposition.iter_lines(stream)) == [b"a 1\n", b"b 2\n", b"c 3"]
+
+
+def test_iter_lines_too_long():
+    """Test the lines longer than the limit are skipped."""
+    stream = io.BytesIO(b"a 1\n" + b"x" * 25 + b"\nb 2\n" + b"y" * 11 + b"\n" + b"z" * 10 + b"\n")
+    assert list(exposition.iter_lines(stream, max_line=10)) == [
+        b"a 1\n",
+        b"b 2\n",
+        b"z" * 10 + b"\n",
+    ]
+
+
+def test_parse_samples():
+    """Test the samples are parsed with their family, labels and value."""
+    samples = list(exposition.parse_samples(exposition.iter_lines(io.BytesIO(METRICS))))
+
+    assert samples[:5] == [
+        Sample(
+            "openstack_neutron_port",
+            "openstack_neutron_port",
+            {"device_owner": "compute:nova", "name": 'a "quoted"\\ name\n'},
+            1.0,
+        ),
+        Sample(
+            "openstack_neutron_port",
+            "openstack_neutron_port",
+            {"device_owner": "network:dhcp", "name": "b"},
+            1.0,
+        ),
+        Sample(
+            "openstack_request_duration_seconds",
+            "openstack_request_duration_seconds_bucket",
+            {"le": "+Inf"},
+            2.0,
+        ),
+        Sample(
+            "openstack_request_duration_seconds",
+            "openstack_request_duration_seconds_sum",
+            {},
+            1.5,
+        ),
+        Sample(
+            "openstack_request_duration_seconds",
+            "openstack_request_duration_seconds_count",
+            {},
+            2.0,
+        ),
+    ]
+    # a gauge ending with _count is a family of its own, the malformed lines are skipped
+    assert len(samples) == 6
+    assert samples[5].family == "openstack_placement_count"
+
+
+def test_parse_samples_families():
+    """Test only the samples of the requested families are yielded."""
+    samples = exposition.parse_samples(
+        METRICS.splitlines(keepends=True), families={"openstack_request_duration_seconds"}
+    )
+    assert [sample.name for sample in samples] == [
+        "openstack_request_duration_seconds_bucket",
+        "openstack_request_duration_seconds_sum",
+        "openstack_request_duration_seconds_count",
+    ]
+
+
+def test_parse_samples_early_exit():
+    """Test the lines are only read up to the samples consumed."""
+    stream = io.BytesIO(METRICS)
+    sample = next(exposition.parse_samples(exposition.iter_lines(stream)))
+    assert sample.name == "openstack_neutron_port"
+    assert stream.tell() < len(METRICS) / 2
+
+
+@pytest.mark.parametrize(
+    "name, types, expected",
+    [
+        ("openstack_duration_bucket", {"openstack_duration": "histogram"}, "openstack_duration"),
+        ("openstack_duration_count", {"openstack_duration": "summary"}, "openstack_duration"),
+        ("openstack_duration_count", {}, "openstack_duration_count"),
+        ("openstack_duration", {"openstack_duration": "summary"}, "openstack_duration"),
+    ],
+)
+def test_family_of(name, types, expected):
+    """Test the histogram and summary series are attributed to their family."""
+    assert exposition.family_of(name, types) == expected
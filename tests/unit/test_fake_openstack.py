@@ -0,0 +1,88 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import sys
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+# the fake OpenStack APIs are a script of the benchmarks
+sys.path.append(str(Path(__file__).parents[1] / "benchmark"))
+from fake_openstack import FakeOpenStack, Scale, resource_id  # noqa: E402
+
+
+@pytest.fixture()
+def fake_openstack():
+    """Run the fake OpenStack APIs of a small cloud on an ephemeral port of localhost."""
+    server = FakeOpenStack(Scale(servers=5, projects=2))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(url, data=None, headers=None):
+    """Send the request and return the JSON body and the headers of the response."""
+    req = urllib.request.Request(url, data=data, headers=headers or {})
+    with urllib.request.urlopen(req, timeout=5) as response:
+        return json.load(response), response.headers
+
+
+def test_catalog(fake_openstack):
+    """Test a token is issued along with the catalog of every service."""
+    body, headers = request(f"{fake_openstack.url}/v3/auth/tokens", data=b"{}")
+
+    assert headers["X-Subject-Token"] == "fake-token"
+    catalog = {service["type"]: service for service in body["token"]["catalog"]}
+    assert set(catalog) == {
+        "identity",
+        "compute",
+        "network",
+        "volumev3",
+        "image",
+        "placement",
+        "load-balancer",
+    }
+    endpoints = catalog["compute"]["endpoints"]
+    assert {endpoint["interface"] for endpoint in endpoints} == {"public", "internal", "admin"}
+    assert endpoints[0]["url"] == f"{fake_openstack.url}/compute/v2.1"
+
+
+def test_paginated_list(fake_openstack):
+    """Test the lists are paginated, the next link keeping the filters of the query."""
+    url = f"{fake_openstack.url}/compute/v2.1/servers/detail?all_tenants=True&limit=2"
+    ids = []
+    pages = 0
+    while url:
+        body, _ = request(url)
+        ids += [server["id"] for server in body["servers"]]
+        pages += 1
+        url = body.get("next")
+        if url:
+            query = parse_qs(urlsplit(url).query)
+            assert query["all_tenants"] == ["True"]
+            assert query["limit"] == ["2"]
+            assert query["marker"] == [ids[-1]]
+
+    assert pages == 3
+    assert ids == [resource_id(4, index) for index in range(5)]
+    assert fake_openstack.requests["compute"] == 3
+
+
+def test_microversion_not_supported(fake_openstack):
+    """Test a microversion above the highest one of the service is refused."""
+    with pytest.raises(urllib.error.HTTPError) as err:
+        request(
+            f"{fake_openstack.url}/compute/v2.1/flavors/detail",
+            headers={"OpenStack-API-Version": "compute 2.100"},
+        )
+
+    assert err.value.code == 406
+    assert err.value.headers["OpenStack-API-Version"] == "compute 2.100"
+    err.value.close()
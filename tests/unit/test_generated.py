@@ -0,0 +1,29 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import generated
+
+
+def test_write_files(tmp_path):
+    """Test the directory ends up with exactly the given files."""
+    directory = tmp_path / "generated"
+    assert generated.write_files(directory, {"a": "1", "b": "2"}) is True
+    assert generated.write_files(directory, {"a": "1", "b": "2"}) is False
+    assert generated.write_files(directory, {"a": "1"}) is True
+    assert sorted(path.name for path in directory.iterdir()) == ["a"]
+    assert generated.write_files(directory, {"a": "3"}) is True
+    assert (directory / "a").read_text() == "3"
+
+
+def test_stat_digest(tmp_path):
+    """Test the digest of the files changes when a file is added, changed or removed."""
+    (tmp_path / "a").write_text("a")
+    digest = generated.stat_digest(tmp_path, tmp_path / "missing")
+    assert generated.stat_digest(tmp_path) == digest
+
+    (tmp_path / "b").write_text("b")
+    assert generated.stat_digest(tmp_path) != digest
+    (tmp_path / "b").unlink()
+    assert generated.stat_digest(tmp_path) == digest
+    (tmp_path / "a").write_text("aa")
+    assert generated.stat_digest(tmp_path) != digest
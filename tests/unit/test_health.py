@@ -0,0 +1,57 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import pytest
+
+import health
+
+
+def probe_result(latency=1.0, series=100, error="", up=None):
+    """Return the result of a probe."""
+    return {"latency": latency, "series": series, "error": error, "up": up or {}}
+
+
+@pytest.mark.parametrize(
+    "history, expected",
+    [
+        # nothing probed yet, or all good
+        ([], None),
+        ([probe_result(), probe_result()], None),
+        # median latency above the threshold, a single slow scrape is not enough
+        ([probe_result(1.0), probe_result(50.0), probe_result(2.0)], None),
+        (
+            [probe_result(1.0), probe_result(50.0), probe_result(30.0)],
+            "median scrape latency 30.0s > 20s",
+        ),
+        # too many empty or failed scrapes in a row
+        (
+            [probe_result(series=0), probe_result(series=0)],
+            None,
+        ),
+        (
+            [probe_result(series=0), probe_result(error="timed out"), probe_result(series=0)],
+            "no metrics in the last 3 scrapes (empty)",
+        ),
+        (
+            [probe_result(series=0), probe_result(series=0), probe_result(error="timed out")],
+            "no metrics in the last 3 scrapes (timed out)",
+        ),
+        # OpenStack services reported down by the exporter are left to the alert rules
+        ([probe_result(up={"nova": 1.0, "neutron": 0.0, "cinder": 0.0})], None),
+    ],
+)
+def test_assess(history, expected):
+    """Test the exporter health is assessed from the recent probes."""
+    assert health.assess(history, 20.0, 3) == expected
+
+
+def test_assess_disabled_thresholds():
+    """Test a threshold of 0 disables its check."""
+    history = [probe_result(latency=100.0, series=0)] * 3
+    assert health.assess(history, 0, 0) is None
+
+
+@pytest.mark.parametrize("values, expected", [([3.0], 3.0), ([4.0, 1.0, 3.0, 2.0], 2.5)])
+def test_median(values, expected):
+    """Test the median of an odd and an even number of values."""
+    assert health.median(values) == expected
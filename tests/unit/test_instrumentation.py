@@ -0,0 +1,208 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import subprocess
+from unittest import mock
+
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture()
+def metrics_paths(tmp_path, mocker):
+    """Point the metrics file and the systemd unit at a temporary directory."""
+    metrics_dir = tmp_path / "metrics"
+    service_file = tmp_path / "openstack-exporter-charm-metrics.service"
+    mocker.patch("instrumentation.METRICS_DIR", metrics_dir)
+    mocker.patch("instrumentation.METRICS_FILE", metrics_dir / "metrics.txt")
+    mocker.patch("instrumentation.METRICS_SERVICE_FILE", service_file)
+    return metrics_dir, service_file
+
+
+@pytest.mark.parametrize(
+    "dispatch_path, expected",
+    [
+        ("hooks/config-changed", "config-changed"),
+        ("actions/benchmark-scrape", "benchmark-scrape-action"),
+        ("", "unknown"),
+    ],
+)
+def test_dispatch_name(dispatch_path, expected, monkeypatch):
+    """Test the hook name is derived from the dispatch path."""
+    monkeypatch.setenv("JUJU_DISPATCH_PATH", dispatch_path)
+    assert instrumentation.dispatch_name() == expected
+
+
+def test_process_uptime():
+    """Test the process uptime is read from /proc."""
+    assert 0.0 < instrumentation.process_uptime() < 3600
+
+
+@pytest.mark.parametrize("stat", ["garbage", "1 (python) S 1 2"])
+def test_process_uptime_unknown(stat, mocker):
+    """Test an unreadable /proc/self/stat gives an uptime of 0."""
+    mocker.patch("instrumentation.Path.read_text", return_value=stat)
+    assert instrumentation.process_uptime() == 0.0
+
+
+def test_process_uptime_no_proc(mocker):
+    """Test a missing /proc gives an uptime of 0."""
+    mocker.patch("instrumentation.Path.read_text", side_effect=FileNotFoundError)
+    assert instrumentation.process_uptime() == 0.0
+
+
+class TestDispatchRecorder:
+    """Test DispatchRecorder class."""
+
+    def test_start_installs_a_single_audit_hook(self, mocker):
+        mocker.patch.object(instrumentation.DispatchRecorder, "_audit_hook_installed", False)
+        mock_addaudithook = mocker.patch("instrumentation.sys.addaudithook")
+
+        first = instrumentation.DispatchRecorder.start()
+        second = instrumentation.DispatchRecorder.start()
+
+        mock_addaudithook.assert_called_once_with(instrumentation._audit_hook)
+        assert instrumentation._active_recorder is second
+        assert first is not second
+
+    def test_audit_hook_forwards_to_active_recorder(self, mocker):
+        recorder = instrumentation.DispatchRecorder()
+        mocker.patch("instrumentation._active_recorder", recorder)
+        instrumentation._audit_hook("subprocess.Popen", ("snap", ["snap"], None, None))
+        assert recorder.subprocesses == 1
+
+    def test_audit_hook_without_recorder(self, mocker):
+        mocker.patch("instrumentation._active_recorder", None)
+        instrumentation._audit_hook("subprocess.Popen", ())
+
+    def test_counts_real_subprocesses(self, mocker):
+        """Test subprocesses spawned through the subprocess module are counted."""
+        recorder = instrumentation.DispatchRecorder.start()
+        subprocess.run(["true"], check=True)
+        subprocess.run(["true"], check=True)
+        assert recorder.subprocesses == 2
+
+    def test_audit_counts_snapd_connections_only(self):
+        recorder = instrumentation.DispatchRecorder()
+        sock = mock.Mock()
+        recorder.audit("socket.connect", (sock, instrumentation.SNAPD_SOCKET))
+        recorder.audit("socket.connect", (sock, ("127.0.0.1", 9180)))
+        recorder.audit("open", ("/etc/hosts", "r", 0))
+        assert recorder.snapd_calls == 1
+        assert recorder.subprocesses == 0
+
+    def test_update_totals(self, mocker):
+        mocker.patch("instrumentation.process_uptime", return_value=0.0)
+        mocker.patch("instrumentation.time.monotonic", side_effect=[100.0, 102.5])
+        mocker.patch("instrumentation.time.time", return_value=1700000000.0)
+        recorder = instrumentation.DispatchRecorder()
+        recorder.snapd_calls = 4
+        recorder.subprocesses = 1
+        recorder.restarted = True
+
+        totals = recorder.update_totals({
+            "count": 1,
+            "seconds": 1.5,
+            "last_seconds": 1.5,
+            "snapd_calls": 2,
+            "subprocesses": 3,
+            "restarts": 0,
+            "timestamp": 1600000000.0,
+        })
+
+        assert totals == {
+            "count": 2,
+            "seconds": 4.0,
+            "last_seconds": 2.5,
+            "snapd_calls": 6,
+            "subprocesses": 4,
+            "restarts": 1,
+            "timestamp": 1700000000.0,
+        }
+
+
+def test_render_metrics():
+    """Test the totals are rendered in the Prometheus text format."""
+    text = instrumentation.render_metrics({
+        "update-status": {"count": 3, "restarts": 0},
+        "config-changed": {"count": 1, "restarts": 1},
+    })
+    lines = text.splitlines()
+
+    assert "# TYPE openstack_exporter_charm_hook_dispatches_total counter" in lines
+    assert 'openstack_exporter_charm_hook_dispatches_total{hook="update-status"} 3' in lines
+    assert 'openstack_exporter_charm_hook_exporter_restarts_total{hook="config-changed"} 1' in (
+        lines
+    )
+    # missing keys are rendered as zero
+    assert 'openstack_exporter_charm_hook_snapd_api_calls_total{hook="update-status"} 0' in lines
+    assert text.endswith("\n")
+
+
+def test_write_metrics(metrics_paths):
+    """Test the metrics file is replaced with the new content."""
+    metrics_dir, _ = metrics_paths
+    instrumentation.write_metrics("old\n")
+    instrumentation.write_metrics("new\n")
+    assert (metrics_dir / "metrics.txt").read_text() == "new\n"
+    assert (metrics_dir / "metrics.txt").stat().st_mode & 0o777 == 0o644
+    assert [path.name for path in metrics_dir.iterdir()] == ["metrics.txt"]
+
+
+def test_ensure_metrics_server(metrics_paths, mocker):
+    """Test the unit is written and started when missing."""
+    metrics_dir, service_file = metrics_paths
+    mock_run = mocker.patch("instrumentation.subprocess.run")
+
+    instrumentation.ensure_metrics_server(9181)
+
+    assert f"--directory {metrics_dir} 9181" in service_file.read_text()
+    assert "--bind 127.0.0.1" in service_file.read_text()
+    # not run as root, and only able to read the metrics
+    assert "\nDynamicUser=yes\n" in service_file.read_text()
+    assert "\nNoNewPrivileges=yes\n" in service_file.read_text()
+    assert "\nProtectSystem=strict\n" in service_file.read_text()
+    assert "\nProtectHome=yes\n" in service_file.read_text()
+    assert f"\nReadOnlyPaths={metrics_dir}\n" in service_file.read_text()
+    assert metrics_dir.stat().st_mode & 0o777 == 0o755
+    mock_run.assert_has_calls([
+        mock.call(["systemctl", "daemon-reload"], check=True),
+        mock.call(["systemctl", "enable", instrumentation.METRICS_SERVICE], check=True),
+        mock.call(["systemctl", "restart", instrumentation.METRICS_SERVICE], check=True),
+    ])
+
+
+def test_ensure_metrics_server_unchanged(metrics_paths, mocker):
+    """Test nothing is restarted when the unit is already up to date."""
+    mock_run = mocker.patch("instrumentation.subprocess.run")
+    instrumentation.ensure_metrics_server(9181)
+    mock_run.reset_mock()
+
+    instrumentation.ensure_metrics_server(9181)
+    mock_run.assert_not_called()
+
+    instrumentation.ensure_metrics_server(9182)
+    assert mock_run.call_count == 3
+
+
+def test_remove_metrics_server(metrics_paths, mocker):
+    """Test the unit is stopped and removed."""
+    _, service_file = metrics_paths
+    service_file.write_text("unit")
+    mock_run = mocker.patch("instrumentation.subprocess.run")
+
+    instrumentation.remove_metrics_server()
+
+    assert not service_file.exists()
+    mock_run.assert_has_calls([
+        mock.call(["systemctl", "disable", "--now", instrumentation.METRICS_SERVICE], check=False),
+        mock.call(["systemctl", "daemon-reload"], check=True),
+    ])
+
+
+def test_remove_metrics_server_absent(metrics_paths, mocker):
+    """Test nothing is done when the unit was never installed."""
+    mock_run = mocker.patch("instrumentation.subprocess.run")
+    instrumentation.remove_metrics_server()
+    mock_run.assert_not_called()
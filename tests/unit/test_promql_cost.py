@@ -0,0 +1,117 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import pytest
+from promql_cost import (
+    Violation,
+    check,
+    dashboard_expressions,
+    findings,
+    load_baseline,
+    report,
+    rule_expressions,
+    score,
+    violation_counts,
+)
+
+
+@pytest.mark.parametrize(
+    "expr,expected",
+    [
+        (
+            'sum(openstack_nova_vcpus_used{aggregates=~".*"})',
+            [("unbounded-regex", 'aggregates=~".*"')],
+        ),
+        ('sum(up{hostname=~"compute-.*"})', []),
+        ('sum(up{hostname=~".+-compute"})', [("unbounded-regex", 'hostname=~".+-compute"')]),
+        (
+            'count({__name__=~"openstack_nova_.*"})',
+            [("unbounded-regex", '__name__=~"openstack_nova_.*"')],
+        ),
+        ('up{hostname!~".*"}', []),
+        (
+            "rate(libvirt_domain_info_cpu_time_seconds_total[$__rate_interval])"
+            " * on(juju_unit, domain) group_left(project_name) libvirt_domain_info_meta",
+            [("join-without-rollup", "group_left")],
+        ),
+        ("openstack_nova_server_status * on(id) group_right() instance:meta:group", []),
+        (
+            'a * on(id) group_left() b{device_owner="compute:nova"}',
+            [("join-without-rollup", "group_left")],
+        ),
+        (
+            "topk(10, count by(tenant_id) (openstack_nova_server_status))",
+            [("high-cardinality-by", "by(tenant_id)")],
+        ),
+        ("group by (id,name,status) (x)", [("high-cardinality-by", "by(id, name)")]),
+        ("count by(status) (openstack_nova_server_status)", []),
+        ('sum by (project_id)(openstack_neutron_port{project_id="abc"})', []),
+        (
+            'sum by (project_id)(openstack_neutron_port{project_id=~"abc"})',
+            [("high-cardinality-by", "by(project_id)")],
+        ),
+        ("count without (uuid) (openstack_cinder_agent_state)", []),
+    ],
+)
+def test_check(expr, expected):
+    """Test the expensive patterns found in an expression."""
+    assert check(expr) == [Violation(*violation) for violation in expected]
+
+
+def test_check_recording_rule():
+    """Test only the regex matchers of a recording rule are reported."""
+    expr = 'count by(tenant_id) (a{az=~".*"}) * on(tenant_id) group_left() b'
+
+    assert check(expr, recording=True) == [Violation("unbounded-regex", 'az=~".*"')]
+
+
+def test_score():
+    """Test the cost of an expression is the sum of the weights of its violations."""
+    violations = check('sum by(tenant_id) (a{az=~".*"}) * on(tenant_id) group_left() b')
+    assert score(violations) == 10
+    assert score([]) == 0
+
+
+def test_dashboard_expressions_use_the_all_value_of_the_variables():
+    """Test the dashboard variables are replaced by their "All" value."""
+    exprs = {expression.expr for expression in dashboard_expressions()}
+
+    assert 'sum(openstack_nova_running_vms{aggregates=~".*"})' in exprs
+    assert not any("$aggregate" in expr for expr in exprs)
+
+
+def test_expressions_cover_the_rules_and_nested_panels():
+    """Test the expressions of the rules and of the panels of collapsed rows are checked."""
+    rules = {expression.location for expression in rule_expressions()}
+    panels = {(expression.source, expression.location) for expression in dashboard_expressions()}
+
+    assert {"OpenStackServicesDown", "openstack:service_up"} <= rules
+    assert ("compute.json", "IOPS Read") in panels
+
+
+def test_report_is_ranked_by_cost():
+    """Test the report lists the most expensive expressions first."""
+    found = findings()
+    costs = [score(violations) for _, violations in found]
+    text = report(found)
+
+    assert costs == sorted(costs, reverse=True)
+    assert text.splitlines()[0].startswith(f"  1. [{costs[0]:2d}]")
+    assert text.endswith(f"{len(found)} expressions with violations, total cost {sum(costs)}")
+
+
+def test_no_new_expensive_queries():
+    """Test the dashboards and rules add no expensive pattern to the baseline.
+
+    Prefer a recording rule for the joins and aggregations over many series, and a literal
+    prefix, or a variable without an "All" regex, for the regex matchers.
+    """
+    found = findings()
+    new = violation_counts(found) - load_baseline()
+    assert not new, f"new expensive PromQL patterns: {dict(new)}\n{report(found)}"
+
+
+def test_baseline_has_no_fixed_violations():
+    """Test the baseline is lowered when violations are fixed, so they cannot come back."""
+    fixed = load_baseline() - violation_counts(findings())
+    assert not fixed, f"fixed violations still in promql_cost_baseline.yaml: {dict(fixed)}"
@@ -0,0 +1,298 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import math
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+import yaml
+from rule_engine import (
+    Engine,
+    RuleEvaluator,
+    expand_template,
+    expand_values,
+    format_value,
+    load_rule_groups,
+    parse,
+    parse_duration,
+    parse_series,
+    run_test_file,
+)
+
+RULES_DIR = Path(__file__).parents[2] / "src" / "prometheus_alert_rules"
+RULE_TESTS = Path(__file__).parent / "alert_rules_test.yaml"
+
+
+@pytest.fixture
+def engine():
+    """Return an engine with a few series, sampled every minute for 10 minutes."""
+    engine = Engine()
+    engine.load('up{job="a", instance="1"}', "1x10", 60)
+    engine.load('up{job="a", instance="2"}', "0x10", 60)
+    engine.load('up{job="b", instance="1"}', "1 1 _x8", 60)
+    engine.load('meta{instance="1", zone="z1"}', "1x10", 60)
+    engine.load('meta{instance="2", zone="z2"}', "1x10", 60)
+    engine.load('requests{instance="1"}', "0+10x10", 60)
+    return engine
+
+
+def query(engine, expr, timestamp=600):
+    """Return the values of the samples of an expression, by labels."""
+    return {sample.labels: sample.value for sample in engine.query(expr, timestamp)}
+
+
+def test_alert_rules():
+    """Test the alert and recording rules against the cases of alert_rules_test.yaml."""
+    failures = run_test_file(RULE_TESTS)
+    assert not failures, "\n".join(failures)
+
+
+def test_alert_rules_are_tested():
+    """Test every alert rule is expected to fire in at least one case."""
+    tested = {
+        alert_test["alertname"]
+        for test in yaml.safe_load(RULE_TESTS.read_text())["tests"]
+        for alert_test in test.get("alert_rule_test", [])
+        if alert_test.get("exp_alerts")
+    }
+    groups = load_rule_groups(sorted(RULES_DIR.glob("*.yaml")))
+    alerts = {rule.name for group in groups for rule in group.rules if not rule.recording}
+
+    assert alerts - tested == set()
+
+
+@pytest.mark.skipif(not shutil.which("promtool"), reason="promtool is not installed")
+def test_alert_rules_promtool():  # pragma: no cover
+    """Test the same cases pass with promtool."""
+    subprocess.run(["promtool", "test", "rules", str(RULE_TESTS)], check=True)
+
+
+def test_run_test_file_reports_failures(tmp_path):
+    """Test the unexpected alerts, annotations and samples are reported."""
+    (tmp_path / "rules.yaml").write_text(
+        yaml.safe_dump({
+            "groups": [
+                {
+                    "name": "test",
+                    "rules": [
+                        {"record": "job:up:sum", "expr": "sum by(job) (up)"},
+                        {
+                            "alert": "Down",
+                            "expr": "up == 0",
+                            "for": "2m",
+                            "labels": {"severity": "critical"},
+                            "annotations": {"summary": "{{ $labels.job }} down"},
+                        },
+                    ],
+                }
+            ]
+        })
+    )
+    (tmp_path / "test.yaml").write_text(
+        yaml.safe_dump({
+            "rule_files": ["rules.yaml"],
+            "tests": [
+                {
+                    "input_series": [{"series": 'up{job="a"}', "values": "0x5"}],
+                    "alert_rule_test": [
+                        {"eval_time": "1m", "alertname": "Down", "exp_alerts": []},
+                        {
+                            "eval_time": "2m",
+                            "alertname": "Down",
+                            "exp_alerts": [
+                                {
+                                    "exp_labels": {"severity": "critical", "job": "a"},
+                                    "exp_annotations": {"summary": "b down"},
+                                }
+                            ],
+                        },
+                    ],
+                    "promql_expr_test": [
+                        {
+                            "expr": "job:up:sum",
+                            "eval_time": "1m",
+                            "exp_samples": [{"labels": 'job:up:sum{job="a"}', "value": 1}],
+                        }
+                    ],
+                }
+            ],
+        })
+    )
+
+    failures = run_test_file(tmp_path / "test.yaml")
+
+    assert len(failures) == 2
+    assert failures[0].startswith("test 0: Down at 2m: expected")
+    assert "'a down'" in failures[0]
+    assert failures[1].startswith("test 0: job:up:sum at 1m: expected")
+
+
+def test_rule_groups_interval():
+    """Test the groups are evaluated at their interval, or the default one."""
+    groups = {group.name: group for group in load_rule_groups(sorted(RULES_DIR.glob("*.yaml")))}
+
+    assert groups["NovaCapacityPlanning"].interval == 3600
+    assert groups["NovaProjectCapacity"].interval == 60
+    assert groups["OpenStackServices"].interval == 60
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("1x3", [1, 1, 1, 1]),
+        ("0+10x2 -1", [0, 10, 20, -1]),
+        ("5-1.5x2", [5, 3.5, 2]),
+        ("_x2 1 stale", [None, None, None, 1, None]),
+        ("1e3", [1000]),
+    ],
+)
+def test_expand_values(text, expected):
+    """Test the expanding notation of promtool."""
+    assert expand_values(text) == expected
+
+
+@pytest.mark.parametrize("text", ["1x", "a", "1++1x2"])
+def test_expand_values_invalid(text):
+    """Test an invalid notation raises ValueError."""
+    with pytest.raises(ValueError):
+        expand_values(text)
+
+
+@pytest.mark.parametrize(
+    "text,expected", [("5m", 300), ("1h30m", 5400), ("100ms", 0.1), ("1d", 86400)]
+)
+def test_parse_duration(text, expected):
+    """Test the Prometheus durations are converted to seconds."""
+    assert parse_duration(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "5", "5m1", "1x"])
+def test_parse_duration_invalid(text):
+    """Test an invalid duration raises ValueError."""
+    with pytest.raises(ValueError):
+        parse_duration(text)
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [(1.0, "1"), (0.5, "0.5"), (-3.0, "-3"), (math.inf, "+Inf"), (math.nan, "NaN")],
+)
+def test_format_value(value, expected):
+    """Test the values are formatted as the Go templates of Prometheus do."""
+    assert format_value(value) == expected
+
+
+def test_expand_template():
+    """Test the labels and value of an alert are expanded."""
+    labels = (("__name__", "up"), ("job", "a"))
+
+    assert (
+        expand_template(
+            "{{ $labels.job }} {{$labels.missing}} {{ $value }} {{ $labels }}", labels, 2.0
+        )
+        == "a <no value> 2 map[__name__:up job:a]"
+    )
+    with pytest.raises(ValueError, match="unsupported template"):
+        expand_template("{{ $labels.job | toUpper }}", labels, 2.0)
+
+
+@pytest.mark.parametrize(
+    "expr,expected",
+    [
+        ('up{job="a"}', {'up{instance="1",job="a"}': 1, 'up{instance="2",job="a"}': 0}),
+        ('up{job=~"a|b", instance!="2"}', {'up{instance="1",job="a"}': 1}),
+        ("sum by(job) (up)", {'{job="a"}': 1}),
+        ("count without(instance) (up)", {'{job="a"}': 2}),
+        ("sum(up) by (job) > bool 0", {'{job="a"}': 1}),
+        ("topk(1, up)", {'up{instance="1",job="a"}': 1}),
+        ('absent(up{job="c"})', {'{job="c"}': 1}),
+        ('absent(up{job="a"})', {}),
+        ("absent_over_time(up[1m])", {}),
+        ("max_over_time(requests[2m])", {'{instance="1"}': 100}),
+        ("up == 0", {'up{instance="2",job="a"}': 0}),
+        ("-up + 1 == 1", {'{instance="2",job="a"}': 1}),
+        (
+            "up * on(instance) group_left(zone) meta",
+            {
+                '{instance="1",job="a",zone="z1"}': 1,
+                '{instance="2",job="a",zone="z2"}': 0,
+            },
+        ),
+        (
+            "meta * on(instance) group_right() sum by(instance) (up)",
+            {
+                '{instance="1"}': 1,
+                '{instance="2"}': 0,
+            },
+        ),
+        ('up and on(instance) meta{zone="z2"}', {'up{instance="2",job="a"}': 0}),
+        ('up unless on(instance) meta{zone="z1"}', {'up{instance="2",job="a"}': 0}),
+        (
+            'label_replace(meta, "az", "$1-a", "zone", "(z.)")',
+            {
+                'meta{az="z1-a",instance="1",zone="z1"}': 1,
+                'meta{az="z2-a",instance="2",zone="z2"}': 1,
+            },
+        ),
+        ("clamp_max(requests, 20) + scalar(vector(2 ^ 2))", {'{instance="1"}': 24}),
+    ],
+)
+def test_query(engine, expr, expected):
+    """Test the evaluation of the expressions, with the labels of Prometheus."""
+    assert query(engine, expr) == {
+        parse_series(series): value for series, value in expected.items()
+    }
+
+
+def test_lookback(engine):
+    """Test the samples older than 5 minutes are not selected."""
+    assert set(query(engine, "up", 360)) == set(query(engine, 'up{job="a"}', 360))
+    assert len(query(engine, "up", 300)) == 3
+
+
+@pytest.mark.parametrize(
+    "expr,match",
+    [
+        ("up * on() group_left() meta", "duplicate series"),
+        ("up * on(instance) meta", "multiple matches"),
+        ("up offset 5m", "unsupported modifier"),
+        ("predict_linear(up[5m], 60)", "unsupported function"),
+        ("up +", "unexpected"),
+        ("sum(up) )", "unexpected"),
+        ("1 > 0", "bool modifier"),
+        ("1 and up", "not defined"),
+    ],
+)
+def test_query_unsupported(engine, expr, match):
+    """Test the unsupported or invalid expressions raise ValueError."""
+    with pytest.raises(ValueError, match=match):
+        engine.query(expr, 300)
+
+
+def test_rule_evaluator_for_duration(tmp_path):
+    """Test an alert fires once it has been active for its `for` duration."""
+    rules = tmp_path / "rules.yaml"
+    rules.write_text(
+        yaml.safe_dump({
+            "groups": [{"name": "g", "rules": [{"alert": "A", "expr": "up == 0", "for": "2m"}]}]
+        })
+    )
+    engine = Engine()
+    engine.load('up{job="a"}', "1 0x4", 60)
+    evaluator = RuleEvaluator(engine, load_rule_groups([rules]))
+
+    firing = []
+    for minute in range(5):
+        evaluator.evaluate(minute * 60)
+        firing.append(len(evaluator.firing("A", minute * 60)))
+
+    assert firing == [0, 0, 0, 1, 1]
+    assert evaluator.firing("A", 240)[0].labels == (("alertname", "A"), ("job", "a"))
+
+
+def test_parse_tree():
+    """Test the precedence and associativity of the operators."""
+    assert parse("1 + 2 * 3 ^ 2 ^ 0.5") == parse("1 + (2 * (3 ^ (2 ^ 0.5)))")
+    assert parse("1 - 2 - 3") == parse("(1 - 2) - 3")
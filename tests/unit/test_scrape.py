@@ -0,0 +1,197 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import http.client
+import http.server
+import io
+import threading
+
+import pytest
+
+import scrape
+
+METRICS = [
+    b"# HELP openstack_nova_up up\n",
+    b"# TYPE openstack_nova_up gauge\n",
+    b"openstack_nova_up 1\n",
+    b'openstack_neutron_up{region="RegionOne"} 0\n',
+    b"\n",
+    b'openstack_nova_server_status{id="1"} 0\n',
+]
+
+
+@pytest.fixture()
+def mock_urlopen(mocker):
+    """Mock the exporter response, which is read line by line."""
+    mock_urlopen = mocker.patch("scrape.urllib.request.urlopen")
+    mock_urlopen.return_value.__enter__.return_value = io.BytesIO(b"".join(METRICS))
+    return mock_urlopen
+
+
+def test_probe(mock_urlopen, mocker):
+    """Test the probe measures the scrape and reads the up metrics."""
+    mocker.patch(
+        "scrape.time.monotonic", side_effect=[10.0, 10.1, 10.1, 10.1, 10.2, 10.2, 10.2, 12.5]
+    )
+
+    result = scrape.probe(9180, 30)
+
+    mock_urlopen.assert_called_once_with("http://localhost:9180/metrics", timeout=30)
+    assert result["latency"] == 2.5
+    assert result["bytes"] == sum(len(line) for line in METRICS)
+    assert result["series"] == 3
+    assert result["up"] == {"nova": 1.0, "neutron": 0.0}
+    assert result["error"] == ""
+
+
+def test_probe_timeout(mock_urlopen, mocker):
+    """Test the scrape is given up once it takes longer than the timeout in total."""
+    mocker.patch("scrape.time.monotonic", side_effect=[10.0, 10.1, 50.0, 50.0])
+
+    result = scrape.probe(9180, 30)
+
+    assert result["error"] == "scrape not complete after 30s"
+    assert result["series"] == 0
+    assert result["latency"] == 40.0
+
+
+@pytest.mark.parametrize(
+    "error, message",
+    [
+        (ConnectionRefusedError(111, "Connection refused"), "[Errno 111] Connection refused"),
+        (http.client.RemoteDisconnected(), "RemoteDisconnected"),
+    ],
+)
+def test_probe_error(error, message, mocker):
+    """Test a failed scrape is recorded with its error."""
+    mocker.patch("scrape.urllib.request.urlopen", side_effect=error)
+    result = scrape.probe(9180, 30)
+    assert result["error"] == message
+    assert result["series"] == 0
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """Serve a fixed metrics page."""
+
+    def do_GET(self):  # noqa: N802
+        body = b"".join(METRICS)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def metrics_server():
+    """Run an HTTP server serving metrics on an ephemeral port of localhost."""
+    server = http.server.ThreadingHTTPServer(("localhost", 0), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_benchmark(metrics_server):
+    """Test the benchmark scrapes the endpoint concurrently until the end of the duration."""
+    results = scrape.benchmark(metrics_server, concurrency=4, duration=0.3, timeout=5)
+
+    assert results["requests"] >= 4
+    assert results["errors"] == 0
+    assert results["throughput"] > 0
+    assert 0 < results["latency-p50"] <= results["latency-p95"] <= results["latency-p99"]
+    size = sum(len(line) for line in METRICS)
+    assert results["size-min"] == results["size-p50"] == results["size-max"] == size
+    assert "last-error" not in results
+
+
+def test_benchmark_errors(mocker):
+    """Test the failed scrapes are counted apart from the distributions."""
+    mocker.patch("scrape.urllib.request.urlopen", side_effect=ConnectionRefusedError("refused"))
+    results = scrape.benchmark(9180, concurrency=2, duration=0.05, timeout=5)
+
+    assert results["requests"] == results["errors"] > 0
+    assert results["throughput"] == 0
+    assert results["latency-p99"] == 0
+    assert results["size-max"] == 0
+    assert results["last-error"] == "refused"
+
+
+@pytest.mark.parametrize(
+    "values, percent, expected",
+    [
+        ([], 50, 0.0),
+        ([3.0], 99, 3.0),
+        ([4.0, 1.0, 3.0, 2.0], 50, 2.0),
+        ([4.0, 1.0, 3.0, 2.0], 95, 4.0),
+        (list(range(1, 101)), 95, 95),
+        (list(range(1, 101)), 0, 1),
+    ],
+)
+def test_percentile(values, percent, expected):
+    """Test the nearest-rank percentile."""
+    assert scrape.percentile(values, percent) == expected
+
+
+CARDINALITY_METRICS = [
+    b"# HELP openstack_neutron_port port\n",
+    b"# TYPE openstack_neutron_port gauge\n",
+    b'openstack_neutron_port{device_owner="compute:nova",mac_address="fa:16:3e:00:00:01"} 1\n',
+    b'openstack_neutron_port{device_owner="compute:nova",mac_address="fa:16:3e:00:00:02"} 1\n',
+    b'openstack_neutron_port{device_owner="network:dhcp",mac_address="fa:16:3e:00:00:03"} 1\n',
+    b"# TYPE openstack_request_duration_seconds histogram\n",
+    b'openstack_request_duration_seconds_bucket{le="0.5"} 1\n',
+    b'openstack_request_duration_seconds_bucket{le="+Inf"} 2\n',
+    b"openstack_request_duration_seconds_sum 1.5\n",
+    b"openstack_request_duration_seconds_count 2\n",
+    b'openstack_nova_server_status{name="a \\"quoted\\", name"} 0\n',
+    b"openstack_placement_count 3\n",
+    b"\n",
+]
+
+
+def test_cardinality(mock_urlopen):
+    """Test the series are counted per family and per label value."""
+    mock_urlopen.return_value.__enter__.return_value = io.BytesIO(b"".join(CARDINALITY_METRICS))
+
+    results = scrape.cardinality(9180, 30, top=2)
+
+    mock_urlopen.assert_called_once_with("http://localhost:9180/metrics", timeout=30)
+    assert results == {
+        "bytes": sum(len(line) for line in CARDINALITY_METRICS),
+        "series": 9,
+        "families": 4,
+        "labels": 4,
+        "top-families": "openstack_request_duration_seconds 4\nopenstack_neutron_port 3",
+        "top-labels": (
+            "mac_address 3 values "
+            "(fa:16:3e:00:00:01=1, fa:16:3e:00:00:02=1, fa:16:3e:00:00:03=1)\n"
+            "device_owner 2 values (compute:nova=2, network:dhcp=1)"
+        ),
+    }
+
+
+def test_cardinality_label_values_capped(mock_urlopen, mocker):
+    """Test the values counted per label are capped, the other series counted as overflow."""
+    mocker.patch("scrape.MAX_LABEL_VALUES", 2)
+    mock_urlopen.return_value.__enter__.return_value = io.BytesIO(b"".join(CARDINALITY_METRICS))
+
+    results = scrape.cardinality(9180, 30, top=2)
+
+    assert results["series"] == 9
+    assert results["top-labels"] == (
+        "mac_address over 2 values "
+        "(fa:16:3e:00:00:01=1, fa:16:3e:00:00:02=1, 1 series with other values)\n"
+        "device_owner 2 values (compute:nova=2, network:dhcp=1)"
+    )
+
+
+def test_cardinality_timeout(mock_urlopen, mocker):
+    """Test the scrape is given up once it takes longer than the timeout in total."""
+    mocker.patch("scrape.time.monotonic", side_effect=[10.0, 10.1, 50.0])
+
+    with pytest.raises(TimeoutError, match="scrape not complete after 30s"):
+        scrape.cardinality(9180, 30, top=10)
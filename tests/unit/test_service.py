@@ -1,6 +1,7 @@
 # Copyright 2024 Canonical Ltd.
 # See LICENSE file for licensing details.
 
+import io
 from unittest import mock
 
 import pytest
@@ -19,57 +20,154 @@ class TestSnapService:
         mock_client.set.assert_called_with(config, typed=True)
 
 
+def installed_snap(name, channel="latest/stable", revision="10"):
+    """Return a mock of a snap installed on the host."""
+    installed = mock.Mock(spec_set=["name", "channel", "revision"])
+    # name is an argument of the Mock constructor, so it is set afterwards
+    installed.name = name
+    installed.channel = channel
+    installed.revision = revision
+    return installed
+
+
 @mock.patch("service.log_ssdlc_system_event")
 @mock.patch("service.remove_upstream_snap")
 @mock.patch("service.remove_snap_as_resource")
-@mock.patch("service.workaround_bug_268")
+@mock.patch("service.get_installed_snaps", return_value={})
 @mock.patch("service.snap")
 def test_snap_install_or_refresh_with_resource(
-    mock_snap, mock_workaround, mock_remove_resource, mock_remove_upstream, mock_ssdlc
+    mock_snap, _, mock_remove_resource, mock_remove_upstream, mock_ssdlc
 ):
     """Test snap installation with resource."""
     service.snap_install_or_refresh("my-resource", "latest/stable")
-    mock_remove_upstream.assert_called_once()
+    mock_remove_upstream.assert_not_called()
     mock_snap.install_local.assert_called_once_with("my-resource", dangerous=True)
-    mock_workaround.assert_called_once()
     mock_remove_resource.assert_not_called()
-    mock_ssdlc.assert_called_once_with(service.SSDLCSysEvent.STARTUP)
+    mock_ssdlc.assert_called_once_with(
+        service.SSDLCSysEvent.STARTUP, duration=mock.ANY, cause="snap-install"
+    )
+
+
+@pytest.mark.parametrize("present, expect_install", [(True, False), (False, True)])
+@mock.patch("service.log_ssdlc_system_event")
+@mock.patch("service.remove_upstream_snap")
+@mock.patch("service.remove_snap_as_resource")
+@mock.patch("service.get_installed_snaps")
+@mock.patch("service.snap")
+def test_snap_install_or_refresh_resource_installed(
+    mock_snap,
+    mock_installed,
+    mock_remove_resource,
+    mock_remove_upstream,
+    mock_ssdlc,
+    present,
+    expect_install,
+):
+    """Test snap installation from an unchanged resource is skipped if the snap is present."""
+    mock_installed.return_value = (
+        {service.SNAP_NAME: installed_snap(service.SNAP_NAME, revision="x1")} if present else {}
+    )
+    service.snap_install_or_refresh("my-resource", "latest/stable", resource_installed=True)
+    assert mock_snap.install_local.called is expect_install
+    assert mock_ssdlc.called is expect_install
+    mock_remove_resource.assert_not_called()
+    mock_snap.add.assert_not_called()
 
 
 @mock.patch("service.log_ssdlc_system_event")
 @mock.patch("service.remove_upstream_snap")
 @mock.patch("service.remove_snap_as_resource")
-@mock.patch("service.workaround_bug_268")
+@mock.patch("service.get_installed_snaps")
 @mock.patch("service.snap")
 def test_snap_install_or_refresh_snap_store(
-    mock_snap, mock_workaround, mock_remove_resource, mock_remove_upstream, mock_ssdlc
+    mock_snap, mock_installed, mock_remove_resource, mock_remove_upstream, mock_ssdlc
 ):
-    """Test snap installation using the snap store."""
+    """Test snap installation using the snap store, removing the upstream snap."""
+    mock_installed.return_value = {service.UPSTREAM_SNAP: installed_snap(service.UPSTREAM_SNAP)}
     service.snap_install_or_refresh("", "my-channel")
     mock_remove_upstream.assert_called_once()
     mock_snap.install_local.assert_not_called()
-    mock_snap.add.assert_called_once_with(service.SNAP_NAME, channel="my-channel")
-    mock_workaround.assert_called_once()
+    mock_snap.add.assert_called_once_with(
+        service.SNAP_NAME, channel="my-channel", revision=None, cohort=""
+    )
     mock_remove_resource.assert_called_once()
-    mock_ssdlc.assert_called_once_with(service.SSDLCSysEvent.STARTUP)
+    mock_ssdlc.assert_called_once_with(
+        service.SSDLCSysEvent.STARTUP, duration=mock.ANY, cause="snap-install"
+    )
 
 
+@pytest.mark.parametrize(
+    "channel, revision, pinned, refresh, expect_add",
+    [
+        # already the desired snap: no-op
+        ("my-channel", "10", "", False, False),
+        ("my-channel", "42", "42", False, False),
+        # another channel, revision, a local install, or a refresh asked for
+        ("latest/stable", "10", "", False, True),
+        ("my-channel", "10", "42", False, True),
+        ("my-channel", "x1", "", False, True),
+        ("my-channel", "10", "", True, True),
+    ],
+)
 @mock.patch("service.log_ssdlc_system_event")
 @mock.patch("service.remove_upstream_snap")
 @mock.patch("service.remove_snap_as_resource")
-@mock.patch("service.workaround_bug_268")
+@mock.patch("service.get_installed_snaps")
+@mock.patch("service.snap")
+def test_snap_install_or_refresh_installed(
+    mock_snap,
+    mock_installed,
+    mock_remove_resource,
+    mock_remove_upstream,
+    mock_ssdlc,
+    channel,
+    revision,
+    pinned,
+    refresh,
+    expect_add,
+):
+    """Test the snap from the store is only installed or refreshed when needed."""
+    mock_installed.return_value = {
+        service.SNAP_NAME: installed_snap(service.SNAP_NAME, channel, revision)
+    }
+    service.snap_install_or_refresh(
+        "", "my-channel", revision=pinned, cohort="cohort-key", refresh=refresh
+    )
+    mock_remove_upstream.assert_not_called()
+    assert mock_snap.add.called is expect_add
+    assert mock_remove_resource.called is expect_add
+    assert mock_ssdlc.called is expect_add
+    if expect_add:
+        mock_snap.add.assert_called_once_with(
+            service.SNAP_NAME, channel="my-channel", revision=pinned or None, cohort="cohort-key"
+        )
+
+
+@mock.patch("service.log_ssdlc_system_event")
+@mock.patch("service.remove_upstream_snap")
+@mock.patch("service.remove_snap_as_resource")
+@mock.patch("service.get_installed_snaps", return_value={})
 @mock.patch("service.snap.add")
 def test_snap_install_or_refresh_exception_raises(
-    mock_snap, mock_workaround, mock_remove_resource, mock_remove_upstream, mock_ssdlc
+    mock_snap, _, mock_remove_resource, mock_remove_upstream, mock_ssdlc
 ):
     """Test that when an exception happens, it will raise an exception to the caller."""
     mock_snap.side_effect = service.snap.SnapError("My Error")
     with pytest.raises(service.snap.SnapError):
         service.snap_install_or_refresh("", "my-channel")
-    mock_workaround.assert_not_called()
     mock_ssdlc.assert_not_called()
 
 
+def test_get_installed_snaps(mocker):
+    """Test only the installed snaps are returned, without looking up the others."""
+    installed = installed_snap(service.SNAP_NAME)
+    mock_cache = mocker.patch("service.snap.SnapCache")
+    # snaps known from the store catalog but not installed are None in the cache
+    mock_cache.return_value.__iter__.return_value = [installed, None]
+    assert service.get_installed_snaps() == {service.SNAP_NAME: installed}
+    mock_cache.return_value.__getitem__.assert_not_called()
+
+
 @mock.patch("service.snap")
 def test_remove_upstream_snap(mock_snap):
     """Test remove upstream snap function."""
@@ -187,12 +285,23 @@ def test_restart_and_enable(mock_ssdlc, mocker):
     assert manager.mock_calls == expected_calls
 
     # Check SSDLC RESTART event was logged
-    mock_ssdlc.assert_called_once_with(service.SSDLCSysEvent.RESTART)
+    mock_ssdlc.assert_called_once_with(service.SSDLCSysEvent.RESTART, duration=mock.ANY, cause="")
+
+
+@mock.patch("service.log_ssdlc_system_event")
+@mock.patch("service.time.monotonic", side_effect=[10.0, 12.5])
+def test_restart_and_enable_duration_and_cause(_, mock_ssdlc, mocker):
+    """Test the restart event carries how long the restart took and its cause."""
+    snap_service = service.SnapService(mocker.Mock())
+    snap_service.restart_and_enable(cause="credentials")
+    mock_ssdlc.assert_called_once_with(
+        service.SSDLCSysEvent.RESTART, duration=2.5, cause="credentials"
+    )
 
 
 @mock.patch("service.log_ssdlc_system_event")
 def test_restart_and_enable_crash(mock_ssdlc, mocker):
-    """Test restart_and_enable logs CRASH and re-raises on failure."""
+    """Test restart_and_enable logs CRASH only and re-raises on failure."""
     mock_snap_client = mocker.Mock()
     mock_snap_client.restart.side_effect = Exception("snap restart failed")
     snap_service = service.SnapService(mock_snap_client)
@@ -200,8 +309,9 @@ def test_restart_and_enable_crash(mock_ssdlc, mocker):
     with pytest.raises(Exception, match="snap restart failed"):
         snap_service.restart_and_enable()
 
-    mock_ssdlc.assert_any_call(service.SSDLCSysEvent.RESTART)
-    mock_ssdlc.assert_any_call(service.SSDLCSysEvent.CRASH, msg="snap restart failed")
+    mock_ssdlc.assert_called_once_with(
+        service.SSDLCSysEvent.CRASH, msg="snap restart failed", duration=mock.ANY, cause=""
+    )
 
 
 @mock.patch("service.log_ssdlc_system_event")
@@ -229,7 +339,7 @@ def test_stop(mock_ssdlc, mocker):
     mock_snap_client.start.assert_not_called()
 
     # Check SSDLC SHUTDOWN event was logged
-    mock_ssdlc.assert_called_once_with(service.SSDLCSysEvent.SHUTDOWN)
+    mock_ssdlc.assert_called_once_with(service.SSDLCSysEvent.SHUTDOWN, duration=mock.ANY, cause="")
 
 
 @pytest.mark.parametrize(
@@ -270,6 +380,139 @@ def test_is_active(services_dict, expected_result, mocker):
     assert snap_service.is_active() is expected_result
 
 
+def test_revision_property(mocker):
+    """Test the revision property reflects the snap client's revision."""
+    mock_snap_client = mocker.Mock()
+    mock_snap_client.revision = "42"
+    assert service.SnapService(mock_snap_client).revision == "42"
+
+
+@pytest.mark.parametrize(
+    "installed, pinned, expected",
+    [
+        (installed_snap(service.SNAP_NAME), "", False),
+        (installed_snap(service.SNAP_NAME), "10", False),
+        (installed_snap(service.SNAP_NAME), "11", True),
+        (installed_snap(service.SNAP_NAME, channel="latest/edge"), "", True),
+        (installed_snap(service.SNAP_NAME, revision="x1"), "", True),
+        # a snap not installed yet is installed, not refreshed
+        (None, "", False),
+    ],
+)
+def test_refresh_required(installed, pinned, expected, mocker):
+    """Test a refresh is required when the installed snap differs from the desired one."""
+    mocker.patch(
+        "service.get_installed_snaps",
+        return_value={service.SNAP_NAME: installed} if installed else {},
+    )
+    assert service.refresh_required("latest/stable", pinned) is expected
+
+
+@pytest.mark.parametrize(
+    "channel, expected",
+    [
+        ("latest/stable", "latest/stable"),
+        ("stable", "latest/stable"),
+        ("edge", "latest/edge"),
+        ("latest", "latest/stable"),
+        ("2.0", "2.0/stable"),
+        ("2.0/candidate", "2.0/candidate"),
+        ("edge/fix-123", "latest/edge/fix-123"),
+    ],
+)
+def test_full_channel(channel, expected):
+    """Test the channel is completed with the default track and risk of snapd."""
+    assert service.full_channel(channel) == expected
+
+
+@pytest.mark.parametrize("channel", ["latest/stable", "latest", "stable"])
+def test_snap_matches_short_channel(channel):
+    """Test a channel without track or risk matches the full channel reported by snapd."""
+    installed = installed_snap(service.SNAP_NAME, channel="latest/stable")
+    assert service.snap_matches(installed, channel) is True
+    assert service.snap_matches(installed, "edge") is False
+
+
+@pytest.mark.parametrize(
+    "status, body, expected",
+    [
+        (200, b"# HELP openstack_up up\n# TYPE openstack_up gauge\nopenstack_up 1\n", True),
+        (200, b"# HELP openstack_up up\n# TYPE openstack_up gauge\n", False),
+        (200, b"", False),
+        (503, b"openstack_up 1\n", False),
+    ],
+)
+def test_exporter_serving(status, body, expected, mocker):
+    """Test the exporter serves metrics only once its response has a sample."""
+    mock_urlopen = mocker.patch("service.urllib.request.urlopen")
+    response = io.BytesIO(body)
+    response.status = status
+    mock_urlopen.return_value.__enter__.return_value = response
+    assert service.exporter_serving(9180) is expected
+    mock_urlopen.assert_called_once_with("http://localhost:9180/metrics", timeout=5.0)
+
+
+def test_exporter_serving_unreachable(mocker):
+    """Test the exporter does not serve metrics while it is down."""
+    mocker.patch("service.urllib.request.urlopen", side_effect=ConnectionRefusedError)
+    assert service.exporter_serving(9180) is False
+
+
+@pytest.mark.parametrize(
+    "serving, expected, sleeps",
+    [
+        ([True], True, 0),
+        ([False, False, True], True, 2),
+        ([False, False, False, False], False, 2),
+    ],
+)
+def test_wait_exporter_serving(serving, expected, sleeps, mocker):
+    """Test waiting for the exporter gives up at the timeout."""
+    mocker.patch("service.exporter_serving", side_effect=serving)
+    mock_sleep = mocker.patch("service.time.sleep")
+    mocker.patch("service.time.monotonic", side_effect=[0.0, 0.0, 5.0, 10.0])
+    assert service.wait_exporter_serving(9180, timeout=12, interval=5) is expected
+    assert mock_sleep.call_count == sleeps
+
+
+@pytest.mark.parametrize("hold", [True, False])
+def test_hold_refresh(hold, mocker):
+    """Test the refreshes of the snap are held or released."""
+    mock_snap_client = mocker.Mock()
+    service.SnapService(mock_snap_client).hold_refresh(hold)
+    assert mock_snap_client.hold.called is hold
+    assert mock_snap_client.unhold.called is not hold
+
+
+@pytest.mark.parametrize(
+    "returncode, stdout, expected",
+    [
+        (
+            0,
+            "Name                        Version  Rev  Size  Publisher  Notes\n"
+            "charmed-openstack-exporter  1.7.0    42   12MB  canonical  -\n",
+            True,
+        ),
+        (
+            0,
+            "Name    Version   Rev   Size  Publisher  Notes\n"
+            "core22  20240111  1122  77MB  canonical  base\n",
+            False,
+        ),
+        (0, "", False),
+        (1, "", False),
+    ],
+)
+def test_refresh_pending(returncode, stdout, expected, mocker):
+    """Test a pending refresh is read from snap refresh --list."""
+    mock_run = mocker.patch("service.subprocess.run")
+    mock_run.return_value = mocker.Mock(returncode=returncode, stdout=stdout, stderr="error")
+    assert service.refresh_pending(service.SNAP_NAME) is expected
+    mock_run.assert_called_once_with(
+        ["snap", "refresh", "--list"], capture_output=True, text=True, check=False
+    )
+
+
 def test_present_property(mocker):
     """Test the present property correctly reflects the snap client's present property."""
     mock_snap_client = mocker.Mock()
@@ -286,27 +529,102 @@ def test_present_property(mocker):
     assert not hasattr(mock_snap_client.present, "called")
 
 
-def test_workaround_bug_268(mocker):
-    """Test that the bug 268 workaround creates the correct systemd override."""
-    # Mock the file system operations
-    mock_makedirs = mocker.patch("os.makedirs")
-    mock_open = mocker.patch("builtins.open", mocker.mock_open())
-    mock_logger = mocker.patch("service.logger.info")
+@pytest.fixture()
+def drop_in_paths(tmp_path, mocker):
+    """Point the exporter service drop-ins at a temporary directory."""
+    drop_in_dir = tmp_path / "snap.charmed-openstack-exporter.service.service.d"
+    mocker.patch("service.DROP_IN_DIR", drop_in_dir)
+    mocker.patch("service.DROP_IN_FILE", drop_in_dir / "charm.conf")
+    mocker.patch("service.LEGACY_DROP_IN_FILE", drop_in_dir / "bug_268.conf")
+    return drop_in_dir
+
+
+def test_render_drop_in():
+    """Test the environment and the directives are rendered in a stable order."""
+    content = service.render_drop_in(
+        {"GOMAXPROCS": "2", "GOMEMLIMIT": "1GiB"}, {"Nice": "10", "CPUQuota": "150%"}
+    )
+    assert content == (
+        "[Service]\n"
+        'Environment="GOMAXPROCS=2"\n'
+        'Environment="GOMEMLIMIT=1GiB"\n'
+        "CPUQuota=150%\n"
+        "Nice=10\n"
+    )
+
+
+def test_write_drop_in(drop_in_paths, mocker):
+    """Test the drop-in is written and systemd reloaded only when the content changes."""
+    mock_run = mocker.patch("service.subprocess.run")
+
+    assert service.write_drop_in("[Service]\n") is True
+    assert (drop_in_paths / "charm.conf").read_text() == "[Service]\n"
+    mock_run.assert_called_once_with(["systemctl", "daemon-reload"], check=True)
+
+    mock_run.reset_mock()
+    assert service.write_drop_in("[Service]\n") is False
+    mock_run.assert_not_called()
+
+    assert service.write_drop_in("[Service]\nNice=10\n") is True
+    mock_run.assert_called_once_with(["systemctl", "daemon-reload"], check=True)
 
-    service.workaround_bug_268()
 
-    # Check for correct directory creation
-    expected_dir = f"/etc/systemd/system/snap.{service.SNAP_NAME}.service.service.d"
-    mock_makedirs.assert_called_once_with(expected_dir, exist_ok=True)
+def test_write_drop_in_removes_legacy(drop_in_paths, mocker):
+    """Test the drop-in of older charm revisions is removed."""
+    mock_run = mocker.patch("service.subprocess.run")
+    drop_in_paths.mkdir()
+    (drop_in_paths / "bug_268.conf").write_text("legacy")
+    (drop_in_paths / "charm.conf").write_text("[Service]\n")
 
-    # Check the file is opened with the correct path and mode
-    mock_open.assert_called_once_with(f"{expected_dir}/bug_268.conf", "w")
+    assert service.write_drop_in("[Service]\n") is True
+    assert not (drop_in_paths / "bug_268.conf").exists()
+    mock_run.assert_called_once_with(["systemctl", "daemon-reload"], check=True)
 
-    # Check the correct content is written to the file
-    file_handle = mock_open()
-    file_handle.write.assert_called_once_with(
-        "[Service]\nEnvironment=OS_COMPUTE_API_VERSION=2.87\n"
+
+@mock.patch("service.log_ssdlc_system_event")
+@mock.patch("service.subprocess.run")
+def test_schedule_restart(mock_run, mock_ssdlc):
+    """Test a restart is scheduled with a transient systemd timer."""
+    mock_run.return_value.returncode = 3  # timer not active
+
+    assert service.schedule_restart(41.2, cause="credentials") is True
+
+    mock_run.assert_called_with(
+        [
+            "systemd-run",
+            f"--unit={service.RESTART_TIMER_UNIT}",
+            "--on-active=42",
+            "--timer-property=AccuracySec=1s",
+            "--collect",
+            "/usr/bin/snap",
+            "restart",
+            service.SNAP_NAME,
+        ],
+        check=True,
+    )
+    mock_ssdlc.assert_called_once_with(
+        service.SSDLCSysEvent.RESTART_SCHEDULED, msg="in 42s", cause="credentials"
+    )
+
+
+@mock.patch("service.log_ssdlc_system_event")
+@mock.patch("service.subprocess.run")
+def test_schedule_restart_already_scheduled(mock_run, mock_ssdlc):
+    """Test nothing more is scheduled while the timer is pending."""
+    mock_run.return_value.returncode = 0  # timer active
+
+    assert service.schedule_restart(10, cause="credentials") is False
+
+    mock_run.assert_called_once_with(
+        ["systemctl", "is-active", "--quiet", f"{service.RESTART_TIMER_UNIT}.timer"], check=False
     )
+    mock_ssdlc.assert_not_called()
+
 
-    # Check logged message
-    mock_logger.assert_called_once_with("Adding service override to workaround bug 268")
+@mock.patch("service.subprocess.run")
+def test_cancel_scheduled_restart(mock_run):
+    """Test the restart timer is stopped."""
+    service.cancel_scheduled_restart()
+    mock_run.assert_called_once_with(
+        ["systemctl", "stop", f"{service.RESTART_TIMER_UNIT}.timer"], check=False
+    )
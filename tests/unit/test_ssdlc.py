@@ -2,38 +2,52 @@
 # See LICENSE file for licensing details.
 
 import datetime
+import json
+import os
+import subprocess
+import sys
 from unittest import mock
 
 import pytest
 
-from ssdlc import Service, SSDLCSysEvent, log_ssdlc_system_event
+from ssdlc import CORRELATION_ID, Service, SSDLCSysEvent, log_ssdlc_system_event
 
 
 class TestLogSsdlcSystemEvent:
     """Test log_ssdlc_system_event function."""
 
     @pytest.mark.parametrize(
-        "event, expected_event_str, expected_description",
+        "event, expected_event_str, expected_description, expected_level",
         [
             (
                 SSDLCSysEvent.STARTUP,
                 "sys_startup:charmed-openstack-exporter",
                 "openstack-exporter start service charmed-openstack-exporter",
+                "WARN",
             ),
             (
                 SSDLCSysEvent.SHUTDOWN,
                 "sys_shutdown:charmed-openstack-exporter",
                 "openstack-exporter shutdown service charmed-openstack-exporter",
+                "WARN",
             ),
             (
                 SSDLCSysEvent.RESTART,
                 "sys_restart:charmed-openstack-exporter",
                 "openstack-exporter restart service charmed-openstack-exporter",
+                "WARN",
+            ),
+            (
+                SSDLCSysEvent.RESTART_SCHEDULED,
+                "sys_restart_scheduled:charmed-openstack-exporter",
+                "openstack-exporter schedule restart of service charmed-openstack-exporter",
+                "INFO",
             ),
             (
                 SSDLCSysEvent.CRASH,
                 "sys_crash:charmed-openstack-exporter",
                 "openstack-exporter service charmed-openstack-exporter crash",
+                "WARN",
             ),
         ],
     )
@@ -46,6 +60,7 @@ class TestLogSsdlcSystemEvent:
         event,
         expected_event_str,
         expected_description,
+        expected_level,
     ):
         mock_now = mock.MagicMock()
         mock_now.isoformat.return_value = "2025-01-01T12:00:00+00:00"
@@ -57,7 +72,7 @@ class TestLogSsdlcSystemEvent:
         assert logged["datetime"] == "2025-01-01T12:00:00+00:00"
         assert logged["appid"] == "service.charmed-openstack-exporter"
         assert logged["event"] == expected_event_str
-        assert logged["level"] == "WARN"
+        assert logged["level"] == expected_level
         assert logged["description"] == expected_description
 
     @mock.patch("ssdlc.logger")
@@ -103,3 +118,88 @@ class TestLogSsdlcSystemEvent:
         logged_data = mock_logger.warning.call_args[0][0]
         # Verify ISO 8601 format with timezone
         assert logged_data["datetime"] == "2025-01-15T14:30:45+00:00"
+
+    @mock.patch("ssdlc.logger")
+    def test_log_ssdlc_system_event_structured_fields(self, mock_logger, monkeypatch):
+        """Test the event carries the hook, correlation id, duration and cause."""
+        monkeypatch.setenv("JUJU_DISPATCH_PATH", "hooks/credentials-relation-changed")
+
+        log_ssdlc_system_event(SSDLCSysEvent.RESTART, duration=1.23456, cause="credentials")
+
+        logged = mock_logger.warning.call_args[0][0]
+        assert logged["hook"] == "credentials-relation-changed"
+        assert logged["correlation_id"] == CORRELATION_ID
+        assert logged["duration"] == 1.235
+        assert logged["cause"] == "credentials"
+
+    @mock.patch("ssdlc.logger")
+    def test_log_ssdlc_system_event_optional_fields(self, mock_logger):
+        """Test duration and cause are left out when not given."""
+        log_ssdlc_system_event(SSDLCSysEvent.STARTUP)
+
+        logged = mock_logger.warning.call_args[0][0]
+        assert "duration" not in logged
+        assert "cause" not in logged
+
+    def test_log_ssdlc_system_event_json_lines(self, tmp_path, mocker):
+        """Test every event is appended to the log file as a JSON line."""
+        log_file = tmp_path / "logs" / "ssdlc.log"
+        mocker.patch("ssdlc.SSDLC_LOG_FILE", log_file)
+
+        log_ssdlc_system_event(SSDLCSysEvent.RESTART, duration=2.0, cause="snap-refresh")
+        log_ssdlc_system_event(SSDLCSysEvent.SHUTDOWN)
+
+        records = [json.loads(line) for line in log_file.read_text().splitlines()]
+        assert [record["event"] for record in records] == [
+            "sys_restart:charmed-openstack-exporter",
+            "sys_shutdown:charmed-openstack-exporter",
+        ]
+        assert records[0]["duration"] == 2.0
+        assert records[0]["cause"] == "snap-refresh"
+        assert records[0]["correlation_id"] == records[1]["correlation_id"]
+
+    def test_log_ssdlc_system_event_json_lines_rotated(self, tmp_path, mocker):
+        """Test the log file is rotated once it reaches its maximum size."""
+        log_file = tmp_path / "ssdlc.log"
+        mocker.patch("ssdlc.SSDLC_LOG_FILE", log_file)
+        mocker.patch("ssdlc.SSDLC_LOG_MAX_BYTES", 100)
+
+        for _ in range(4):
+            log_ssdlc_system_event(SSDLCSysEvent.STARTUP)
+
+        rotated = tmp_path / "ssdlc.log.1"
+        assert len(log_file.read_text().splitlines()) == 1
+        assert len(rotated.read_text().splitlines()) == 1
+        assert [path.name for path in sorted(tmp_path.iterdir())] == ["ssdlc.log", "ssdlc.log.1"]
+
+    @mock.patch("ssdlc.logger")
+    def test_log_ssdlc_system_event_json_lines_error(self, mock_logger, tmp_path, mocker):
+        """Test a failure to write the log file does not fail the caller."""
+        log_file = tmp_path / "not-a-dir"
+        log_file.write_text("")
+        mocker.patch("ssdlc.SSDLC_LOG_FILE", log_file / "ssdlc.log")
+
+        log_ssdlc_system_event(SSDLCSysEvent.STARTUP)
+
+        mock_logger.warning.assert_called_once()
+        mock_logger.debug.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "context_id, expected_length",
+    [("openstack-exporter/0-update-status-123", 38), ("", 32)],
+)
+def test_correlation_id_from_juju_context(context_id, expected_length):
+    """Test the correlation id is the juju context id of the dispatch when available."""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path), "JUJU_CONTEXT_ID": context_id}
+    result = subprocess.run(
+        [sys.executable, "-c", "import ssdlc; print(ssdlc.CORRELATION_ID)"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    correlation_id = result.stdout.strip()
+    assert len(correlation_id) == expected_length
+    if context_id:
+        assert correlation_id == context_id
@@ -2,7 +2,26 @@
 # See LICENSE file for licensing details.
 import pytest
 
-from validate_config import validate_cache_ttl, validate_port
+from validate_config import (
+    parse_api_microversions,
+    parse_refresh_window,
+    validate_api_microversions,
+    validate_cache_ttl,
+    validate_capacity_rules_interval,
+    validate_cpu_quota,
+    validate_gomaxprocs,
+    validate_gomemlimit,
+    validate_io_scheduling_class,
+    validate_memory_high,
+    validate_nice,
+    validate_port,
+    validate_probe_empty_threshold,
+    validate_probe_latency_threshold,
+    validate_probe_timeout,
+    validate_refresh_window,
+    validate_restart_window,
+    validate_snap_revision,
+)
 
 
 @pytest.mark.parametrize(
@@ -115,3 +134,146 @@ def test_validate_cache_ttl_invalid(cache_ttl):
 
     """
     assert validate_cache_ttl(cache_ttl) is not None
+
+
+@pytest.mark.parametrize("restart_window", [0, 1, 3600])
+def test_validate_restart_window_valid(restart_window):
+    """Test validate restart_window function with valid values."""
+    assert validate_restart_window(restart_window) is None
+
+
+def test_validate_restart_window_invalid():
+    """Test validate restart_window function with a negative value."""
+    assert validate_restart_window(-1) == "Restart_window must be non-negative, got -1"
+
+
+@pytest.mark.parametrize(
+    "validator, value",
+    [
+        (validate_gomaxprocs, 0),
+        (validate_gomaxprocs, 8),
+        (validate_gomemlimit, ""),
+        (validate_gomemlimit, "1073741824"),
+        (validate_gomemlimit, "512MiB"),
+        (validate_cpu_quota, ""),
+        (validate_cpu_quota, "150%"),
+        (validate_memory_high, ""),
+        (validate_memory_high, "2G"),
+        (validate_memory_high, "10%"),
+        (validate_memory_high, "infinity"),
+        (validate_nice, -20),
+        (validate_nice, 19),
+        (validate_io_scheduling_class, ""),
+        (validate_io_scheduling_class, "idle"),
+        (validate_probe_timeout, 1),
+        (validate_probe_timeout, 120),
+        (validate_probe_latency_threshold, 0.0),
+        (validate_probe_latency_threshold, 20.0),
+        (validate_probe_empty_threshold, 0),
+        (validate_probe_empty_threshold, 3),
+        (validate_capacity_rules_interval, "30s"),
+        (validate_capacity_rules_interval, "4m59s999ms"),
+        (validate_capacity_rules_interval, "5m"),
+    ],
+)
+def test_validate_service_tuning_valid(validator, value):
+    """Test the validators of the exporter service tuning with valid values."""
+    assert validator(value) is None
+
+
+@pytest.mark.parametrize(
+    "validator, value",
+    [
+        (validate_gomaxprocs, -1),
+        (validate_gomemlimit, "1GB"),
+        (validate_gomemlimit, "-1"),
+        (validate_cpu_quota, "1.5"),
+        (validate_memory_high, "2GB"),
+        (validate_nice, 20),
+        (validate_nice, -21),
+        (validate_io_scheduling_class, "batch"),
+        (validate_probe_timeout, 0),
+        (validate_probe_timeout, 121),
+        (validate_probe_latency_threshold, -1.0),
+        (validate_probe_empty_threshold, -1),
+        (validate_capacity_rules_interval, ""),
+        (validate_capacity_rules_interval, "0m"),
+        (validate_capacity_rules_interval, "1.5m"),
+        (validate_capacity_rules_interval, "5"),
+        (validate_capacity_rules_interval, "m1"),
+        (validate_capacity_rules_interval, "5m1s"),
+        (validate_capacity_rules_interval, "1h"),
+    ],
+)
+def test_validate_service_tuning_invalid(validator, value):
+    """Test the validators of the exporter service tuning with invalid values."""
+    assert validator(value) is not None
+
+
+def test_parse_api_microversions():
+    """Test api_microversions is parsed into a service to version mapping."""
+    assert parse_api_microversions(" compute=2.87, volume = 3.64,") == {
+        "compute": "2.87",
+        "volume": "3.64",
+    }
+    assert parse_api_microversions("") == {}
+
+
+@pytest.mark.parametrize(
+    "api_microversions",
+    ["", "compute=2.87", "compute=2.1,volume=3.0,placement=1.39,baremetal=1.78"],
+)
+def test_validate_api_microversions_valid(api_microversions):
+    """Test validate api_microversions function with valid values."""
+    assert validate_api_microversions(api_microversions) is None
+
+
+@pytest.mark.parametrize(
+    "api_microversions, error",
+    [
+        ("compute", "Api_microversions is not in a valid format: expected service=version"),
+        ("network=2.0", "Api_microversions service must be one of"),
+        ("compute=2.91", "Api_microversions compute must be between 2.1 and 2.90"),
+        ("compute=3.1", "Api_microversions compute must be between 2.1 and 2.90"),
+        ("volume=latest", "Api_microversions volume must be between 3.0 and 3.67"),
+    ],
+)
+def test_validate_api_microversions_invalid(api_microversions, error):
+    """Test validate api_microversions function with invalid values."""
+    assert validate_api_microversions(api_microversions).startswith(error)
+
+
+def test_parse_refresh_window():
+    """Test snap_refresh_window is parsed into minutes of the day."""
+    assert parse_refresh_window("02:30-04:00") == (150, 240)
+    with pytest.raises(ValueError):
+        parse_refresh_window("2-4")
+
+
+@pytest.mark.parametrize(
+    "refresh_window, error",
+    [
+        ("", None),
+        ("02:00-04:00", None),
+        ("22:00-02:00", None),
+        ("24:00-02:00", "Snap_refresh_window must be in the HH:MM-HH:MM format, got 24:00-02:00"),
+        ("sat,02:00", "Snap_refresh_window must be in the HH:MM-HH:MM format, got sat,02:00"),
+        ("02:00-02:00", "Snap_refresh_window must not be empty, got 02:00-02:00"),
+    ],
+)
+def test_validate_refresh_window(refresh_window, error):
+    """Test validate snap_refresh_window function."""
+    assert validate_refresh_window(refresh_window) == error
+
+
+@pytest.mark.parametrize(
+    "snap_revision, error",
+    [
+        ("", None),
+        ("42", None),
+        ("x1", "Snap_revision must be a store revision number, got x1"),
+    ],
+)
+def test_validate_snap_revision(snap_revision, error):
+    """Test validate snap_revision function."""
+    assert validate_snap_revision(snap_revision) == error